@@ -4,17 +4,33 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from config import config
+from app.replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
 
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, and ON DELETE CASCADE, when asked per connection"""
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    if app.config['PROXY_HOPS']:
+        hops = app.config['PROXY_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
 
     # Initialize extensions
     db.init_app(app)
@@ -34,10 +50,10 @@ def create_app(config_name='default'):
     # Import models
     from app import models
     
-    # User loader for Flask-Login
-    @login_manager.user_loader
-    def load_user(user_id):
-        return db.session.get(models.User, int(user_id))
+    # User loader for Flask-Login, served from the identity cache
+    from app import identity
+    identity.init_app(app)
+    login_manager.user_loader(identity.load_user)
     
     # Register blueprints
     from app.routes import main_bp
@@ -48,6 +64,25 @@ def create_app(config_name='default'):
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp, url_prefix='/admin')
     
+    # Template helpers, static assets and CLI commands
+    from app import activity, assets, passwords, prometheus, query_stats, replica, rollups, slow_queries, storage, throttle, timeseries
+    from app.images import variant_path
+    from app.commands import register_commands
+    
+    app.jinja_env.globals['cover_variant'] = variant_path
+    passwords.init_app(app)
+    prometheus.init_app(app)
+    query_stats.init_app(app)
+    slow_queries.init_app(app)
+    assets.init_app(app)
+    storage.init_app(app)
+    throttle.init_app(app)
+    activity.init_app(app)
+    replica.init_app(app)
+    rollups.init_app(app)
+    timeseries.init_app(app)
+    register_commands(app)
+    
     # Register error handlers
     from flask import render_template
     
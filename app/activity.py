@@ -0,0 +1,151 @@
+"""
+Write-behind buffer for user activity timestamps.
+
+Writing ``last_seen`` on every request, or ``last_login`` inside the login
+transaction, would add a synchronous UPDATE to the hottest paths. Timestamps
+are instead collected in memory, one entry per user, keeping only the latest
+value. A background thread writes them every ACTIVITY_FLUSH_INTERVAL
+seconds, and once more at shutdown. Each flush is a single
+``UPDATE ... SET col = CASE id WHEN ... END`` per chunk of users. The buffer
+holds at most ACTIVITY_BUFFER_SIZE users; activity for further users is
+dropped and counted. Timestamps are best-effort: a crash loses at most one
+interval.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import case, update
+from app import db
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_FIELDS = ('last_login', 'last_seen')
+
+
+class ActivityRecorder:
+    """Coalesces per-user timestamps and flushes them in bulk"""
+
+    def __init__(self, app, interval, max_entries, chunk_size=500):
+        self.app = app
+        self.interval = interval
+        self.max_entries = max_entries
+        self.chunk_size = chunk_size
+        self.buffer = {}
+        self.lock = threading.Lock()
+        self.stats = {'recorded': 0, 'coalesced': 0, 'dropped': 0, 'flushed': 0, 'flushes': 0, 'errors': 0}
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        if interval:
+            # Once per recorder: forked workers inherit the handler along with the recorder
+            atexit.register(self.shutdown)
+
+    def record(self, user_id, field, when=None):
+        """Buffer a timestamp for ``field``, keeping the latest per user"""
+        when = when or datetime.utcnow()
+        with self.lock:
+            self.stats['recorded'] += 1
+            entry = self.buffer.get(user_id)
+            if entry is None:
+                if len(self.buffer) >= self.max_entries:
+                    self.stats['dropped'] += 1
+                    return False
+                entry = self.buffer[user_id] = {}
+            else:
+                self.stats['coalesced'] += 1
+            if entry.get(field) is None or entry[field] < when:
+                entry[field] = when
+        self._ensure_thread()
+        return True
+
+    def _ensure_thread(self):
+        # Started lazily and per process, so forked workers each get their own
+        if not self.interval or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self.lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+    def flush(self):
+        """Write buffered timestamps; returns the number of users updated"""
+        with self.lock:
+            pending, self.buffer = self.buffer, {}
+        if not pending:
+            return 0
+
+        from app.models import User
+
+        try:
+            with self.app.app_context():
+                ids = list(pending)
+                for start in range(0, len(ids), self.chunk_size):
+                    chunk = ids[start:start + self.chunk_size]
+                    values = {}
+                    for field in ACTIVITY_FIELDS:
+                        whens = {user_id: pending[user_id][field] for user_id in chunk if field in pending[user_id]}
+                        if whens:
+                            column = getattr(User, field)
+                            values[field] = case(whens, value=User.id, else_=column)
+                    db.session.execute(
+                        update(User).where(User.id.in_(chunk)).values(**values)
+                        .execution_options(synchronize_session=False)
+                    )
+                db.session.commit()
+        except Exception:
+            logger.exception('Flushing activity timestamps failed')
+            self._requeue(pending)
+            with self.lock:
+                self.stats['errors'] += 1
+            return 0
+
+        with self.lock:
+            self.stats['flushed'] += len(pending)
+            self.stats['flushes'] += 1
+        return len(pending)
+
+    def _requeue(self, pending):
+        """Put entries from a failed flush back, newer values and the size bound win"""
+        with self.lock:
+            for user_id, fields in pending.items():
+                entry = self.buffer.get(user_id)
+                if entry is None:
+                    if len(self.buffer) >= self.max_entries:
+                        self.stats['dropped'] += 1
+                        continue
+                    entry = self.buffer[user_id] = {}
+                for field, when in fields.items():
+                    if entry.get(field) is None or entry[field] < when:
+                        entry[field] = when
+
+
+def record_activity(user_id, field, when=None):
+    """Buffer an activity timestamp for the current app"""
+    return current_app.extensions['activity'].record(user_id, field, when)
+
+
+def init_app(app):
+    """Set up the recorder and track ``last_seen`` for logged-in requests"""
+    recorder = ActivityRecorder(app, app.config['ACTIVITY_FLUSH_INTERVAL'], app.config['ACTIVITY_BUFFER_SIZE'])
+    app.extensions['activity'] = recorder
+
+    @app.before_request
+    def track_last_seen():
+        if request.endpoint != 'static' and current_user.is_authenticated:
+            recorder.record(current_user.id, 'last_seen')
@@ -1,15 +1,30 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, send_file, current_app, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload, load_only
 from functools import wraps
 from app import db
-from app.models import Book, Category, Order, OrderItem, User, Review
+from app.models import Book, Category, Order, OrderItem, User, Review, FileUpload
 from app.forms import BookForm, CategoryForm
+from app.uploads import UploadError, start_upload, append_chunk, complete_upload, claim_upload
+from app.images import enqueue_cover_processing
+from app.files import schedule_deletion
+from app.bulk_books import BulkActionError, apply_bulk_action, book_filter
+from app.purge import restore_books, soft_delete_books
+from app.replica import use_replica
+from app.slow_queries import SORTS as SLOW_QUERY_SORTS, get_slow_query_log
+from app.storage import get_storage
+from app.exports import generate_export, parse_cursor
+from app.timeseries import get_series
+from app.utils import ParameterError, parse_date
+from app.user_directory import DirectoryError, directory_page, prefix_pattern
 from werkzeug.utils import secure_filename
-import os
 import uuid
+from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin', __name__)
 
+ORDER_STATUSES = ('completed', 'pending', 'cancelled', 'failed')
+
 
 def allowed_file(filename, allowed_extensions):
     """Check if file extension is allowed"""
@@ -21,21 +36,21 @@ def save_file(file, folder):
     if file and file.filename:
         # Generate unique filename to prevent conflicts
         original_filename = secure_filename(file.filename)
-        filename = f"{uuid.uuid4().hex}_{original_filename}"
-        
-        # Create folder if it doesn't exist
-        upload_path = os.path.join(current_app.root_path, 'static', folder)
-        os.makedirs(upload_path, exist_ok=True)
+        file_path = f"{folder}/{uuid.uuid4().hex}_{original_filename}"
         
-        # Save file
-        file_path = os.path.join(upload_path, filename)
-        file.save(file_path)
+        # Stream into the configured storage backend
+        get_storage().save(file_path, file.stream)
         
         # Return relative path for database storage
-        return f"{folder}/{filename}"
+        return file_path
     return None
 
 
+def has_file(field):
+    """Check whether a FileField received a file in this request"""
+    return bool(field.data and hasattr(field.data, 'filename') and field.data.filename)
+
+
 def admin_required(f):
     """Decorator to require admin access"""
     @wraps(f)
@@ -50,41 +65,27 @@ def admin_required(f):
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
+@use_replica
 def dashboard():
     """Admin dashboard with statistics"""
-    from sqlalchemy import func, extract
-    from datetime import timedelta
+    from sqlalchemy import func
+    from app import rollups
     
-    total_books = Book.query.count()
-    total_users = User.query.count()
-    total_orders = Order.query.count()
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
+    # Order, revenue and user figures come from the daily rollup tables
+    total_orders, total_revenue = rollups.sales_totals()
+    total_users = rollups.total_registrations()
+    revenue_by_month = rollups.revenue_by_month(6)
+    user_registrations = rollups.registrations_by_month(6)
+    top_books = rollups.top_books(5)
     
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+    total_books = Book.available().count()
+    recent_orders = Order.query.options(joinedload(Order.user)).order_by(Order.created_at.desc()).limit(10).all()
     
     # Books by category
     books_by_category = db.session.query(
         Category.name, 
         func.count(Book.id).label('count')
-    ).join(Book, Book.category_id == Category.id).group_by(Category.name).all()
-    
-    # Revenue by month (last 6 months)
-    revenue_by_month = db.session.query(
-        func.date_format(Order.created_at, '%Y-%m').label('month'),
-        func.sum(Order.total_amount).label('revenue')
-    ).filter(Order.status == 'completed').group_by('month').order_by('month').limit(6).all()
-    
-    # Top selling books
-    top_books = db.session.query(
-        Book.title,
-        func.count(OrderItem.id).label('sales')
-    ).join(OrderItem, OrderItem.book_id == Book.id).group_by(Book.id, Book.title).order_by(func.count(OrderItem.id).desc()).limit(5).all()
-    
-    # User registrations by month (last 6 months)
-    user_registrations = db.session.query(
-        func.date_format(User.created_at, '%Y-%m').label('month'),
-        func.count(User.id).label('count')
-    ).group_by('month').order_by('month').limit(6).all()
+    ).join(Book, Book.category_id == Category.id).filter(Book.deleted_at.is_(None)).group_by(Category.name).all()
     
     return render_template('admin/dashboard.html',
                          total_books=total_books,
@@ -99,16 +100,83 @@ def dashboard():
                          title='Admin Dashboard')
 
 
+@admin_bp.route('/api/metrics/<series>')
+@login_required
+@admin_required
+@use_replica
+def metrics_series(series):
+    """Revenue, orders, book sales or registrations as a JSON time series"""
+    try:
+        data = get_series(
+            series,
+            start=parse_date(request.args.get('start')),
+            end=parse_date(request.args.get('end')),
+            granularity=request.args.get('granularity', 'day'),
+            book_id=request.args.get('book_id', type=int),
+            max_points=request.args.get('max_points', 200, type=int)
+        )
+    except ParameterError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(data)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['METRICS_CACHE_TTL']
+    response.add_etag()
+    return response.make_conditional(request)
+
+
 @admin_bp.route('/books')
 @login_required
 @admin_required
+@use_replica
 def books():
     """List all books for management"""
     page = request.args.get('page', 1, type=int)
-    books = Book.query.order_by(Book.created_at.desc()).paginate(
+    search = request.args.get('q', '').strip()
+    category_id = request.args.get('category', type=int)
+    
+    show_deleted = request.args.get('deleted', type=int) == 1
+    
+    query = Book.query.options(
+        load_only(Book.title, Book.author, Book.price, Book.category_id, Book.deleted_at),
+        joinedload(Book.category)
+    )\
+        .filter(Book.deleted_at.isnot(None) if show_deleted else Book.deleted_at.is_(None))
+    query = query.filter(*book_filter(category_id=category_id, search=search))
+    
+    books = query.order_by(Book.created_at.desc()).paginate(
         page=page, per_page=20, error_out=False
     )
-    return render_template('admin/books.html', books=books, title='Manage Books')
+    categories = Category.query.order_by(Category.name).all()
+    return render_template('admin/books.html', books=books, categories=categories, search=search,
+                           category_id=category_id, show_deleted=show_deleted, title='Manage Books')
+
+
+@admin_bp.route('/books/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_books():
+    """Apply one action to the selected books, or to every book matching the list filters"""
+    search = request.form.get('q', '').strip()
+    category_id = request.form.get('category', type=int)
+    action = request.form.get('action', '')
+    value = request.form.get('target_category' if action == 'set-category' else 'value')
+    
+    if request.form.get('scope') == 'matching':
+        selection = {'search': search, 'category_id': category_id}
+    else:
+        selection = {'book_ids': request.form.getlist('book_ids', type=int)}
+    
+    try:
+        changed = apply_bulk_action(action, value, **selection)
+        db.session.commit()
+    except BulkActionError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+    else:
+        flash(f"{changed} book(s) {'deleted' if action == 'delete' else 'updated'}.", 'success')
+    
+    return redirect(url_for('admin.books', q=search or None, category=category_id))
 
 
 @admin_bp.route('/books/add', methods=['GET', 'POST'])
@@ -120,21 +188,27 @@ def add_book():
     form.category_id.choices = [(c.id, c.name) for c in Category.query.order_by(Category.name).all()]
     
     if form.validate_on_submit():
-        # Validate that files are provided for new book
-        if not form.cover_image.data or not form.cover_image.data.filename:
+        # Files come either from the form itself or from a completed chunked upload
+        cover_image_path = None
+        if form.cover_image_upload_id.data:
+            cover_image_path = claim_upload(form.cover_image_upload_id.data, 'cover', current_user.id)
+        elif has_file(form.cover_image):
+            cover_image_path = save_file(form.cover_image.data, 'img/books')
+        
+        if not cover_image_path:
             flash('Cover image is required when adding a new book.', 'danger')
             return render_template('admin/book_form.html', form=form, title='Add Book', action='Add')
         
-        if not form.book_file.data or not form.book_file.data.filename:
+        book_file_path = None
+        if form.book_file_upload_id.data:
+            book_file_path = claim_upload(form.book_file_upload_id.data, 'book', current_user.id)
+        elif has_file(form.book_file):
+            book_file_path = save_file(form.book_file.data, 'books')
+        
+        if not book_file_path:
             flash('Book file is required when adding a new book.', 'danger')
             return render_template('admin/book_form.html', form=form, title='Add Book', action='Add')
         
-        # Save cover image
-        cover_image_path = save_file(form.cover_image.data, 'img/books')
-        
-        # Save book file
-        book_file_path = save_file(form.book_file.data, 'books')
-        
         book = Book(
             title=form.title.data,
             author=form.author.data,
@@ -149,6 +223,7 @@ def add_book():
         
         db.session.add(book)
         db.session.commit()
+        enqueue_cover_processing(book)
         
         flash(f'Book "{book.title}" has been added successfully!', 'success')
         return redirect(url_for('admin.books'))
@@ -174,27 +249,36 @@ def edit_book(book_id):
         book.file_format = form.file_format.data
         book.category_id = form.category_id.data
         
-        # Update cover image if new file is uploaded
-        if form.cover_image.data and hasattr(form.cover_image.data, 'filename') and form.cover_image.data.filename:
-            # Delete old file if it exists
-            if book.cover_image:
-                old_file = os.path.join(current_app.root_path, 'static', book.cover_image)
-                if os.path.exists(old_file):
-                    os.remove(old_file)
-            
-            book.cover_image = save_file(form.cover_image.data, 'img/books')
+        # Update cover image if a new file is uploaded
+        if form.cover_image_upload_id.data:
+            new_cover = claim_upload(form.cover_image_upload_id.data, 'cover', current_user.id)
+        elif has_file(form.cover_image):
+            new_cover = save_file(form.cover_image.data, 'img/books')
+        else:
+            new_cover = None
         
-        # Update book file if new file is uploaded
-        if form.book_file.data and hasattr(form.book_file.data, 'filename') and form.book_file.data.filename:
-            # Delete old file if it exists
-            if book.file_path:
-                old_file = os.path.join(current_app.root_path, 'static', book.file_path)
-                if os.path.exists(old_file):
-                    os.remove(old_file)
-            
-            book.file_path = save_file(form.book_file.data, 'books')
+        if new_cover:
+            # Old file is removed by the deletion queue once this commits
+            schedule_deletion(book.cover_image)
+            book.cover_image = new_cover
+            book.cover_variants = None
+            book.cover_placeholder = None
+        
+        # Update book file if a new file is uploaded
+        if form.book_file_upload_id.data:
+            new_book_file = claim_upload(form.book_file_upload_id.data, 'book', current_user.id)
+        elif has_file(form.book_file):
+            new_book_file = save_file(form.book_file.data, 'books')
+        else:
+            new_book_file = None
+        
+        if new_book_file:
+            schedule_deletion(book.file_path)
+            book.file_path = new_book_file
         
         db.session.commit()
+        if new_cover:
+            enqueue_cover_processing(book)
         
         flash(f'Book "{book.title}" has been updated successfully!', 'success')
         return redirect(url_for('admin.books'))
@@ -206,35 +290,129 @@ def edit_book(book_id):
 @login_required
 @admin_required
 def delete_book(book_id):
-    """Delete a book"""
+    """Take a book off sale; the purge job removes it and its files later"""
     book = Book.query.get_or_404(book_id)
-    title = book.title
     
-    # Delete associated files
-    if book.cover_image:
-        cover_file = os.path.join(current_app.root_path, 'static', book.cover_image)
-        if os.path.exists(cover_file):
-            os.remove(cover_file)
+    soft_delete_books(Book.id == book.id)
+    db.session.commit()
     
-    if book.file_path:
-        book_file = os.path.join(current_app.root_path, 'static', book.file_path)
-        if os.path.exists(book_file):
-            os.remove(book_file)
+    flash(f'Book "{book.title}" has been deleted.', 'success')
+    return redirect(url_for('admin.books'))
+
+
+@admin_bp.route('/books/restore/<int:book_id>', methods=['POST'])
+@login_required
+@admin_required
+def restore_book(book_id):
+    """Put a deleted book back on sale"""
+    book = Book.query.get_or_404(book_id)
     
-    db.session.delete(book)
+    restore_books(Book.id == book.id)
     db.session.commit()
     
-    flash(f'Book "{title}" has been deleted.', 'success')
-    return redirect(url_for('admin.books'))
+    flash(f'Book "{book.title}" has been restored.', 'success')
+    return redirect(url_for('admin.books', deleted=1))
+
+
+@admin_bp.route('/export/<kind>')
+@login_required
+@admin_required
+@use_replica
+def export(kind):
+    """Stream orders, order items or users as CSV or NDJSON"""
+    fmt = request.args.get('format', 'csv')
+    try:
+        chunks = generate_export(
+            kind, fmt,
+            start=parse_date(request.args.get('start')),
+            end=parse_date(request.args.get('end')),
+            status=request.args.get('status') or None,
+            after=parse_cursor(request.args.get('after'))
+        )
+    except ParameterError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}"
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@admin_bp.route('/uploads', methods=['POST'])
+@login_required
+@admin_required
+def upload_start():
+    """Open a chunked upload (JSON: kind, filename, size)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = start_upload(current_user.id, data.get('kind'), data.get('filename'), data.get('size'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    
+    result = upload.to_dict()
+    result['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(result), 201
+
+
+@admin_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+@admin_required
+def upload_status(upload_id):
+    """Report how many bytes of an upload have been received, for resuming"""
+    upload = FileUpload.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    return jsonify(upload.to_dict())
+
+
+@admin_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+@admin_required
+def upload_chunk(upload_id):
+    """Append one chunk; the body is raw bytes, checksummed by X-Chunk-SHA256"""
+    upload = FileUpload.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Missing offset.'}), 400
+    
+    try:
+        append_chunk(upload, offset, request.stream, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        result = upload.to_dict()
+        result['error'] = str(e)
+        return jsonify(result), e.status_code
+    
+    return jsonify(upload.to_dict())
+
+
+@admin_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+@admin_required
+def upload_complete(upload_id):
+    """Finish an upload so it can be attached to a book"""
+    upload = FileUpload.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    try:
+        complete_upload(upload)
+    except UploadError as e:
+        result = upload.to_dict()
+        result['error'] = str(e)
+        return jsonify(result), e.status_code
+    
+    return jsonify(upload.to_dict())
 
 
 @admin_bp.route('/categories')
 @login_required
 @admin_required
+@use_replica
 def categories():
     """List all categories"""
     categories = Category.query.order_by(Category.name).all()
-    return render_template('admin/categories.html', categories=categories, title='Manage Categories')
+    # Live books, and soft-deleted ones that still keep the category from being deleted
+    book_counts, deleted_counts = {}, {}
+    for category_id, total, deleted in db.session.query(
+            Book.category_id, db.func.count(Book.id), db.func.count(Book.deleted_at)).group_by(Book.category_id):
+        book_counts[category_id], deleted_counts[category_id] = total - deleted, deleted
+    return render_template('admin/categories.html', categories=categories, book_counts=book_counts,
+                           deleted_counts=deleted_counts, title='Manage Categories')
 
 
 @admin_bp.route('/categories/add', methods=['GET', 'POST'])
@@ -286,7 +464,7 @@ def delete_category(category_id):
     """Delete a category"""
     category = Category.query.get_or_404(category_id)
     
-    if category.books.count() > 0:
+    if db.session.query(Book.id).filter(Book.category_id == category.id).first() is not None:
         flash(f'Cannot delete category "{category.name}" because it contains books.', 'danger')
         return redirect(url_for('admin.categories'))
     
@@ -301,22 +479,100 @@ def delete_category(category_id):
 @admin_bp.route('/users')
 @login_required
 @admin_required
+@use_replica
 def users():
-    """List all users"""
-    page = request.args.get('page', 1, type=int)
-    users = User.query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
-    return render_template('admin/users.html', users=users, title='Manage Users')
+    """List users with their order, spend and review totals"""
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'joined')
+    try:
+        rows, next_cursor = directory_page(search=search, sort=sort, after=request.args.get('after'))
+    except DirectoryError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.users'))
+    
+    return render_template('admin/users.html', rows=rows, next_cursor=next_cursor, search=search, sort=sort,
+                           first_page=not request.args.get('after'), title='Manage Users')
 
 
 @admin_bp.route('/orders')
 @login_required
 @admin_required
+@use_replica
 def orders():
-    """List all orders"""
+    """List orders, filtered by status, date range, customer and order number"""
+    from sqlalchemy import func
+    
     page = request.args.get('page', 1, type=int)
-    orders = Order.query.order_by(Order.created_at.desc()).paginate(
+    filters = {name: request.args.get(name, '').strip() for name in ('status', 'start', 'end', 'customer', 'number')}
+    
+    query = Order.query.options(joinedload(Order.user))
+    if filters['status']:
+        query = query.filter(Order.status == filters['status'])
+    try:
+        start, end = parse_date(filters['start']), parse_date(filters['end'])
+    except ParameterError as e:
+        flash(str(e), 'danger')
+        start = end = None
+    if start:
+        query = query.filter(Order.created_at >= start)
+    if end:
+        query = query.filter(Order.created_at < end + timedelta(days=1))
+    if filters['customer']:
+        # Prefix matches so the username and email indexes apply
+        customer = prefix_pattern(filters['customer'])
+        user_ids = db.session.query(User.id).filter(
+            User.username.like(customer, escape='\\') | User.email.like(customer, escape='\\')
+        )
+        query = query.filter(Order.user_id.in_(user_ids))
+    if filters['number']:
+        query = query.filter(Order.order_number.like(prefix_pattern(filters['number']), escape='\\'))
+    
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).paginate(
         page=page, per_page=20, error_out=False
     )
-    return render_template('admin/orders.html', orders=orders, title='Manage Orders')
+    
+    # Item counts for the whole page in one grouped query
+    order_ids = [order.id for order in orders.items]
+    item_counts = dict(
+        db.session.query(OrderItem.order_id, func.count(OrderItem.id))
+        .filter(OrderItem.order_id.in_(order_ids))
+        .group_by(OrderItem.order_id)
+    ) if order_ids else {}
+    
+    return render_template('admin/orders.html', orders=orders, item_counts=item_counts,
+                           filters={name: value for name, value in filters.items() if value},
+                           statuses=ORDER_STATUSES, title='Manage Orders')
+
+
+@admin_bp.route('/queries')
+@login_required
+@admin_required
+def queries():
+    """Heaviest SQL statements by fingerprint, with percentiles and sample plans"""
+    sort = request.args.get('sort', 'total')
+    if sort not in SLOW_QUERY_SORTS:
+        sort = 'total'
+    
+    log = get_slow_query_log()
+    statements = []
+    if log is None:
+        flash('The slow-query log is turned off (SLOW_QUERY_LOG).', 'info')
+    else:
+        log.flush(force=True)
+        statements = log.store.top(sort=sort, limit=50)
+    
+    return render_template('admin/queries.html', statements=statements, sort=sort, sorts=SLOW_QUERY_SORTS,
+                           threshold_ms=current_app.config['SLOW_QUERY_THRESHOLD_MS'], title='Slow Queries')
+
+
+@admin_bp.route('/queries/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_queries():
+    """Clear the slow-query log"""
+    log = get_slow_query_log()
+    if log is not None:
+        log.flush(force=True)
+        log.store.reset()
+        flash('Query statistics cleared.', 'success')
+    return redirect(url_for('admin.queries'))
@@ -0,0 +1,182 @@
+"""
+Fingerprinted static assets.
+
+Every ``url_for('static', ...)`` gets a ``v=<content hash>`` query argument,
+so a URL changes whenever the file does and browsers can cache it forever.
+Hashes come from a manifest written by ``flask assets build``; files that are
+not in the manifest (new covers, resized variants) are hashed on first use.
+The build step also writes ``.gz`` (and ``.br`` when the optional ``brotli``
+package is installed) siblings, which are served to clients that accept them.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional
+    brotli = None
+
+FINGERPRINT_EXTENSIONS = {'css', 'js', 'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'woff', 'woff2'}
+COMPRESSIBLE_EXTENSIONS = {'css', 'js', 'svg', 'txt'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Preferred encoding first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def file_digest(path):
+    """Short content hash of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class AssetManifest:
+    """Maps static filenames to content hashes"""
+
+    def __init__(self, static_folder, manifest_path, check_mtime=False):
+        self.static_folder = static_folder
+        self.manifest_path = manifest_path
+        self.check_mtime = check_mtime
+        self._digests = {}
+        self._lock = threading.Lock()
+
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                for filename, digest in json.load(f).items():
+                    self._digests[filename] = (None, digest)
+
+    def digest(self, filename):
+        """Content hash of a static file, or None if it can't be fingerprinted"""
+        if _extension(filename) not in FINGERPRINT_EXTENSIONS:
+            return None
+
+        cached = self._digests.get(filename)
+        if cached and not self.check_mtime:
+            return cached[1]
+
+        path = safe_join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        digest = file_digest(path)
+        with self._lock:
+            self._digests[filename] = (mtime, digest)
+        return digest
+
+    def build(self, compress=True):
+        """Hash every fingerprintable file, write precompressed siblings and save the manifest"""
+        manifest = {}
+        compressed = 0
+
+        for root, dirs, files in os.walk(self.static_folder):
+            # Book files are downloads, never linked as assets
+            dirs[:] = [d for d in dirs if os.path.relpath(os.path.join(root, d), self.static_folder) != 'books']
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                extension = _extension(name)
+
+                if extension in FINGERPRINT_EXTENSIONS:
+                    manifest[filename] = file_digest(path)
+                if compress and extension in COMPRESSIBLE_EXTENSIONS:
+                    compressed += write_compressed(path)
+
+        if self.manifest_path:
+            with open(self.manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+
+        with self._lock:
+            self._digests = {filename: (None, digest) for filename, digest in manifest.items()}
+        return len(manifest), compressed
+
+
+def write_compressed(path):
+    """Write .gz (and .br when available) next to a file; returns files written"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    with gzip.open(path + '.gz', 'wb', compresslevel=9) as f:
+        f.write(data)
+    written = 1
+
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+        written += 1
+    return written
+
+
+def serve_static(filename):
+    """Static view that prefers precompressed siblings and caches fingerprinted URLs forever"""
+    app = current_app._get_current_object()
+    manifest = app.extensions['asset_manifest']
+    static_folder = app.static_folder
+
+    response = None
+    if _extension(filename) in COMPRESSIBLE_EXTENSIONS:
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            path = safe_join(static_folder, filename + suffix)
+            if path and os.path.isfile(path):
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+
+    if response is None:
+        response = send_from_directory(static_folder, filename)
+
+    if _extension(filename) in COMPRESSIBLE_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+
+    version = request.args.get('v')
+    if version and version == manifest.digest(filename):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+
+    return response
+
+
+def init_app(app):
+    """Fingerprint static URLs and serve static files through serve_static"""
+    app.extensions['asset_manifest'] = AssetManifest(
+        app.static_folder,
+        app.config['ASSET_MANIFEST_PATH'],
+        check_mtime=app.debug
+    )
+
+    if not app.config['STATIC_FINGERPRINT']:
+        return
+
+    @app.url_defaults
+    def add_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = current_app.extensions['asset_manifest'].digest(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    app.view_functions['static'] = serve_static
@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_user, logout_user, current_user
 from app import db
 from app.models import User
 from app.forms import RegistrationForm, LoginForm
-from datetime import datetime, timezone
+from app.passwords import PasswordHasherBusy, fake_verify_password
+from app.activity import record_activity
+import math
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -20,7 +22,11 @@ def register():
             email=form.email.data,
             full_name=form.full_name.data
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('The server is busy right now. Please try again in a moment.', 'danger')
+            return render_template('auth/register.html', form=form, title='Register'), 503
         
         db.session.add(user)
         db.session.commit()
@@ -38,15 +44,37 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        # Turn away floods before any lookup or hashing work
+        retry_after = current_app.extensions['login_throttle'].check(request.remote_addr, form.username.data)
+        if retry_after:
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'danger')
+            response = current_app.make_response((render_template('auth/login.html', form=form, title='Login'), 429))
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response
+        
         # Check if user exists by username or email
         user = User.query.filter(
             (User.username == form.username.data) | (User.email == form.username.data)
         ).first()
         
-        if user and user.check_password(form.password.data):
-            # Update last login time
-            user.last_login = datetime.now(timezone.utc)
-            db.session.commit()
+        try:
+            if user is None:
+                # Same delay as a real check, without burning a hashing slot on it
+                authenticated = fake_verify_password()
+            else:
+                authenticated = user.check_password(form.password.data)
+            # Upgrade hashes made at an older cost while the plain password is at hand
+            if authenticated and user.password_needs_rehash:
+                user.rehash_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('The server is busy right now. Please try again in a moment.', 'danger')
+            return render_template('auth/login.html', form=form, title='Login'), 503
+        
+        if authenticated:
+            # Last login time is written behind; only a rehash needs a commit here
+            record_activity(user.id, 'last_login')
+            if db.session.dirty:
+                db.session.commit()
             
             login_user(user, remember=form.remember_me.data)
             
@@ -0,0 +1,79 @@
+"""
+Bulk admin actions on books.
+
+Each action is a set-based UPDATE run in the caller's transaction, so a
+failure partway leaves the catalog unchanged. Books are chosen by a list of
+ids or by the filters of the admin book list (category and title/author
+search); only live books are affected. Delete is the soft delete from
+``app.purge``: rows and files are removed later by the purge job.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import func, or_, update
+from app import db
+from app.models import Book, Category
+from app.purge import soft_delete_books
+
+BULK_ACTIONS = ('set-price', 'adjust-price', 'set-category', 'delete')
+
+
+class BulkActionError(ValueError):
+    """Invalid bulk action, value or selection"""
+
+
+def book_filter(book_ids=None, category_id=None, search=None):
+    """WHERE clause for the selected ids or the book list filters"""
+    conditions = []
+    if book_ids:
+        conditions.append(Book.id.in_(book_ids))
+    if category_id:
+        conditions.append(Book.category_id == category_id)
+    if search:
+        conditions.append(or_(Book.title.ilike(f'%{search}%'), Book.author.ilike(f'%{search}%')))
+    return conditions
+
+
+def _decimal(value, label):
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise BulkActionError(f'{label} must be a number.')
+
+
+def apply_bulk_action(action, value=None, **selection):
+    """Run one bulk action over the selected books; returns how many changed. The caller commits."""
+    if action not in BULK_ACTIONS:
+        raise BulkActionError(f'Unknown bulk action {action!r}.')
+    conditions = book_filter(**selection)
+    if not conditions:
+        raise BulkActionError('Select books or filter the list first.')
+    conditions.append(Book.deleted_at.is_(None))
+
+    if action == 'delete':
+        return soft_delete_books(*conditions)
+
+    if action == 'set-price':
+        price = _decimal(value, 'Price')
+        if price < 0:
+            raise BulkActionError('Price cannot be negative.')
+        values = {'price': price}
+    elif action == 'adjust-price':
+        percent = _decimal(value, 'Percentage')
+        if percent <= -100:
+            raise BulkActionError('Percentage must be greater than -100.')
+        values = {'price': func.round(Book.price * (100 + percent) / 100, 2)}
+    else:
+        try:
+            category_id = int(value)
+        except (TypeError, ValueError):
+            raise BulkActionError('Choose a category.')
+        if db.session.get(Category, category_id) is None:
+            raise BulkActionError('Category not found.')
+        values = {'category_id': category_id}
+
+    # Loaded Book objects are refreshed when the caller's commit expires them
+    result = db.session.execute(
+        update(Book).where(*conditions).values(**values).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -0,0 +1,230 @@
+"""
+Bulk catalog import from CSV or JSON Lines manifests.
+
+Each manifest row describes one book::
+
+    title, author, isbn, description, price, file_format, category, file, cover
+
+``file`` and ``cover`` are paths relative to the source directory. Rows are
+streamed, so manifest size doesn't matter. They are processed in batches:
+files are hashed and copied into storage by a thread pool under
+content-addressed names, then the batch is inserted with one multi-row INSERT
+and committed. After every commit a ``.progress`` file records how far the
+import got, so ``--resume`` continues after a failure. Books whose ISBN
+already exists are skipped.
+"""
+
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import Book, Category
+from app.storage import get_storage
+
+FILE_FORMATS = {'pdf': 'PDF', 'epub': 'ePub'}
+
+
+class ImportRowError(ValueError):
+    """A manifest row that cannot be imported"""
+
+
+def read_manifest(path):
+    """Yield manifest rows as dicts from a .csv or .jsonl file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def progress_path(manifest_path):
+    return manifest_path + '.progress'
+
+
+def load_progress(manifest_path):
+    """Rows already committed by a previous run"""
+    try:
+        with open(progress_path(manifest_path)) as f:
+            return json.load(f)['rows_done']
+    except (FileNotFoundError, KeyError, ValueError):
+        return 0
+
+
+def save_progress(manifest_path, rows_done):
+    path = progress_path(manifest_path)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'rows_done': rows_done}, f)
+    os.replace(path + '.tmp', path)
+
+
+def store_file(storage, source_dir, relative_path, folder):
+    """Hash a source file and copy it into storage under a content-addressed name"""
+    source = os.path.join(source_dir, relative_path)
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    stored_path = f"{folder}/{digest.hexdigest()[:32]}_{secure_filename(os.path.basename(relative_path))}"
+    # Identical content is only stored once
+    if not storage.exists(stored_path):
+        with open(source, 'rb') as f:
+            storage.save(stored_path, f)
+    return stored_path
+
+
+def _clean_row(row):
+    title = (row.get('title') or '').strip()
+    author = (row.get('author') or '').strip()
+    if not title or not author:
+        raise ImportRowError('title and author are required')
+    try:
+        price = Decimal(str(row.get('price')).strip())
+    except (InvalidOperation, TypeError):
+        raise ImportRowError(f"invalid price {row.get('price')!r}")
+    # NaN can't be compared and Infinity doesn't fit Numeric(10, 2)
+    if not price.is_finite() or price <= 0:
+        raise ImportRowError(f"price must be a positive amount, not {row.get('price')!r}")
+    price = price.quantize(Decimal('0.01'))
+    if price >= 10 ** 8:
+        raise ImportRowError(f"price {row.get('price')!r} is too large")
+
+    file = (row.get('file') or '').strip()
+    file_format = (row.get('file_format') or '').strip()
+    if not file_format and file:
+        file_format = FILE_FORMATS.get(file.rsplit('.', 1)[-1].lower(), 'PDF')
+
+    return {
+        'title': title[:200],
+        'author': author[:100],
+        'isbn': (row.get('isbn') or '').strip().replace('-', '')[:13] or None,
+        'description': row.get('description') or None,
+        'price': price,
+        'file_format': file_format or 'PDF',
+        'category': (row.get('category') or '').strip() or None,
+        'file': file or None,
+        'cover': (row.get('cover') or '').strip() or None
+    }
+
+
+class CatalogImporter:
+    """Imports one manifest; create once per run"""
+
+    def __init__(self, source_dir, batch_size=500, workers=4, progress=None):
+        self.source_dir = source_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self.progress = progress or (lambda stats: None)
+        self.storage = get_storage()
+        self.categories = {name: id for id, name in db.session.query(Category.id, Category.name)}
+        self.seen_isbns = set()
+        self.stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'errors': 0}
+        self.errors = []
+
+    def _category_id(self, name):
+        if name is None:
+            return None
+        if name not in self.categories:
+            category = Category(name=name[:50])
+            db.session.add(category)
+            db.session.flush()
+            self.categories[name] = category.id
+        return self.categories[name]
+
+    def _store_files(self, executor, rows):
+        """Copy every batch file in parallel; returns {(row index, field): stored path}"""
+        jobs = {}
+        for index, row in enumerate(rows):
+            for field, folder in (('file', 'books'), ('cover', 'img/books')):
+                if row[field]:
+                    jobs[(index, field)] = executor.submit(
+                        store_file, self.storage, self.source_dir, row[field], folder
+                    )
+        return jobs
+
+    def _import_batch(self, executor, line_numbers, rows):
+        # Drop books that already exist, in the database or earlier in the manifest
+        isbns = [row['isbn'] for row in rows if row['isbn']]
+        existing = {isbn for (isbn,) in db.session.query(Book.isbn).filter(Book.isbn.in_(isbns))} if isbns else set()
+
+        unique = []
+        for line, row in zip(line_numbers, rows):
+            if row['isbn'] and (row['isbn'] in existing or row['isbn'] in self.seen_isbns):
+                self.stats['duplicates'] += 1
+                continue
+            unique.append((line, row))
+
+        jobs = self._store_files(executor, [row for line, row in unique])
+
+        values = []
+        for index, (line, row) in enumerate(unique):
+            # An ISBN only counts as seen once its row is inserted, so a row whose files
+            # failed to copy doesn't turn a later copy of the same book into a duplicate
+            if row['isbn'] and row['isbn'] in self.seen_isbns:
+                self.stats['duplicates'] += 1
+                continue
+            try:
+                file_path = jobs[(index, 'file')].result() if (index, 'file') in jobs else None
+                cover_image = jobs[(index, 'cover')].result() if (index, 'cover') in jobs else None
+            except OSError as e:
+                self.stats['errors'] += 1
+                self.errors.append((line, str(e)))
+                continue
+
+            values.append({
+                'title': row['title'],
+                'author': row['author'],
+                'isbn': row['isbn'],
+                'description': row['description'],
+                'price': row['price'],
+                'file_format': row['file_format'],
+                'category_id': self._category_id(row['category']),
+                'file_path': file_path,
+                'cover_image': cover_image
+            })
+            if row['isbn']:
+                self.seen_isbns.add(row['isbn'])
+
+        if values:
+            # One multi-row INSERT for the whole batch
+            db.session.execute(insert(Book), values)
+        db.session.commit()
+        self.stats['imported'] += len(values)
+
+    def run(self, manifest_path, resume=False):
+        """Import the manifest; returns the run statistics"""
+        skip = load_progress(manifest_path) if resume else 0
+        line_numbers, rows = [], []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for line, raw in enumerate(read_manifest(manifest_path), start=1):
+                if line <= skip:
+                    continue
+                self.stats['rows'] += 1
+                try:
+                    rows.append(_clean_row(raw))
+                    line_numbers.append(line)
+                except ImportRowError as e:
+                    self.stats['errors'] += 1
+                    self.errors.append((line, str(e)))
+
+                if len(rows) >= self.batch_size:
+                    self._import_batch(executor, line_numbers, rows)
+                    save_progress(manifest_path, line)
+                    self.progress(self.stats)
+                    line_numbers, rows = [], []
+
+            if rows:
+                self._import_batch(executor, line_numbers, rows)
+            save_progress(manifest_path, skip + self.stats['rows'])
+            self.progress(self.stats)
+
+        return self.stats
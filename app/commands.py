@@ -0,0 +1,383 @@
+"""
+Flask CLI commands for CyberBooks maintenance tasks
+Run with: flask --app run.py <group> <command>
+"""
+
+import click
+from flask.cli import AppGroup
+
+images_cli = AppGroup('images', help='Cover image maintenance.')
+assets_cli = AppGroup('assets', help='Static asset fingerprinting.')
+files_cli = AppGroup('files', help='Stored book file and cover housekeeping.')
+catalog_cli = AppGroup('catalog', help='Bulk catalog import.')
+export_cli = AppGroup('export', help='Streaming data exports.')
+passwords_cli = AppGroup('passwords', help='Password hashing.')
+rollups_cli = AppGroup('rollups', help='Dashboard rollup tables.')
+books_cli = AppGroup('books', help='Catalog maintenance.')
+indexes_cli = AppGroup('indexes', help='Query plan checks for the schema indexes.')
+queries_cli = AppGroup('queries', help='Slow-query log.')
+
+
+@images_cli.command('backfill')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: IMAGE_WORKERS).')
+@click.option('--force', is_flag=True, help='Regenerate covers that already have variants.')
+def backfill_images(workers, force):
+    """Generate responsive variants for existing book covers"""
+    from app.images import backfill_cover_variants
+
+    processed, failed = backfill_cover_variants(workers=workers, force=force)
+    click.echo(f'Processed {processed} covers, {failed} failed.')
+
+
+@assets_cli.command('build')
+@click.option('--no-compress', is_flag=True, help='Skip writing .gz/.br siblings.')
+def build_assets(no_compress):
+    """Hash static files into the manifest and precompress text assets"""
+    from flask import current_app
+
+    manifest = current_app.extensions['asset_manifest']
+    hashed, compressed = manifest.build(compress=not no_compress)
+    click.echo(f'Fingerprinted {hashed} files, wrote {compressed} compressed variants.')
+
+
+@files_cli.command('check')
+@click.option('--workers', type=int, default=4, help='Threads used to walk the storage folders.')
+@click.option('--quarantine', 'move', is_flag=True, help='Move orphaned files to QUARANTINE_FOLDER.')
+def check_files(workers, move):
+    """Report orphaned files and books whose files are missing"""
+    from app.files import check_storage, quarantine
+
+    orphans, missing = check_storage(workers=workers)
+
+    click.echo(f'Orphaned files: {len(orphans)}')
+    for path in orphans:
+        click.echo(f'  {path}')
+    click.echo(f'Missing files: {len(missing)}')
+    for path in missing:
+        click.echo(f'  {path}')
+
+    if move and orphans:
+        moved = quarantine(orphans)
+        click.echo(f'Quarantined {moved} files.')
+
+
+@files_cli.command('process-deletions')
+@click.option('--batch-size', type=int, default=100, help='Queued deletions handled per run.')
+def process_file_deletions(batch_size):
+    """Delete files queued by book edits and deletions"""
+    from app.files import process_deletions
+
+    deleted, failed = process_deletions(batch_size=batch_size)
+    click.echo(f'Deleted {deleted} files, {failed} failed.')
+
+
+@catalog_cli.command('import')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--source-dir', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Folder the manifest file and cover paths are relative to (default: manifest folder).')
+@click.option('--batch-size', type=int, default=500, help='Books inserted and committed per batch.')
+@click.option('--workers', type=int, default=4, help='Threads hashing and copying files.')
+@click.option('--resume', is_flag=True, help='Skip rows committed by a previous run.')
+def import_catalog(manifest, source_dir, batch_size, workers, resume):
+    """Import books from a CSV or JSON Lines manifest"""
+    import os
+    from app.catalog_import import CatalogImporter
+
+    def report(stats):
+        click.echo(f"{stats['rows']} rows: {stats['imported']} imported, "
+                   f"{stats['duplicates']} duplicates, {stats['errors']} errors")
+
+    importer = CatalogImporter(source_dir or os.path.dirname(os.path.abspath(manifest)),
+                               batch_size=batch_size, workers=workers, progress=report)
+    stats = importer.run(manifest, resume=resume)
+
+    for line, error in importer.errors:
+        click.echo(f'  row {line}: {error}')
+    click.echo(f"Imported {stats['imported']} books.")
+
+
+@export_cli.command('run')
+@click.argument('kind', type=click.Choice(['orders', 'order-items', 'users']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv')
+@click.option('--start', default=None, help='First day to include (YYYY-MM-DD).')
+@click.option('--end', default=None, help='Last day to include (YYYY-MM-DD).')
+@click.option('--status', default=None, help='Order status, or admin/customer for users.')
+@click.option('--after', default=None, help='Resume after this <created_at>,<id> cursor.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None,
+              help='Output file (default: <kind>-<date>.<format>.gz).')
+@click.option('--gzip/--no-gzip', 'compress', default=True, help='Gzip-compress the output.')
+@click.option('--batch-size', type=int, default=1000, help='Rows fetched per round trip.')
+def run_export(kind, fmt, start, end, status, after, output, compress, batch_size):
+    """Export orders, order items or users to a file"""
+    import gzip
+    from datetime import datetime
+    from app.exports import generate_export, parse_cursor
+    from app.utils import ParameterError, parse_date
+
+    try:
+        chunks = generate_export(kind, fmt, batch_size=batch_size, start=parse_date(start), end=parse_date(end),
+                                 status=status, after=parse_cursor(after))
+    except ParameterError as e:
+        raise click.UsageError(str(e))
+
+    if output is None:
+        output = f"{kind}-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}" + ('.gz' if compress else '')
+    opener = gzip.open if compress else open
+
+    with opener(output, 'wt', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    click.echo(f'Wrote {output}')
+
+
+@passwords_cli.command('benchmark')
+@click.option('--rounds', type=int, default=None, help='bcrypt cost (default: BCRYPT_ROUNDS).')
+@click.option('--logins', type=int, default=200, help='Password checks to run.')
+@click.option('--clients', type=int, default=16, help='Concurrent simulated requests.')
+def benchmark_passwords(rounds, logins, clients):
+    """Measure login password-check throughput through the hashing pool"""
+    import os
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+    from app.passwords import get_hasher, PasswordHasherBusy
+
+    rounds = rounds or current_app.config['BCRYPT_ROUNDS']
+    hasher = get_hasher()
+    workers = hasher.workers
+    stored = hasher.hash('benchmark-password', rounds)
+
+    def login(_):
+        # Simulated requests retry when the queue is full, as a client would
+        while True:
+            try:
+                return hasher.verify('benchmark-password', stored)
+            except PasswordHasherBusy:
+                time.sleep(0.01)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as requests:
+        if not all(requests.map(login, range(logins))):
+            raise click.ClickException('The benchmark password failed to verify against its own hash')
+    elapsed = time.perf_counter() - started
+
+    cores = min(workers, os.cpu_count() or 1)
+    click.echo(f'bcrypt cost {rounds}, {workers} hashing threads, {clients} concurrent clients')
+    click.echo(f'{logins} logins in {elapsed:.2f}s: {logins / elapsed:.1f}/s, {logins / elapsed / cores:.1f}/s per core')
+
+
+@rollups_cli.command('rebuild')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First day to rebuild.')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last day to rebuild.')
+def rebuild_rollups(start, end):
+    """Recompute daily rollups from orders and users (all days by default)"""
+    from app.rollups import rebuild_rollups
+
+    written = rebuild_rollups(start=start.date() if start else None, end=end.date() if end else None)
+    click.echo(f'Wrote {written} rollup rows.')
+
+
+@books_cli.command('purge')
+@click.option('--older-than', type=int, default=None, help='Days since deletion (default: BOOK_PURGE_AFTER).')
+@click.option('--batch-size', type=int, default=None, help='Books per transaction (default: BOOK_PURGE_BATCH_SIZE).')
+@click.option('--ignore-window', is_flag=True, help='Run outside BOOK_PURGE_WINDOW.')
+def purge_books(older_than, batch_size, ignore_window):
+    """Hard-delete soft-deleted books nobody has ordered, with their files"""
+    from datetime import timedelta
+    from flask import current_app
+    from app.purge import in_window, purge_deleted_books
+
+    if not ignore_window and not in_window(current_app.config['BOOK_PURGE_WINDOW']):
+        click.echo('Outside the purge window; nothing done.')
+        return
+
+    books, files = purge_deleted_books(
+        older_than=timedelta(days=older_than) if older_than is not None else None,
+        batch_size=batch_size,
+        window=False if ignore_window else None
+    )
+    click.echo(f'Purged {books} books and {files} files.')
+
+
+@books_cli.command('benchmark-listing')
+@click.option('--books', type=int, default=1000, help='Books on the listed page.')
+@click.option('--description-size', type=int, default=4000, help='Characters of description per book.')
+@click.option('--repeat', type=int, default=5, help='Runs per strategy; the fastest is reported.')
+def benchmark_book_listing(books, description_size, repeat):
+    """Compare full rows, card columns and plain-row projections for one listing page
+
+    The books are created inside a transaction that is rolled back.
+    """
+    import time
+    import uuid
+    from sqlalchemy import insert, select
+    from sqlalchemy.orm import undefer_group
+    from app import db
+    from app.models import Book
+
+    token = uuid.uuid4().hex[:8]
+    db.session.execute(insert(Book), [{
+        'title': f'Benchmark {token} {n}', 'author': 'Benchmark', 'price': 10, 'cover_image': f'img/books/{n}.jpg',
+        'cover_variants': '160,320,640', 'cover_placeholder': 'data:image/webp;base64,' + 'A' * 400,
+        'description': 'x' * description_size
+    } for n in range(books)])
+    page = Book.title.like(f'Benchmark {token} %')
+
+    strategies = [
+        ('full rows', lambda: Book.query.options(undefer_group('wide')).filter(page)),
+        ('card columns', lambda: Book.query.options(*Book.card_options()).filter(page)),
+        ('plain rows', lambda: db.session.query(Book.id, Book.title, Book.author, Book.price, Book.cover_image).filter(page)),
+    ]
+    try:
+        for label, build in strategies:
+            # Bytes the database sends back, measured on the raw rows of the same SELECT
+            raw = db.session.connection().execute(build().statement).all()
+            size = sum(len(str(value)) for row in raw for value in row if value is not None)
+
+            best = None
+            for _ in range(repeat):
+                db.session.expunge_all()
+                started = time.perf_counter()
+                assert len(build().all()) == books
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            click.echo(f'{label:>12}: {size / 1024:8.1f} KiB, {best * 1000:7.1f} ms to load {books} books')
+    finally:
+        db.session.rollback()
+
+
+@books_cli.command('benchmark-delete')
+@click.option('--reviews', type=int, default=100000, help='Reviews attached to the deleted book.')
+def benchmark_book_delete(reviews):
+    """Time deleting a book with many reviews, by ORM cascade and by ON DELETE CASCADE
+
+    Everything runs inside one transaction that is rolled back, so the
+    database is left as it was.
+    """
+    import time
+    import uuid
+    from sqlalchemy import event, insert, literal, select
+    from app import db
+    from app.models import Book, Review, User
+
+    token = uuid.uuid4().hex[:8]
+    book = Book(title=f'Benchmark {token}', author='Benchmark', price=0)
+    db.session.add(book)
+    db.session.flush()
+    for start in range(0, reviews, 10000):
+        db.session.execute(insert(User), [
+            {'username': f'bench-{token}-{n}', 'email': f'bench-{token}-{n}@example.com', 'password_hash': '-'}
+            for n in range(start, min(start + 10000, reviews))
+        ])
+    db.session.execute(insert(Review).from_select(
+        ['user_id', 'book_id', 'rating'],
+        select(User.id, literal(book.id), literal(5)).where(User.username.like(f'bench-{token}-%'))
+    ))
+    click.echo(f'Created a book with {reviews} reviews.')
+
+    statements = []
+    connection = db.session.connection()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # An executemany still runs the statement once per parameter set
+        statements.append(len(parameters) if executemany else 1)
+
+    event.listen(connection, 'before_cursor_execute', record)
+
+    def timed(label, delete):
+        savepoint = db.session.begin_nested()
+        statements.clear()
+        started = time.perf_counter()
+        delete(db.session.get(Book, book.id))
+        db.session.flush()
+        elapsed = time.perf_counter() - started
+        click.echo(f'{label}: {elapsed:.2f}s, {sum(statements)} statements')
+        savepoint.rollback()
+        db.session.expire_all()
+
+    def orm_cascade(target):
+        # What delete-orphan did before passive_deletes: load every review, delete it by primary key
+        for review in db.session.scalars(target.reviews.select()):
+            db.session.delete(review)
+        db.session.delete(target)
+
+    try:
+        timed('ORM cascade', orm_cascade)
+        timed('ON DELETE CASCADE', db.session.delete)
+    finally:
+        event.remove(connection, 'before_cursor_execute', record)
+        db.session.rollback()
+
+
+@indexes_cli.command('check')
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every query, not only the failing ones.')
+def check_indexes(verbose):
+    """EXPLAIN the hot queries and fail if any of them scans a whole table or sorts"""
+    from app.query_audit import audit
+
+    failed = 0
+    for name, plan, problems in audit():
+        if problems:
+            failed += 1
+            click.echo(f'FAIL  {name}: {", ".join(problems)}')
+        elif verbose:
+            click.echo(f'ok    {name}')
+        if problems or verbose:
+            for step in plan:
+                click.echo(f'        {step}')
+    if failed:
+        raise click.ClickException(f'{failed} hot queries need an index.')
+    click.echo('Every hot query is served by an index.')
+
+
+def _slow_query_log():
+    from app.slow_queries import get_slow_query_log
+
+    log = get_slow_query_log()
+    if log is None:
+        raise click.ClickException('The slow-query log is turned off (SLOW_QUERY_LOG).')
+    log.flush(force=True)
+    return log
+
+
+@queries_cli.command('top')
+@click.option('--sort', type=click.Choice(['total', 'p95', 'max', 'calls', 'mean']), default='total', show_default=True)
+@click.option('--limit', type=int, default=20, show_default=True)
+@click.option('--plans', is_flag=True, help='Print the sample plan under each statement.')
+def top_queries(sort, limit, plans):
+    """Print the heaviest statement fingerprints recorded by every worker"""
+    statements = _slow_query_log().store.top(sort=sort, limit=limit)
+    if not statements:
+        click.echo('No statements recorded yet.')
+        return
+
+    click.echo(f'{"calls":>8} {"total ms":>10} {"p50":>8} {"p95":>8} {"max":>8} {"slow":>6}  statement')
+    for row in statements:
+        click.echo(f"{row['calls']:>8} {row['total_ms']:>10.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                   f"{row['max_ms']:>8.2f} {row['slow_calls']:>6}  {row['fingerprint']}")
+        if plans and row['plan']:
+            problems = row['plan']['problems']
+            click.echo(f"{'':>52}plan{': ' + ', '.join(problems) if problems else ''}")
+            for step in row['plan']['steps']:
+                click.echo(f"{'':>54}{step}")
+
+
+@queries_cli.command('reset')
+def reset_queries():
+    """Clear the slow-query log"""
+    _slow_query_log().store.reset()
+    click.echo('Query statistics cleared.')
+
+
+def register_commands(app):
+    """Attach all CLI command groups to the app"""
+    app.cli.add_command(images_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(files_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(books_cli)
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(queries_cli)
@@ -0,0 +1,146 @@
+"""
+Streaming CSV and NDJSON exports of orders, order items and users.
+
+Rows are read with ``yield_per``, which uses a server-side cursor where the
+driver supports one, and are written out a batch at a time. Memory use stays
+flat however large the table is. Exports are ordered by ``(created_at, id)``.
+Passing the last row's pair as ``after`` resumes an interrupted export.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, case, and_, or_
+from app import db
+from app.models import Order, OrderItem, User, Book
+from app.utils import ParameterError
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+
+class ExportError(ParameterError):
+    """Invalid export parameters"""
+
+
+def _orders():
+    query = select(
+        Order.id, Order.order_number, Order.user_id, User.username, User.email,
+        Order.total_amount, Order.status, Order.payment_method, Order.created_at
+    ).join(User, User.id == Order.user_id)
+    return query, Order.created_at, Order.id, Order.status
+
+
+def _order_items():
+    query = select(
+        OrderItem.id, OrderItem.order_id, Order.order_number, Order.user_id, OrderItem.book_id,
+        Book.title, Book.isbn, OrderItem.price, Order.status, Order.created_at
+    ).join(Order, Order.id == OrderItem.order_id).join(Book, Book.id == OrderItem.book_id)
+    return query, Order.created_at, OrderItem.id, Order.status
+
+
+def _users():
+    query = select(
+        User.id, User.username, User.email, User.full_name, User.is_admin, User.created_at, User.last_login
+    )
+    # Users have no status; filter on role instead
+    role = case((User.is_admin.is_(True), 'admin'), else_='customer')
+    return query, User.created_at, User.id, role
+
+
+EXPORTS = {
+    'orders': _orders,
+    'order-items': _order_items,
+    'users': _users
+}
+
+
+def parse_cursor(value):
+    """Parse an ``<created_at ISO>,<id>`` resume cursor"""
+    if not value:
+        return None
+    try:
+        created_at, id = value.rsplit(',', 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise ExportError(f'Invalid cursor {value!r}, expected <created_at>,<id>')
+
+
+def export_query(kind, start=None, end=None, status=None, after=None):
+    """Build the ordered, filtered select for an export; ``end`` is inclusive"""
+    if kind not in EXPORTS:
+        raise ExportError(f'Unknown export {kind!r}')
+    query, created_at, id, status_column = EXPORTS[kind]()
+
+    if start:
+        query = query.where(created_at >= start)
+    if end:
+        query = query.where(created_at < end + timedelta(days=1))
+    if status:
+        query = query.where(status_column == status)
+    if after:
+        # Keyset condition, written without row values so every backend can use the index
+        query = query.where(or_(created_at > after[0], and_(created_at == after[0], id > after[1])))
+
+    return query.order_by(created_at, id)
+
+
+def iter_rows(kind, batch_size=1000, **filters):
+    """Stream export rows as batches of dicts"""
+    query = export_query(kind, **filters)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+    for partition in result.partitions():
+        yield [dict(zip(columns, row)) for row in partition]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# Leading characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Usernames, titles and the like are user input; quote them so they stay text
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def generate_export(kind, fmt='csv', batch_size=1000, **filters):
+    """Return a generator of text chunks, one per fetched batch
+
+    Parameters are validated here, before streaming starts, so that errors can
+    still become a normal response.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f'Unknown format {fmt!r}')
+    columns = [column.name for column in export_query(kind, **filters).selected_columns]
+
+    def generate():
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(columns)
+            yield buffer.getvalue()
+
+        for rows in iter_rows(kind, batch_size=batch_size, **filters):
+            buffer = io.StringIO()
+            if fmt == 'csv':
+                csv.writer(buffer).writerows([_csv_value(row[c]) for c in columns] for row in rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(row, default=_json_default))
+                    buffer.write('\n')
+            yield buffer.getvalue()
+
+    return generate()
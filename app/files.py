@@ -0,0 +1,137 @@
+"""
+Keeps stored book files and covers in sync with the database.
+
+Request handlers never delete files directly. They queue the path with
+``schedule_deletion`` in the same transaction as the row change, so a failed
+commit leaves the file alone, and ``process_deletions`` removes queued files
+later. ``check_storage`` diffs the upload folders against the paths the
+database references and can quarantine orphaned files.
+"""
+
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from app import db
+from app.images import VARIANTS_FOLDER
+from app.models import Book, FileDeletion, FileUpload
+from app.storage import get_storage
+
+STORAGE_FOLDERS = ('books', 'img/books')
+
+
+def schedule_deletion(relative_path):
+    """Queue a stored file for deletion once the current transaction commits"""
+    if relative_path:
+        db.session.add(FileDeletion(file_path=relative_path))
+
+
+def _variant_paths(storage, cover_image):
+    """Resized variants generated for a cover"""
+    stem = os.path.splitext(os.path.basename(cover_image))[0]
+    prefix = f"{VARIANTS_FOLDER}/{stem}-"
+    # The prefix also matches covers whose stem extends this one; compare exactly
+    return [path for path, mtime in storage.list(prefix)
+            if os.path.basename(path).rsplit('-', 1)[0] == stem]
+
+
+def _with_variants(storage, path):
+    if path.startswith('img/books/'):
+        return [path] + _variant_paths(storage, path)
+    return [path]
+
+
+def process_deletions(batch_size=100, max_attempts=5):
+    """Delete queued files that no book references any more; returns (deleted, failed)"""
+    storage = get_storage()
+    deleted = failed = 0
+
+    pending = FileDeletion.query.filter(FileDeletion.attempts < max_attempts)\
+        .order_by(FileDeletion.id).limit(batch_size).all()
+
+    for entry in pending:
+        # The path may have been reattached since it was queued
+        in_use = Book.query.filter(
+            (Book.file_path == entry.file_path) | (Book.cover_image == entry.file_path)
+        ).first() is not None
+
+        try:
+            if not in_use:
+                for path in _with_variants(storage, entry.file_path):
+                    storage.delete(path)
+                deleted += 1
+            db.session.delete(entry)
+        except Exception as e:
+            entry.attempts += 1
+            entry.last_error = str(e)[:255]
+            failed += 1
+
+    db.session.commit()
+    return deleted, failed
+
+
+def _scan_folder(storage, folder):
+    """List files under one storage folder with their modification times"""
+    return {
+        path: mtime for path, mtime in storage.list(folder + '/')
+        # Variants are checked against their cover, not on their own
+        if not path.startswith(VARIANTS_FOLDER + '/') and not path.endswith(('.gz', '.br'))
+    }
+
+
+def check_storage(workers=4):
+    """Compare stored files with database references
+
+    Returns ``(orphans, missing)``: files in storage nothing points to, and
+    paths the database points to that are not stored. Files younger than
+    ORPHAN_GRACE_PERIOD and in-flight uploads are never reported as orphans.
+    """
+    storage = get_storage()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda folder: _scan_folder(storage, folder), STORAGE_FOLDERS)
+        stored = {}
+        for found in results:
+            stored.update(found)
+
+    referenced = set()
+    for file_path, cover_image in db.session.query(Book.file_path, Book.cover_image).yield_per(1000):
+        referenced.update(path for path in (file_path, cover_image) if path)
+
+    grace = current_app.config['ORPHAN_GRACE_PERIOD']
+    in_flight = {
+        path for (path,) in db.session.query(FileUpload.file_path).filter(
+            FileUpload.status != 'attached',
+            FileUpload.created_at >= datetime.utcnow() - grace
+        )
+    }
+    queued = {path for (path,) in db.session.query(FileDeletion.file_path)}
+
+    cutoff = time.time() - grace.total_seconds()
+    orphans = sorted(
+        path for path, mtime in stored.items()
+        if path not in referenced and path not in in_flight and path not in queued and mtime < cutoff
+    )
+    missing = sorted(path for path in referenced if path not in stored)
+    return orphans, missing
+
+
+def quarantine(paths):
+    """Move files (and cover variants) out of storage into the local QUARANTINE_FOLDER"""
+    storage = get_storage()
+    target_root = current_app.config['QUARANTINE_FOLDER']
+    moved = 0
+
+    for path in paths:
+        for stored_path in _with_variants(storage, path):
+            target = os.path.join(target_root, stored_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with storage.open(stored_path) as source, open(target, 'wb') as f:
+                shutil.copyfileobj(source, f)
+            storage.delete(stored_path)
+        moved += 1
+
+    return moved
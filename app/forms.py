@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, TextAreaField, DecimalField, SelectField, IntegerField, BooleanField, FileField
+from wtforms import StringField, PasswordField, TextAreaField, DecimalField, SelectField, IntegerField, BooleanField, FileField, HiddenField
 from wtforms.validators import DataRequired, EqualTo, Length, ValidationError, NumberRange, Optional, Regexp
 import re
 from app.models import User
@@ -86,6 +86,9 @@ class BookForm(FlaskForm):
     ])
     cover_image = FileField('Cover Image')
     book_file = FileField('Book File (PDF/ePub)')
+    # Set by the chunked uploader once a large file has been uploaded
+    cover_image_upload_id = HiddenField(validators=[Optional(), Length(max=32)])
+    book_file_upload_id = HiddenField(validators=[Optional(), Length(max=32)])
     description = TextAreaField('Description', validators=[DataRequired()])
     price = DecimalField('Price ($)', validators=[
         DataRequired(),
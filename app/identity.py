@@ -0,0 +1,141 @@
+"""
+Cached user loading for Flask-Login.
+
+Most requests only need a user's id, username and admin flag. Those, plus an
+auth version, are kept in a short-TTL per-process cache, so a logged-in
+request doesn't touch the users table. The full ``User`` row is loaded only
+when a handler reads any other attribute.
+
+The session id has the form ``<id>:<auth_version>``. A password or admin-flag
+change bumps ``User.auth_version``, which ends every existing session and
+remember cookie for that user. Changed users are evicted from this process's
+cache on commit. Other worker processes notice once their entry expires,
+after at most USER_CACHE_TTL seconds.
+"""
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from app import db
+
+
+class CachedUser(UserMixin):
+    """Stand-in for ``User`` built from cached fields; loads the row on demand"""
+
+    def __init__(self, id, username, is_admin, auth_version):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+        self.auth_version = auth_version
+        self._row = None
+
+    def get_id(self):
+        return f'{self.id}:{self.auth_version}'
+
+    def __getattr__(self, name):
+        # Only called for attributes not set above
+        if name.startswith('__') or name == '_row':
+            raise AttributeError(name)
+        if self._row is None:
+            from app.models import User
+            self._row = db.session.get(User, self.id)
+        return getattr(self._row, name)
+
+
+class IdentityCache:
+    """Thread-safe TTL cache of ``(id, username, is_admin, auth_version)``"""
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, fields):
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                self.entries.clear()
+            self.entries[user_id] = (time.monotonic() + self.ttl, fields)
+
+    def evict(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+
+def parse_session_id(value):
+    """Split ``<id>:<auth_version>``; returns None for malformed or legacy ids"""
+    try:
+        user_id, version = value.split(':')
+        return int(user_id), int(version)
+    except (AttributeError, ValueError):
+        return None
+
+
+def load_user(value):
+    """Flask-Login user loader backed by the identity cache"""
+    from app.models import User
+
+    parsed = parse_session_id(value)
+    if parsed is None:
+        return None
+    user_id, version = parsed
+
+    cache = current_app.extensions['identity_cache']
+    fields = cache.get(user_id)
+    if fields is None:
+        row = db.session.query(User.id, User.username, User.is_admin, User.auth_version).filter_by(id=user_id).first()
+        if row is None:
+            return None
+        fields = tuple(row)
+        cache.set(user_id, fields)
+
+    # A password or permission change since login ends the session
+    if fields[3] != version:
+        return None
+    return CachedUser(*fields)
+
+
+def _collect_changed_users(session, flush_context, instances):
+    from app.models import User
+
+    changed = session.info.setdefault('identity_changed', set())
+    for obj in session.dirty | session.deleted:
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+def _evict_changed_users(session):
+    changed = session.info.pop('identity_changed', set())
+    if changed and has_app_context():
+        cache = current_app.extensions.get('identity_cache')
+        if cache is not None:
+            for user_id in changed:
+                cache.evict(user_id)
+
+
+def _discard_changed_users(session):
+    session.info.pop('identity_changed', None)
+
+
+def init_app(app):
+    """Set up the identity cache and keep it in step with the users table"""
+    app.extensions['identity_cache'] = IdentityCache(app.config['USER_CACHE_TTL'])
+
+    session_class = db.session.session_factory.class_
+    if not event.contains(session_class, 'before_flush', _collect_changed_users):
+        event.listen(session_class, 'before_flush', _collect_changed_users)
+        event.listen(session_class, 'after_commit', _evict_changed_users)
+        event.listen(session_class, 'after_rollback', _discard_changed_users)
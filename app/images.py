@@ -0,0 +1,143 @@
+"""
+Cover image pipeline.
+
+Uploaded covers are resized into a few widths, each stored as WebP and JPEG
+under img/books/sizes/ in the configured storage, plus a tiny blurred placeholder that is inlined
+as a data URI. Resizing is CPU-bound, so it runs in a process pool and the
+resulting widths are written back to the book once the job finishes.
+"""
+
+import base64
+import io
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+from flask import current_app
+from PIL import Image, ImageFilter
+from app import db
+from app.models import Book
+from app.storage import create_storage, storage_settings
+
+VARIANTS_FOLDER = 'img/books/sizes'
+PLACEHOLDER_WIDTH = 16
+
+_executor = None
+
+
+def variant_path(cover_image, width, ext):
+    """Relative path of one resized variant of a cover"""
+    stem = os.path.splitext(os.path.basename(cover_image))[0]
+    return f"{VARIANTS_FOLDER}/{stem}-{width}.{ext}"
+
+
+def _save_image(storage, image, path, image_format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **params)
+    buffer.seek(0)
+    storage.save(path, buffer)
+
+
+def generate_cover_variants(settings, cover_image, widths, quality=80):
+    """Resize a cover into every width and build its blur placeholder
+
+    Runs inside a worker process, so it builds its own storage backend from
+    ``settings`` and returns plain data.
+    """
+    storage = create_storage(settings)
+    with storage.open(cover_image) as f:
+        data = f.read()
+    with Image.open(io.BytesIO(data)) as source:
+        image = source.convert('RGB')
+
+    # Never upscale; a small original still gets its own width
+    generated = sorted({min(width, image.width) for width in widths})
+    for width in generated:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        _save_image(storage, resized, variant_path(cover_image, width, 'webp'),
+                    'WEBP', quality=quality, method=4)
+        _save_image(storage, resized, variant_path(cover_image, width, 'jpg'),
+                    'JPEG', quality=quality, optimize=True, progressive=True)
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'JPEG', quality=40)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    return {
+        'cover_variants': ','.join(str(width) for width in generated),
+        'cover_placeholder': placeholder
+    }
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=app.config['IMAGE_WORKERS'])
+    return _executor
+
+
+def _store_variants(app, book_id, cover_image, result):
+    with app.app_context():
+        # Skip if the cover was replaced while the job was running
+        Book.query.filter_by(id=book_id, cover_image=cover_image).update(result, synchronize_session=False)
+        db.session.commit()
+
+
+def enqueue_cover_processing(book):
+    """Generate responsive variants for a book's cover in the background"""
+    if not book.cover_image:
+        return
+
+    app = current_app._get_current_object()
+    args = (storage_settings(app), book.cover_image, app.config['COVER_IMAGE_WIDTHS'])
+
+    book_id, cover_image = book.id, book.cover_image
+
+    def on_done(future):
+        # A broken cover only loses its variants; the original is still served
+        try:
+            _store_variants(app, book_id, cover_image, future.result())
+        except Exception:
+            app.logger.exception('Cover processing failed for book %s', book_id)
+
+    if app.config['IMAGE_PROCESSING_INLINE']:
+        future = Future()
+        try:
+            future.set_result(generate_cover_variants(*args))
+        except Exception as e:
+            future.set_exception(e)
+        on_done(future)
+        return
+
+    _get_executor(app).submit(generate_cover_variants, *args).add_done_callback(on_done)
+
+
+def backfill_cover_variants(workers=None, force=False):
+    """Generate variants for every existing cover; returns (processed, failed)"""
+    app = current_app._get_current_object()
+    settings = storage_settings(app)
+    widths = app.config['COVER_IMAGE_WIDTHS']
+
+    query = db.session.query(Book.id, Book.cover_image).filter(Book.cover_image.isnot(None))
+    if not force:
+        query = query.filter(Book.cover_variants.is_(None))
+    books = query.all()
+
+    processed = failed = 0
+    with ProcessPoolExecutor(max_workers=workers or app.config['IMAGE_WORKERS']) as executor:
+        futures = {
+            executor.submit(generate_cover_variants, settings, cover_image, widths): (book_id, cover_image)
+            for book_id, cover_image in books
+        }
+        for future in as_completed(futures):
+            book_id, cover_image = futures[future]
+            try:
+                _store_variants(app, book_id, cover_image, future.result())
+                processed += 1
+            except Exception as e:
+                app.logger.warning('Could not process cover for book %s: %s', book_id, e)
+                failed += 1
+
+    return processed, failed
@@ -1,7 +1,8 @@
 from app import db
 from datetime import datetime
 from flask_login import UserMixin
-import bcrypt
+from sqlalchemy import func, select
+from app.passwords import hash_password, verify_password, needs_rehash
 
 
 class User(UserMixin, db.Model):
@@ -13,26 +14,51 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     full_name = db.Column(db.String(120))
     is_admin = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_login = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)  # Written behind by app.activity
+    auth_version = db.Column(db.Integer, nullable=False, default=1)  # Bumped to end existing sessions
     
     # Relationships
-    reviews = db.relationship('Review', backref='user', lazy='dynamic', cascade='all, delete-orphan')
-    orders = db.relationship('Order', backref='user', lazy='dynamic', cascade='all, delete-orphan')
-    cart_items = db.relationship('CartItem', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    # Write-only: query them with .select(); children go with ON DELETE CASCADE
+    reviews = db.relationship('Review', backref='user', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
+    orders = db.relationship('Order', backref='user', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
+    cart_items = db.relationship('CartItem', backref='user', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Hash password using bcrypt"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        if self.password_hash is not None:
+            self.auth_version = (self.auth_version or 1) + 1
+        self.password_hash = hash_password(password)
+    
+    def rehash_password(self, password):
+        """Re-hash the same password at the configured cost, keeping sessions valid"""
+        self.password_hash = hash_password(password)
+    
+    def get_id(self):
+        """Session id carrying the auth version, see app.identity"""
+        return f'{self.id}:{self.auth_version or 1}'
     
     def check_password(self, password):
         """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return verify_password(password, self.password_hash)
+    
+    @property
+    def password_needs_rehash(self):
+        """Whether the stored hash predates the configured bcrypt cost"""
+        return needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 
+@db.event.listens_for(User.is_admin, 'set')
+def _bump_auth_version(user, value, oldvalue, initiator):
+    """Changing the admin flag ends the user's existing sessions"""
+    if user.id is not None and oldvalue is not None and value != oldvalue:
+        user.auth_version = (user.auth_version or 1) + 1
+
+
 class Category(db.Model):
     __tablename__ = 'categories'
     
@@ -41,7 +67,7 @@ class Category(db.Model):
     description = db.Column(db.Text)
     
     # Relationships
-    books = db.relationship('Book', backref='category', lazy='dynamic')
+    books = db.relationship('Book', backref='category', lazy='write_only')
     
     def __repr__(self):
         return f'<Category {self.name}>'
@@ -54,64 +80,132 @@ class Book(db.Model):
     title = db.Column(db.String(200), nullable=False, index=True)
     author = db.Column(db.String(100), nullable=False, index=True)
     isbn = db.Column(db.String(13), unique=True)
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text), group='wide')  # Unbounded; loaded only where it's shown
     price = db.Column(db.Numeric(10, 2), nullable=False)
     file_format = db.Column(db.String(10), default='PDF')  # PDF or ePub
     file_path = db.Column(db.String(255))  # Path to the actual file
     cover_image = db.Column(db.String(255))
+    cover_variants = db.Column(db.String(100))  # Comma-separated widths generated by app.images
+    cover_placeholder = db.deferred(db.Column(db.Text), group='wide')  # Tiny blurred cover as a data URI
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime)  # Hidden from the store; hard-deleted later by app.purge
     
     # Relationships
-    reviews = db.relationship('Review', backref='book', lazy='dynamic', cascade='all, delete-orphan')
-    order_items = db.relationship('OrderItem', backref='book', lazy='dynamic')
-    cart_items = db.relationship('CartItem', backref='book', lazy='dynamic', cascade='all, delete-orphan')
+    reviews = db.relationship('Review', backref='book', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
+    order_items = db.relationship('OrderItem', backref='book', lazy='write_only', passive_deletes=True)  # Ordered books can't be deleted
+    cart_items = db.relationship('CartItem', backref='book', lazy='write_only', cascade='all, delete-orphan', passive_deletes=True)
+    
+    # Storefront listings: live books (deleted_at IS NULL) by date or price, optionally in one category
+    __table_args__ = (
+        db.Index('ix_books_deleted_at_created_at', 'deleted_at', 'created_at'),
+        db.Index('ix_books_deleted_at_price', 'deleted_at', 'price'),
+        db.Index('ix_books_category_deleted_at_created_at', 'category_id', 'deleted_at', 'created_at'),
+    )
+    
+    @classmethod
+    def available(cls):
+        """Query for books still on sale"""
+        return cls.query.filter(cls.deleted_at.is_(None))
+    
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+    
+    @staticmethod
+    def card_options():
+        """Loader options for book cards: only the columns a card shows, and its category"""
+        return (
+            db.load_only(Book.title, Book.author, Book.price, Book.cover_image, Book.cover_variants,
+                         Book.cover_placeholder, Book.category_id),
+            db.joinedload(Book.category)
+        )
+    
+    @staticmethod
+    def rating_stats(book_ids):
+        """``{book_id: (average rating, review count)}`` from one grouped query"""
+        if not book_ids:
+            return {}
+        return {
+            book_id: (float(average), count) for book_id, average, count in db.session.execute(
+                select(Review.book_id, func.avg(Review.rating), func.count(Review.id))
+                .where(Review.book_id.in_(book_ids))
+                .group_by(Review.book_id)
+            )
+        }
+    
+    @staticmethod
+    def load_ratings(books):
+        """Attach rating stats to many books at once"""
+        books = list(books)
+        stats = Book.rating_stats([book.id for book in books])
+        for book in books:
+            book._ratings = stats.get(book.id, (0, 0))
+        return books
+    
+    def _rating_stats(self):
+        if '_ratings' not in self.__dict__:
+            Book.load_ratings([self])
+        return self._ratings
     
     @property
     def average_rating(self):
-        """Calculate average rating from reviews"""
-        reviews = self.reviews.all()
-        if not reviews:
-            return 0
-        return sum(r.rating for r in reviews) / len(reviews)
+        """Average review rating, 0 without reviews"""
+        return self._rating_stats()[0]
     
     @property
     def review_count(self):
         """Get total number of reviews"""
-        return self.reviews.count()
+        return self._rating_stats()[1]
+    
+    @property
+    def cover_widths(self):
+        """Widths of the resized cover variants, smallest first"""
+        if not self.cover_variants:
+            return []
+        return [int(width) for width in self.cover_variants.split(',')]
+    
+    @staticmethod
+    def api_dict(book, category, ratings):
+        """JSON form of a book, from a Book or a row with the same column names"""
+        return {
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'isbn': book.isbn,
+            'description': book.description,
+            'price': float(book.price),
+            'file_format': book.file_format,
+            'category': category,
+            'average_rating': ratings[0],
+            'review_count': ratings[1],
+            'created_at': book.created_at.isoformat()
+        }
     
     def __repr__(self):
         return f'<Book {self.title}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'author': self.author,
-            'isbn': self.isbn,
-            'description': self.description,
-            'price': float(self.price),
-            'file_format': self.file_format,
-            'category': self.category.name if self.category else None,
-            'average_rating': self.average_rating,
-            'review_count': self.review_count,
-            'created_at': self.created_at.isoformat()
-        }
+        return Book.api_dict(self, self.category.name if self.category else None, self._rating_stats())
 
 
 class Review(db.Model):
     __tablename__ = 'reviews'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Ensure one review per user per book
-    __table_args__ = (db.UniqueConstraint('user_id', 'book_id', name='unique_user_book_review'),)
+    # One review per user per book; newest-first pages per book and per user
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'book_id', name='unique_user_book_review'),
+        db.Index('ix_reviews_book_created_at', 'book_id', 'created_at'),
+        db.Index('ix_reviews_user_created_at', 'user_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<Review {self.id} by User {self.user_id}>'
@@ -121,7 +215,7 @@ class Order(db.Model):
     __tablename__ = 'orders'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     order_number = db.Column(db.String(20), unique=True, nullable=False, index=True)
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)
     status = db.Column(db.String(20), default='completed')  # completed, pending, cancelled
@@ -129,7 +223,17 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    order_items = db.relationship('OrderItem', backref='order', lazy='dynamic', cascade='all, delete-orphan')
+    # A plain collection, so handlers can selectinload it
+    order_items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan', passive_deletes=True)
+    
+    # Admin order list filters: by status, by customer, or just by date, newest first
+    __table_args__ = (
+        db.Index('ix_orders_status_created_at', 'status', 'created_at'),
+        db.Index('ix_orders_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_orders_created_at', 'created_at'),
+        # Covers the per-user totals in the admin user directory
+        db.Index('ix_orders_user_spend', 'user_id', 'status', 'total_amount', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<Order {self.order_number}>'
@@ -148,10 +252,13 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False, index=True)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)  # Price at time of purchase
     
+    # Purchase checks look up a book's items, then their orders
+    __table_args__ = (db.Index('ix_order_items_book_order', 'book_id', 'order_id'),)
+    
     def __repr__(self):
         return f'<OrderItem {self.id}>'
 
@@ -160,8 +267,8 @@ class CartItem(db.Model):
     __tablename__ = 'cart_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False, index=True)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Ensure one cart item per user per book
@@ -174,3 +281,82 @@ class CartItem(db.Model):
     
     def __repr__(self):
         return f'<CartItem {self.id}>'
+
+
+class FileUpload(db.Model):
+    __tablename__ = 'file_uploads'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, handed to the client
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # book or cover
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)  # Relative to static/, final location
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_size = db.Column(db.BigInteger, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, attached
+    storage_token = db.Column(db.String(255))  # Backend upload handle, e.g. an S3 multipart UploadId
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'kind': self.kind,
+            'filename': self.original_filename,
+            'size': self.total_size,
+            'offset': self.received_size,
+            'status': self.status
+        }
+    
+    def __repr__(self):
+        return f'<FileUpload {self.id} {self.received_size}/{self.total_size}>'
+
+
+class FileDeletion(db.Model):
+    __tablename__ = 'file_deletions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    file_path = db.Column(db.String(255), nullable=False)  # Relative to static/
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FileDeletion {self.file_path}>'
+
+
+class DailySales(db.Model):
+    """Orders and revenue per day, maintained by app.rollups"""
+    __tablename__ = 'daily_sales'
+    
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    completed_orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)  # Completed orders only
+    
+    def __repr__(self):
+        return f'<DailySales {self.day}>'
+
+
+class DailyBookSales(db.Model):
+    """Copies sold per book per day, maintained by app.rollups"""
+    __tablename__ = 'daily_book_sales'
+    
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True, index=True)  # No FK: sales history outlives deleted books
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyBookSales {self.day} book {self.book_id}>'
+
+
+class DailyRegistrations(db.Model):
+    """New users per day, maintained by app.rollups"""
+    __tablename__ = 'daily_registrations'
+    
+    day = db.Column(db.Date, primary_key=True)
+    users = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyRegistrations {self.day}>'
@@ -0,0 +1,163 @@
+"""
+Password hashing on a bounded thread pool.
+
+bcrypt is deliberately slow, about 250ms at cost 12. bcrypt releases the GIL
+while it hashes, so the work runs on a small dedicated pool. This caps how
+many cores a login storm can take, and leaves the request threads free to
+serve the catalog. Each pool admits at most BCRYPT_WORKERS +
+BCRYPT_MAX_QUEUE jobs at a time. Beyond that, callers get PasswordHasherBusy
+straight away instead of piling up behind the queue, and a job that waits
+longer than BCRYPT_TIMEOUT is abandoned with the same error.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+from flask import current_app
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many hashing jobs are queued; the caller should retry later"""
+
+
+class PasswordHasher:
+    """Runs bcrypt jobs on a fixed-size pool with a bounded queue"""
+
+    def __init__(self, workers, max_queue, timeout=None):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+        self.timeout = timeout
+        self.verify_time = None  # Moving average of real verifications, in seconds
+        self.counts_lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    @property
+    def queued(self):
+        """Jobs admitted but still waiting for a bcrypt thread"""
+        return max(0, self.in_flight - self.workers)
+
+    def _count(self, in_flight=0, rejected=0):
+        with self.counts_lock:
+            self.in_flight += in_flight
+            self.rejected += rejected
+
+    def _release(self, future):
+        self._count(in_flight=-1)
+        self.slots.release()
+
+    def run(self, fn, *args):
+        """Run ``fn`` on the pool and wait for its result"""
+        if not self.slots.acquire(blocking=False):
+            self._count(rejected=1)
+            raise PasswordHasherBusy()
+        self._count(in_flight=1)
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued, so drop it; a job already hashing finishes and frees its slot then
+            future.cancel()
+            raise PasswordHasherBusy() from None
+
+    def hash(self, password, rounds):
+        salt = bcrypt.gensalt(rounds=rounds)
+        return self.run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        started = time.perf_counter()
+        result = self.run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+        elapsed = time.perf_counter() - started
+        self.verify_time = elapsed if self.verify_time is None else 0.9 * self.verify_time + 0.1 * elapsed
+        return result
+
+    def calibrate(self, rounds):
+        """Seed the verification average by timing one check at ``rounds``
+
+        Runs in the calling thread rather than on the pool, so it is safe to
+        do before a pre-forking server starts its workers.
+        """
+        password_hash = bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds=rounds))
+        started = time.perf_counter()
+        bcrypt.checkpw(b'calibration', password_hash)
+        elapsed = time.perf_counter() - started
+        if self.verify_time is None:
+            self.verify_time = elapsed
+
+    def fake_verify(self, rounds):
+        """Take as long as a real verification without spending CPU on it"""
+        if self.verify_time is None:
+            # Normally seeded by init_app; covers hashers first used afterwards
+            self.calibrate(rounds)
+        time.sleep(self.verify_time)
+        return False
+
+
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def init_app(app):
+    """Calibrate the app's hasher so unknown-user logins cost a verify from the first one"""
+    _hasher_for(app.config).calibrate(app.config['BCRYPT_ROUNDS'])
+
+
+def _hasher_for(config):
+    key = (
+        config['BCRYPT_WORKERS'] or os.cpu_count() or 1,
+        config['BCRYPT_MAX_QUEUE'],
+        config['BCRYPT_TIMEOUT']
+    )
+    with _hashers_lock:
+        if key not in _hashers:
+            _hashers[key] = PasswordHasher(*key)
+        return _hashers[key]
+
+
+def get_hasher():
+    """Process-wide hasher for the current app's pool settings"""
+    return _hasher_for(current_app.config)
+
+
+def hasher_stats():
+    """``(queued jobs, rejected jobs)`` summed over this process's hashers"""
+    with _hashers_lock:
+        hashers = list(_hashers.values())
+    return sum(h.queued for h in hashers), sum(h.rejected for h in hashers)
+
+
+def hash_password(password, rounds=None):
+    """Hash a password at the configured cost"""
+    return get_hasher().hash(password, rounds or current_app.config['BCRYPT_ROUNDS'])
+
+
+def verify_password(password, password_hash):
+    """Check a password against a stored bcrypt hash"""
+    return get_hasher().verify(password, password_hash)
+
+
+def fake_verify_password():
+    """Constant-cost stand-in for checking the password of an unknown user"""
+    return get_hasher().fake_verify(current_app.config['BCRYPT_ROUNDS'])
+
+
+def hash_rounds(password_hash):
+    """Cost factor stored in a bcrypt hash, e.g. 12 for ``$2b$12$...``"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    """Whether a stored hash was made at a different cost than configured"""
+    return hash_rounds(password_hash) != current_app.config['BCRYPT_ROUNDS']
@@ -0,0 +1,358 @@
+"""
+Prometheus metrics at ``/metrics``.
+
+Each worker process keeps its own counters, gauges and histograms:
+- request latency by endpoint, method and status
+- connection pool checkouts, time waited for a connection, new
+  connections, checkout timeouts and connections in use
+- identity and dashboard cache hits and misses
+- Stripe call latency
+- bcrypt queue depth and rejections
+- download bytes served by the app
+
+Behind gunicorn, each scrape reaches a single worker. So when
+PROMETHEUS_MULTIPROC_DIR is set, every worker writes a JSON snapshot
+there at most every PROMETHEUS_FLUSH_INTERVAL seconds, and the worker
+that answers the scrape merges all of them. Counters and histograms are
+summed over every file, including those of workers that have exited, so
+totals never go backwards. Gauges are summed over live processes only.
+Empty the directory when the service is redeployed. Without a directory
+the endpoint reports the answering process alone.
+
+The endpoint answers any client that sends ``Authorization: Bearer
+<PROMETHEUS_TOKEN>``, and without a token clients in
+PROMETHEUS_ALLOWED_NETWORKS, which is empty by default. Everyone else gets
+403. The network check uses ``request.remote_addr``; behind a proxy on the
+same host that is 127.0.0.1 for every client, so only allow networks once
+PROXY_HOPS makes it the real client address.
+"""
+
+import glob
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Response, abort, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'cyberbooks_http_request_duration_seconds': ('histogram', 'Request latency by endpoint, method and status', LATENCY_BUCKETS),
+    'cyberbooks_db_pool_checkouts_total': ('counter', 'Connections checked out of the pool', None),
+    'cyberbooks_db_pool_connects_total': ('counter', 'New database connections opened by the pool', None),
+    'cyberbooks_db_pool_timeouts_total': ('counter', 'Requests that gave up waiting for a pooled connection', None),
+    'cyberbooks_db_pool_checkout_wait_seconds': ('histogram', 'Time to get a connection from the pool, including opening one', LATENCY_BUCKETS),
+    'cyberbooks_db_pool_checked_out': ('gauge', 'Connections currently checked out', None),
+    'cyberbooks_db_pool_overflow': ('gauge', 'Connections open beyond pool_size', None),
+    'cyberbooks_cache_requests_total': ('counter', 'Cache lookups by cache and result', None),
+    'cyberbooks_payment_gateway_duration_seconds': ('histogram', 'Stripe API call latency by operation and outcome', LATENCY_BUCKETS),
+    'cyberbooks_bcrypt_queue_depth': ('gauge', 'Password hashing jobs waiting for a bcrypt thread', None),
+    'cyberbooks_bcrypt_rejected_total': ('counter', 'Password hashing jobs refused because the queue was full', None),
+    'cyberbooks_downloads_total': ('counter', 'Book downloads by delivery: served by the app or redirected to storage', None),
+    'cyberbooks_download_bytes_total': ('counter', 'Book file bytes served by the app', None),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+class Registry:
+    """This process's metric values, plus collectors that read values kept elsewhere"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collectors = []
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def _check_fork(self):
+        # A worker forked from a preloaded master starts from zero, not the master's copy
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels=None, amount=1):
+        with self.lock:
+            self._check_fork()
+            self.counters[_key(name, labels)] += amount
+
+    def observe(self, name, labels, value):
+        """Add ``value`` to a histogram; bucket counts are stored cumulatively"""
+        buckets = METRICS[name][2]
+        with self.lock:
+            self._check_fork()
+            series = self.histograms.setdefault(_key(name, labels), [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the block's duration, labelled with ``outcome`` ok or error"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            self.observe(name, {**labels, 'outcome': outcome}, time.perf_counter() - started)
+
+    def snapshot(self):
+        """JSON-ready ``{'counter': [...], 'gauge': [...], 'histogram': [...]}`` of this process"""
+        with self.lock:
+            self._check_fork()
+            values = {'counter': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                      'gauge': [],
+                      'histogram': [[name, dict(labels), series] for (name, labels), series in self.histograms.items()]}
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                values[METRICS[name][0]].append([name, labels, value])
+        return values
+
+
+class ProcessFiles:
+    """Snapshots of every worker's registry in a shared directory"""
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.pid = None
+        self.started = None
+        self.last_flush = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self):
+        # Stamped when each process first writes, not inherited from a preloaded master,
+        # so a worker that reuses a dead worker's pid doesn't overwrite its totals
+        if os.getpid() != self.pid:
+            self.pid = os.getpid()
+            self.started = time.time_ns()
+        return os.path.join(self.directory, f'{self.pid}-{self.started}.json')
+
+    def flush(self, registry, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = now
+        path = self._path()
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def load(self):
+        """``[(snapshot, alive)]`` for every worker that has written one"""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removed or half-written between listing and reading
+            snapshots.append((snapshot, _alive(int(os.path.basename(path).split('-')[0]))))
+        return snapshots
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge(snapshots):
+    """Sum snapshots into ``{name: {labels: value or histogram series}}``"""
+    merged = defaultdict(dict)
+    for snapshot, alive in snapshots:
+        for kind in ('counter', 'histogram', 'gauge'):
+            if kind == 'gauge' and not alive:
+                continue
+            for name, labels, value in snapshot.get(kind, []):
+                labels = tuple(sorted(labels.items()))
+                current = merged[name].get(labels)
+                if kind == 'histogram':
+                    merged[name][labels] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    merged[name][labels] = value + (current or 0)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    """Prometheus text exposition format"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in sorted(merged.get(name, {}).items()):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {value[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def get_registry():
+    return current_app.extensions['prometheus']
+
+
+def observe_payment(operation):
+    """Time a Stripe call: ``with observe_payment('create_intent'): ...``"""
+    return get_registry().timer('cyberbooks_payment_gateway_duration_seconds', operation=operation)
+
+
+def count_download(delivery, size=None):
+    """Count a book download, and the bytes when the app serves them itself"""
+    registry = get_registry()
+    registry.inc('cyberbooks_downloads_total', {'delivery': delivery})
+    if size:
+        registry.inc('cyberbooks_download_bytes_total', amount=size)
+
+
+def _allowed(config):
+    token = config['PROMETHEUS_TOKEN']
+    # Compared as bytes: compare_digest rejects non-ASCII str, which anyone can send
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in config['PROMETHEUS_ALLOWED_NETWORKS'])
+
+
+def metrics():
+    """Merged metrics of every worker, for Prometheus to scrape"""
+    if not _allowed(current_app.config):
+        abort(403)
+    registry = get_registry()
+    files = current_app.extensions.get('prometheus_files')
+    if files is None:
+        snapshots = [(registry.snapshot(), True)]
+    else:
+        files.flush(registry, force=True)
+        snapshots = files.load()
+    return Response(render(merge(snapshots)), mimetype='text/plain; version=0.0.4')
+
+
+def _pool_collector(app):
+    def collect():
+        with app.app_context():
+            engines = dict(db.engines)
+        samples = []
+        for bind, engine in engines.items():
+            labels = {'bind': bind or 'default'}
+            if hasattr(engine.pool, 'checkedout'):
+                samples.append(('cyberbooks_db_pool_checked_out', labels, engine.pool.checkedout()))
+                samples.append(('cyberbooks_db_pool_overflow', labels, max(0, engine.pool.overflow())))
+        return samples
+    return collect
+
+
+def _cache_collector(app):
+    def collect():
+        samples = []
+        for cache, extension in (('identity', 'identity_cache'), ('dashboard_metrics', 'metrics_cache')):
+            store = app.extensions.get(extension)
+            if store is not None:
+                samples.append(('cyberbooks_cache_requests_total', {'cache': cache, 'result': 'hit'}, store.hits))
+                samples.append(('cyberbooks_cache_requests_total', {'cache': cache, 'result': 'miss'}, store.misses))
+        return samples
+    return collect
+
+
+def _bcrypt_collector():
+    from app.passwords import hasher_stats
+
+    queued, rejected = hasher_stats()
+    return [('cyberbooks_bcrypt_queue_depth', {}, queued), ('cyberbooks_bcrypt_rejected_total', {}, rejected)]
+
+
+def _time_checkouts(registry, engine, labels):
+    # The pool has no event for the start of a checkout, so wrap its connect().
+    # Engine.dispose() replaces the pool, hence the engine_disposed listener
+    connect = engine.pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            registry.observe('cyberbooks_db_pool_checkout_wait_seconds', labels, time.perf_counter() - started)
+
+    engine.pool.connect = timed_connect
+
+
+def init_app(app):
+    """Collect request, pool, cache and bcrypt metrics and serve them at /metrics"""
+    registry = Registry()
+    app.extensions['prometheus'] = registry
+    directory = app.config['PROMETHEUS_MULTIPROC_DIR']
+    files = ProcessFiles(directory, app.config['PROMETHEUS_FLUSH_INTERVAL']) if directory else None
+    if files is not None:
+        app.extensions['prometheus_files'] = files
+
+    registry.collectors += [_pool_collector(app), _cache_collector(app), _bcrypt_collector]
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            labels = {'bind': bind or 'default'}
+            event.listen(engine, 'checkout', lambda *args, labels=labels: registry.inc('cyberbooks_db_pool_checkouts_total', labels))
+            event.listen(engine, 'connect', lambda *args, labels=labels: registry.inc('cyberbooks_db_pool_connects_total', labels))
+            _time_checkouts(registry, engine, labels)
+            event.listen(engine, 'engine_disposed',
+                         lambda engine, labels=labels: _time_checkouts(registry, engine, labels))
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        if 'request_started' in g:
+            registry.observe('cyberbooks_http_request_duration_seconds', {
+                'endpoint': request.endpoint or 'unmatched',
+                'method': request.method,
+                'status': str(response.status_code)
+            }, time.perf_counter() - g.request_started)
+        if files is not None:
+            files.flush(registry)
+        return response
+
+    @app.teardown_request
+    def count_pool_timeouts(exc):
+        if isinstance(exc, PoolTimeoutError):
+            registry.inc('cyberbooks_db_pool_timeouts_total')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,86 @@
+"""
+Soft deletion of books and the off-peak purge that removes them for good.
+
+Deleting a book from the admin only stamps ``deleted_at``: the store stops
+listing it and drops it from carts, while buyers keep it in their library.
+``flask books purge``, run from cron, later hard-deletes books that were
+deleted more than BOOK_PURGE_AFTER ago and that no order references. It works
+in batches of BOOK_PURGE_BATCH_SIZE with a commit after each, and stops when
+the BOOK_PURGE_WINDOW hours end, so the cascading deletes stay out of busy
+hours. Their files go through the deletion queue in ``app.files``.
+"""
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, exists, insert, literal, select, union_all, update
+from app import db
+from app.files import process_deletions
+from app.models import Book, CartItem, FileDeletion, OrderItem
+
+
+def soft_delete_books(*conditions):
+    """Hide the live books matching ``conditions``; returns how many. The caller commits."""
+    live = (*conditions, Book.deleted_at.is_(None))
+    db.session.execute(delete(CartItem).where(CartItem.book_id.in_(select(Book.id).where(*live))))
+    result = db.session.execute(
+        update(Book).where(*live).values(deleted_at=datetime.utcnow()).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def restore_books(*conditions):
+    """Put deleted books matching ``conditions`` back on sale; returns how many"""
+    result = db.session.execute(
+        update(Book).where(*conditions, Book.deleted_at.isnot(None)).values(deleted_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def in_window(window, now=None):
+    """Whether the UTC hour of ``now`` falls in ``(start, end)``, which may wrap past midnight"""
+    start, end = window
+    hour = (now or datetime.utcnow()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def _purge_batch(book_ids):
+    files = union_all(
+        select(Book.file_path, literal(0)).where(Book.id.in_(book_ids), Book.file_path.isnot(None)),
+        select(Book.cover_image, literal(0)).where(Book.id.in_(book_ids), Book.cover_image.isnot(None))
+    ).subquery()
+    db.session.execute(insert(FileDeletion).from_select(['file_path', 'attempts'], select(files)))
+    # Reviews go with the rows through ON DELETE CASCADE
+    db.session.execute(delete(Book).where(Book.id.in_(book_ids)).execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+def purge_deleted_books(older_than=None, batch_size=None, window=None):
+    """Hard-delete unreferenced books deleted before the cutoff; returns (books, files) removed
+
+    ``window`` defaults to BOOK_PURGE_WINDOW; pass ``False`` to ignore it.
+    """
+    config = current_app.config
+    cutoff = datetime.utcnow() - (config['BOOK_PURGE_AFTER'] if older_than is None else older_than)
+    batch_size = batch_size or config['BOOK_PURGE_BATCH_SIZE']
+    window = config['BOOK_PURGE_WINDOW'] if window is None else window
+
+    purgeable = select(Book.id).where(
+        Book.deleted_at < cutoff,
+        ~exists().where(OrderItem.book_id == Book.id)
+    ).order_by(Book.id).limit(batch_size)
+
+    books = files = 0
+    while not window or in_window(window):
+        book_ids = db.session.scalars(purgeable).all()
+        if not book_ids:
+            break
+        _purge_batch(book_ids)
+        books += len(book_ids)
+
+        deleted, failed = process_deletions(batch_size=batch_size * 2)
+        files += deleted
+    return books, files
@@ -0,0 +1,113 @@
+"""
+EXPLAIN the queries the app runs on every page view and flag the slow plans.
+
+``HOT_QUERIES`` mirrors the statements behind the storefront, profile,
+purchase checks and the admin lists, with representative parameters.
+``explain`` asks the database for the plan and reports two problems: a
+table read without an index (``SCAN <table>`` on SQLite, ``type=ALL`` on
+MySQL, ``Seq Scan`` on PostgreSQL) and a sort the index order doesn't
+cover (a temp B-tree, ``Using filesort``, a ``Sort`` node), which makes a
+LIMIT query read every matching row first. Leading-wildcard title/author
+search can't use a B-tree index and is deliberately not listed.
+
+MySQL and PostgreSQL cost their plans, so on nearly empty tables they may
+choose a scan even when a usable index exists; run the check against a
+database with realistic data, or on SQLite in CI.
+"""
+
+import json
+import re
+
+from sqlalchemy import func, select
+from app import db
+from app.models import Book, CartItem, Order, OrderItem, Review, User
+
+HOT_QUERIES = {
+    'shop: newest': lambda: select(Book.id).where(Book.deleted_at.is_(None))
+        .order_by(Book.created_at.desc()).limit(12),
+    'shop: by price': lambda: select(Book.id).where(Book.deleted_at.is_(None))
+        .order_by(Book.price.asc()).limit(12),
+    'shop: category, newest': lambda: select(Book.id).where(Book.deleted_at.is_(None), Book.category_id == 1)
+        .order_by(Book.created_at.desc()).limit(12),
+    'book page: reviews': lambda: select(Review.id).where(Review.book_id == 1)
+        .order_by(Review.created_at.desc()).limit(10),
+    'book page: rating stats': lambda: select(Review.book_id, func.avg(Review.rating), func.count(Review.id))
+        .where(Review.book_id.in_([1, 2, 3])).group_by(Review.book_id),
+    'purchase check': lambda: select(OrderItem.id).join(Order, Order.id == OrderItem.order_id)
+        .where(Order.user_id == 1, OrderItem.book_id == 1, Order.status == 'completed').limit(1),
+    'profile: orders': lambda: select(Order.id).where(Order.user_id == 1)
+        .order_by(Order.created_at.desc()).limit(10),
+    'profile: reviews': lambda: select(Review.id).where(Review.user_id == 1)
+        .order_by(Review.created_at.desc()).limit(10),
+    'order items of orders': lambda: select(OrderItem.id).where(OrderItem.order_id.in_([1, 2, 3])),
+    'cart': lambda: select(CartItem.id).where(CartItem.user_id == 1),
+    'login': lambda: select(User.id).where(User.username == 'admin'),
+    'admin orders: by status': lambda: select(Order.id).where(Order.status == 'completed')
+        .order_by(Order.created_at.desc()).limit(20),
+    'admin orders: newest': lambda: select(Order.id).order_by(Order.created_at.desc()).limit(20),
+    'admin users: newest': lambda: select(User.id).order_by(User.created_at.desc(), User.id.desc()).limit(50),
+}
+
+
+def _problems_sqlite(connection, sql, parameters):
+    plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+    problems = []
+    for step in plan:
+        scan = re.match(r'SCAN (\w+)$', step)
+        if scan:
+            problems.append(f'full scan of {scan.group(1)}')
+        elif step.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            problems.append('sort')
+    return plan, problems
+
+
+def _problems_mysql(connection, sql, parameters):
+    rows = connection.exec_driver_sql(f'EXPLAIN {sql}', parameters).mappings().all()
+    plan = [f"{row['table']}: type={row['type']} key={row['key']} {row['Extra'] or ''}".strip() for row in rows]
+    problems = [f"full scan of {row['table']}" for row in rows if row['type'] == 'ALL']
+    problems += ['sort' for row in rows if 'Using filesort' in (row['Extra'] or '')]
+    return plan, problems
+
+
+def _problems_postgresql(connection, sql, parameters):
+    result = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}', parameters).scalar()
+    nodes = [(result if isinstance(result, list) else json.loads(result))[0]['Plan']]
+    plan, problems = [], []
+    while nodes:
+        node = nodes.pop()
+        plan.append(f"{node['Node Type']} {node.get('Relation Name', '')}".strip())
+        if node['Node Type'] == 'Seq Scan':
+            problems.append(f"full scan of {node['Relation Name']}")
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            problems.append('sort')
+        nodes.extend(node.get('Plans', []))
+    return plan, problems
+
+
+EXPLAINERS = {
+    'sqlite': _problems_sqlite,
+    'mysql': _problems_mysql,
+    'mariadb': _problems_mysql,
+    'postgresql': _problems_postgresql,
+}
+
+
+def explain_sql(connection, sql, parameters=None):
+    """``(plan lines, problems)`` for SQL in the driver's paramstyle; problems are full scans and sorts"""
+    explainer = EXPLAINERS.get(connection.dialect.name)
+    if explainer is None:
+        raise ValueError(f'EXPLAIN is not supported on {connection.dialect.name}')
+    return explainer(connection, sql, parameters)
+
+
+def explain(statement):
+    """``(plan lines, problems)`` for a SELECT"""
+    connection = db.session.connection()
+    # Inline the parameters so the statement runs as-is under every DBAPI paramstyle
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    return explain_sql(connection, sql)
+
+
+def audit(queries=None):
+    """EXPLAIN each hot query; returns ``[(name, plan, problems)]``"""
+    return [(name, *explain(build())) for name, build in (queries or HOT_QUERIES).items()]
@@ -0,0 +1,144 @@
+"""
+Per-request SQL statistics: query count, database time and N+1 detection.
+
+Cursor-level engine events time every statement. During a request they
+accumulate in ``g.query_stats``. When the response goes out, the totals
+are added as a ``Server-Timing`` entry, which browser dev tools show
+under Timing. They are also logged as one JSON line on the
+``app.query_stats`` logger: at INFO, or at WARNING when the request
+repeated a statement shape N_PLUS_ONE_THRESHOLD or more times. That
+repetition is the signature of a lazy load inside a loop.
+
+A statement's shape is its SQL with whitespace collapsed and expanded IN
+lists reduced to one placeholder. Parameters are never part of it, so two
+lookups by different ids share a shape.
+
+``capture_queries()`` collects the same statistics outside a request, for
+tests and benchmarks; see the ``query_budget`` fixture in tests/conftest.py.
+Every statement is also passed to the slow-query log in ``app.slow_queries``.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_IN_LIST = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+# Collectors active outside the request's own, innermost last
+_captures = []
+
+
+def fingerprint(statement):
+    """The shape of a statement, shared by every execution with other parameters"""
+    return _IN_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class QueryStats:
+    """Statements run and time spent in the database"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        """``[(shape, executions)]`` for shapes run at least ``threshold`` times, most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self):
+        lines = [f'{self.count} queries in {self.duration * 1000:.1f} ms']
+        lines += [f'{count:>4} x {shape}' for shape, count in self.shapes.most_common()]
+        return '\n'.join(lines)
+
+
+@contextmanager
+def capture_queries():
+    """Collect statistics for every statement run in this process while the block runs"""
+    stats = QueryStats()
+    _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        _captures.remove(stats)
+
+
+def _collectors():
+    collectors = list(_captures)
+    if has_app_context() and 'query_stats' in g:
+        collectors.append(g.query_stats)
+    return collectors
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_started'].pop()
+    # Connections with execution_options(query_stats=False) run the instrumentation's own queries
+    if context is not None and not context.execution_options.get('query_stats', True):
+        return
+    for stats in _collectors():
+        stats.record(statement, duration)
+    if has_app_context() and 'slow_query_log' in current_app.extensions:
+        current_app.extensions['slow_query_log'].record(conn.engine, statement, None if executemany else parameters, duration)
+
+
+def _discard_timer(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+
+def _report_request(response):
+    stats = g.pop('query_stats', None)
+    if stats is None or request.endpoint == 'static':
+        return response
+
+    config = current_app.config
+    if config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"')
+
+    repeated = stats.repeated(config['N_PLUS_ONE_THRESHOLD'])
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'queries': stats.count,
+        'db_ms': round(stats.duration * 1000, 2),
+        'n_plus_one': [{'statement': shape, 'count': count} for shape, count in repeated]
+    }
+    logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record))
+    return response
+
+
+def init_app(app):
+    """Time every statement and report the totals of each request"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _discard_timer)
+
+    app.before_request(_start_request)
+    app.after_request(_report_request)
@@ -0,0 +1,71 @@
+"""
+Read-replica routing for the read-only views.
+
+When DATABASE_REPLICA_URL is set it becomes the ``replica`` bind. Views
+decorated with ``use_replica`` send their SELECTs there; everything else
+(flushes, INSERT/UPDATE/DELETE, ``SELECT ... FOR UPDATE``, raw connections,
+CLI commands and background threads) stays on the primary.
+
+A replica lags the primary, so a client that just wrote would not see its
+own change on the next page. Any request that writes stamps the Flask
+session, and for READ_YOUR_WRITES_WINDOW seconds afterwards that client's
+reads go to the primary as well. Within a request, reads after a write
+also go to the primary.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import CompoundSelect, Select, UpdateBase
+
+REPLICA_BIND = 'replica'
+WRITE_STAMP_KEY = '_db_write_at'
+
+
+class RoutingSession(Session):
+    """Session that sends a replica view's SELECTs to the ``replica`` bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.db_wrote = True
+            elif _reads_from_replica(clause) and REPLICA_BIND in self._db.engines:
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _reads_from_replica(clause):
+    if not g.get('db_replica') or g.get('db_wrote'):
+        return False
+    if isinstance(clause, Select):
+        return clause._for_update_arg is None
+    return isinstance(clause, CompoundSelect)
+
+
+def recently_wrote():
+    """Whether this client wrote within the read-your-writes window"""
+    written_at = session.get(WRITE_STAMP_KEY)
+    return written_at is not None and time.time() - written_at < current_app.config['READ_YOUR_WRITES_WINDOW']
+
+
+def use_replica(view):
+    """Serve a read-only view's queries from the replica, unless the client just wrote"""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if request.method in ('GET', 'HEAD') and not recently_wrote():
+            g.db_replica = True
+        return view(*args, **kwargs)
+    return decorated_function
+
+
+def _stamp_writes(response):
+    if g.get('db_wrote'):
+        session[WRITE_STAMP_KEY] = time.time()
+    return response
+
+
+def init_app(app):
+    """Stamp the session of clients whose request wrote to the primary"""
+    app.after_request(_stamp_writes)
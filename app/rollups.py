@@ -0,0 +1,226 @@
+"""
+Daily rollup tables behind the admin dashboard.
+
+``daily_sales``, ``daily_book_sales`` and ``daily_registrations`` are updated
+in the same transaction that creates orders, order items and users, or
+changes an order's status. An ``after_flush`` hook adds the deltas with one
+upsert per affected row. The dashboard therefore reads a handful of small
+rows instead of aggregating the full tables.
+
+Rollups record history. Deleting an order or user does not rewrite them;
+``flask rollups rebuild`` recomputes any date range from the source tables.
+Day bucketing happens in Python so the SQL stays portable.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, event, func, inspect, insert, select, update
+from app import db
+from app.models import Book, DailyBookSales, DailyRegistrations, DailySales, Order, OrderItem, User
+
+COMPLETED = 'completed'
+
+
+def _upsert_increment(connection, model, keys, deltas):
+    """Add ``deltas`` to the row identified by ``keys``, creating it if needed"""
+    table = model.__table__
+    values = {**keys, **deltas}
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in deltas}
+        )
+        connection.execute(stmt)
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table).values(values)
+        stmt = stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in deltas})
+        connection.execute(stmt)
+    else:
+        condition = and_(*(table.c[name] == value for name, value in keys.items()))
+        result = connection.execute(
+            update(table).where(condition).values({name: table.c[name] + value for name, value in deltas.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(values))
+
+
+def _day(value):
+    return (value or datetime.utcnow()).date()
+
+
+def _status_change(order):
+    """Previous and current status if the status changed in this flush"""
+    history = inspect(order).attrs.status.history
+    if history.has_changes() and history.deleted:
+        return history.deleted[0], order.status
+    return None
+
+
+def collect_deltas(session):
+    """Rollup changes implied by the objects in a flush"""
+    sales = defaultdict(lambda: {'orders': 0, 'completed_orders': 0, 'revenue': Decimal('0')})
+    book_sales = defaultdict(lambda: {'items_sold': 0, 'revenue': Decimal('0')})
+    registrations = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Order):
+            row = sales[_day(obj.created_at)]
+            row['orders'] += 1
+            if obj.status == COMPLETED:
+                row['completed_orders'] += 1
+                row['revenue'] += Decimal(str(obj.total_amount))
+        elif isinstance(obj, OrderItem):
+            order = session.get(Order, obj.order_id)
+            row = book_sales[(_day(order.created_at if order else None), obj.book_id)]
+            row['items_sold'] += 1
+            row['revenue'] += Decimal(str(obj.price))
+        elif isinstance(obj, User):
+            registrations[_day(obj.created_at)] += 1
+
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            change = _status_change(obj)
+            if change and (change[0] == COMPLETED) != (change[1] == COMPLETED):
+                sign = 1 if change[1] == COMPLETED else -1
+                row = sales[_day(obj.created_at)]
+                row['completed_orders'] += sign
+                row['revenue'] += sign * Decimal(str(obj.total_amount))
+
+    return sales, book_sales, registrations
+
+
+def _apply_deltas(session, flush_context):
+    sales, book_sales, registrations = collect_deltas(session)
+    if not (sales or book_sales or registrations):
+        return
+
+    connection = session.connection()
+    for day, deltas in sales.items():
+        _upsert_increment(connection, DailySales, {'day': day}, deltas)
+    for (day, book_id), deltas in book_sales.items():
+        _upsert_increment(connection, DailyBookSales, {'day': day, 'book_id': book_id}, deltas)
+    for day, count in registrations.items():
+        _upsert_increment(connection, DailyRegistrations, {'day': day}, {'users': count})
+
+
+def rebuild_rollups(start=None, end=None, batch_size=5000):
+    """Recompute rollups for days in ``[start, end]`` from the source tables
+
+    Returns the number of rollup rows written.
+    """
+    def in_range(column, query):
+        if start:
+            query = query.where(column >= datetime.combine(start, datetime.min.time()))
+        if end:
+            query = query.where(column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        return query
+
+    def stream(query):
+        return db.session.execute(query.execution_options(yield_per=batch_size))
+
+    sales = defaultdict(lambda: {'orders': 0, 'completed_orders': 0, 'revenue': Decimal('0')})
+    for created_at, status, amount in stream(in_range(Order.created_at, select(Order.created_at, Order.status, Order.total_amount))):
+        row = sales[_day(created_at)]
+        row['orders'] += 1
+        if status == COMPLETED:
+            row['completed_orders'] += 1
+            row['revenue'] += amount
+
+    book_sales = defaultdict(lambda: {'items_sold': 0, 'revenue': Decimal('0')})
+    items = select(Order.created_at, OrderItem.book_id, OrderItem.price).join(Order, Order.id == OrderItem.order_id)
+    for created_at, book_id, price in stream(in_range(Order.created_at, items)):
+        row = book_sales[(_day(created_at), book_id)]
+        row['items_sold'] += 1
+        row['revenue'] += price
+
+    registrations = defaultdict(int)
+    for (created_at,) in stream(in_range(User.created_at, select(User.created_at))):
+        registrations[_day(created_at)] += 1
+
+    for model in (DailySales, DailyBookSales, DailyRegistrations):
+        query = delete(model)
+        if start:
+            query = query.where(model.day >= start)
+        if end:
+            query = query.where(model.day <= end)
+        db.session.execute(query)
+
+    rows = [
+        (DailySales, [{'day': day, **values} for day, values in sales.items()]),
+        (DailyBookSales, [{'day': day, 'book_id': book_id, **values} for (day, book_id), values in book_sales.items()]),
+        (DailyRegistrations, [{'day': day, 'users': count} for day, count in registrations.items()])
+    ]
+    for model, values in rows:
+        if values:
+            db.session.execute(insert(model), values)
+    db.session.commit()
+    return sum(len(values) for model, values in rows)
+
+
+def month_starts(months, today=None):
+    """First day of each of the last ``months`` months, oldest first"""
+    today = today or datetime.utcnow().date()
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def _by_month(model, column, months):
+    starts = month_starts(months)
+    totals = {start.strftime('%Y-%m'): 0 for start in starts}
+    query = select(model.day, column).where(model.day >= starts[0])
+    for day, value in db.session.execute(query):
+        totals[day.strftime('%Y-%m')] += value
+    return list(totals.items())
+
+
+def sales_totals():
+    """All-time order count and completed revenue"""
+    orders, revenue = db.session.execute(
+        select(func.coalesce(func.sum(DailySales.orders), 0), func.coalesce(func.sum(DailySales.revenue), 0))
+    ).one()
+    return orders, revenue
+
+
+def total_registrations():
+    return db.session.execute(select(func.coalesce(func.sum(DailyRegistrations.users), 0))).scalar()
+
+
+def revenue_by_month(months=6):
+    return _by_month(DailySales, DailySales.revenue, months)
+
+
+def registrations_by_month(months=6):
+    return _by_month(DailyRegistrations, DailyRegistrations.users, months)
+
+
+def top_books(limit=5):
+    """Best-selling books by copies sold"""
+    sold = func.sum(DailyBookSales.items_sold).label('sales')
+    return db.session.execute(
+        select(Book.title, sold)
+        .join(Book, Book.id == DailyBookSales.book_id)
+        .group_by(Book.id, Book.title)
+        .order_by(sold.desc())
+        .limit(limit)
+    ).all()
+
+
+def init_app(app):
+    """Keep the rollups in step with every flush"""
+    session_class = db.session.session_factory.class_
+    if not event.contains(session_class, 'after_flush', _apply_deltas):
+        event.listen(session_class, 'after_flush', _apply_deltas)
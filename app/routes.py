@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, send_file, abort, current_app
 from flask_login import login_required, current_user
 from flask_wtf.csrf import CSRFProtect
-from sqlalchemy import or_
+from sqlalchemy import or_, select
+from sqlalchemy.orm import joinedload, selectinload, undefer_group
 from app import db
 from app.models import Book, Category, CartItem, Order, OrderItem, Review
 from app.forms import ReviewForm, CheckoutForm, SearchForm, BookForm
+from app.prometheus import count_download, observe_payment
+from app.replica import use_replica
+from app.storage import get_storage
 from datetime import datetime
 import os
 import json
@@ -15,9 +19,12 @@ csrf = CSRFProtect()
 
 
 @main_bp.route('/')
+@use_replica
 def index():
     """Home page with featured books"""
-    featured_books = Book.query.order_by(Book.created_at.desc()).limit(8).all()
+    featured_books = Book.available().options(*Book.card_options())\
+        .order_by(Book.created_at.desc()).limit(8).all()
+    Book.load_ratings(featured_books)
     categories = Category.query.all()
     return render_template('index.html', 
                          featured_books=featured_books,
@@ -26,12 +33,13 @@ def index():
 
 
 @main_bp.route('/shop')
+@use_replica
 def shop():
     """Shop page with search and filtering"""
     form = SearchForm(request.args, meta={'csrf': False})
     
-    # Base query
-    query = Book.query
+    # Base query: books still on sale
+    query = Book.available().options(*Book.card_options())
     
     # Search by keyword (title or author)
     search_term = request.args.get('query', '').strip()
@@ -80,6 +88,7 @@ def shop():
     # Pagination
     page = request.args.get('page', 1, type=int)
     books = query.paginate(page=page, per_page=12, error_out=False)
+    Book.load_ratings(books.items)
     
     # Get all categories for filter
     form.category.choices = [(0, 'All Categories')] + [(c.id, c.name) for c in Category.query.order_by(Category.name).all()]
@@ -91,15 +100,10 @@ def shop():
 
 
 @main_bp.route('/book/<int:book_id>')
+@use_replica
 def book_detail(book_id):
     """Book detail page"""
-    book = Book.query.get_or_404(book_id)
-    
-    # Paginate reviews
-    page = request.args.get('page', 1, type=int)
-    reviews = Review.query.filter_by(book_id=book_id).order_by(Review.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    book = Book.query.options(undefer_group('wide')).get_or_404(book_id)
     
     # Check if user has purchased this book
     has_purchased = False
@@ -110,6 +114,17 @@ def book_detail(book_id):
             Order.status == 'completed'
         ).first() is not None
     
+    # Deleted books stay visible to the people who bought them
+    if book.is_deleted and not has_purchased:
+        abort(404)
+    
+    # Paginate reviews
+    page = request.args.get('page', 1, type=int)
+    reviews = Review.query.options(joinedload(Review.user)).filter_by(book_id=book_id)\
+        .order_by(Review.created_at.desc()).paginate(
+        page=page, per_page=10, error_out=False
+    )
+    
     return render_template('book_detail.html', 
                          book=book, 
                          reviews=reviews,
@@ -162,7 +177,7 @@ def add_review(book_id):
 @login_required
 def cart():
     """View shopping cart"""
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_items = CartItem.query.options(joinedload(CartItem.book)).filter_by(user_id=current_user.id).all()
     
     total = sum(item.subtotal for item in cart_items)
     
@@ -176,7 +191,7 @@ def cart():
 @login_required
 def add_to_cart(book_id):
     """Add a book to cart"""
-    book = Book.query.get_or_404(book_id)
+    book = Book.available().filter_by(id=book_id).first_or_404()
     
     # Check if user has already purchased this book
     already_purchased = OrderItem.query.join(Order).filter(
@@ -223,7 +238,7 @@ def remove_from_cart(item_id):
 @login_required
 def checkout():
     """Checkout process with Stripe payment"""
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_items = CartItem.query.options(joinedload(CartItem.book)).filter_by(user_id=current_user.id).all()
     
     if not cart_items:
         flash('Your cart is empty.', 'warning')
@@ -265,17 +280,18 @@ def checkout():
             } for item in cart_items])
             
             # Create Stripe PaymentIntent (don't create order yet)
-            intent = stripe.PaymentIntent.create(
-                amount=int(total * 100),  # Convert to cents
-                currency='usd',
-                metadata={
-                    'user_id': current_user.id,
-                    'user_email': current_user.email,
-                    'user_name': current_user.full_name,
-                    'cart_data': cart_data,
-                    'total_amount': str(total)
-                }
-            )
+            with observe_payment('create_payment_intent'):
+                intent = stripe.PaymentIntent.create(
+                    amount=int(total * 100),  # Convert to cents
+                    currency='usd',
+                    metadata={
+                        'user_id': current_user.id,
+                        'user_email': current_user.email,
+                        'user_name': current_user.full_name,
+                        'cart_data': cart_data,
+                        'total_amount': str(total)
+                    }
+                )
             
             # Return response with payment intent client secret
             # Order will be created only after successful payment
@@ -293,7 +309,9 @@ def checkout():
 @login_required
 def order_confirmation(order_id):
     """Order confirmation page"""
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(
+        selectinload(Order.order_items).joinedload(OrderItem.book)
+    ).get_or_404(order_id)
     
     if order.user_id != current_user.id:
         abort(403)
@@ -307,13 +325,15 @@ def profile():
     """User profile page"""
     # Paginate orders
     orders_page = request.args.get('orders_page', 1, type=int)
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).paginate(
+    orders = Order.query.options(selectinload(Order.order_items)).filter_by(user_id=current_user.id)\
+        .order_by(Order.created_at.desc()).paginate(
         page=orders_page, per_page=10, error_out=False
     )
     
     # Paginate reviews
     reviews_page = request.args.get('reviews_page', 1, type=int)
-    reviews = Review.query.filter_by(user_id=current_user.id).order_by(Review.created_at.desc()).paginate(
+    reviews = Review.query.options(joinedload(Review.book)).filter_by(user_id=current_user.id)\
+        .order_by(Review.created_at.desc()).paginate(
         page=reviews_page, per_page=10, error_out=False
     )
     
@@ -345,11 +365,10 @@ def download_book(book_id):
         flash('This book file is not available for download.', 'warning')
         return redirect(url_for('main.profile'))
     
-    # Build full file path
-    file_full_path = os.path.join(current_app.root_path, 'static', book.file_path)
+    storage = get_storage()
     
     # Check if file actually exists
-    if not os.path.exists(file_full_path):
+    if not storage.exists(book.file_path):
         flash('Book file not found on server.', 'danger')
         return redirect(url_for('main.profile'))
     
@@ -365,20 +384,37 @@ def download_book(book_id):
     # Create download filename with book title
     download_filename = f"{book.title}{file_ext}"
     
-    # Serve the file
-    return send_file(
-        file_full_path,
+    # Remote storage hands out a short-lived URL so the bytes bypass the app
+    download_url = storage.download_url(book.file_path, download_filename, mimetype)
+    if download_url:
+        count_download('redirect')
+        return redirect(download_url)
+    
+    # Serve the file, streaming it if it isn't on the local disk
+    response = send_file(
+        storage.local_path(book.file_path) or storage.open(book.file_path),
         mimetype=mimetype,
         as_attachment=True,
         download_name=download_filename
     )
+    count_download('app', response.content_length)
+    return response
 
 
 @main_bp.route('/api/books')
+@use_replica
 def api_books():
     """API endpoint for books"""
-    books = Book.query.all()
-    return jsonify([book.to_dict() for book in books])
+    # Plain rows rather than Book objects: nothing here needs the ORM
+    rows = db.session.execute(
+        select(Book.id, Book.title, Book.author, Book.isbn, Book.description, Book.price, Book.file_format,
+               Category.name.label('category'), Book.created_at)
+        .outerjoin(Category, Book.category_id == Category.id)
+        .where(Book.deleted_at.is_(None))
+    ).all()
+    ratings = Book.rating_stats([row.id for row in rows])
+    
+    return jsonify([Book.api_dict(row, row.category, ratings.get(row.id, (0, 0))) for row in rows])
 
 
 @main_bp.route('/api/hello')
@@ -493,7 +529,8 @@ def payment_confirmation():
     
     try:
         # Retrieve payment intent from Stripe
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        with observe_payment('retrieve_payment_intent'):
+            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
         
         if payment_intent.status == 'succeeded':
             # Payment successful - now create the order
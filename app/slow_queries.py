@@ -0,0 +1,238 @@
+"""
+Slow-query log: latency percentiles and a sample plan per statement fingerprint.
+
+Every statement timed by ``app.query_stats`` is added to a per-process
+buffer under its fingerprint. The buffer keeps the call count, the total
+and maximum time, and a latency histogram with four buckets per doubling,
+which puts p50 and p95 within about 20%. Histograms add up, so the buffers
+of every worker merge into one SQLite file on local disk. The admin page
+and ``flask queries top`` read that file. A buffer is written after a
+request once SLOW_QUERY_FLUSH_INTERVAL seconds have passed.
+
+The first time a fingerprint takes longer than SLOW_QUERY_THRESHOLD_MS, its
+statement and parameters are kept as a sample. After the request, EXPLAIN
+runs once on that sample through ``app.query_audit``, which flags full
+scans and sorts. The stored plan shows which shop filters or dashboard
+aggregates stop using an index as the tables grow.
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app.query_audit import explain_sql
+from app.query_stats import fingerprint
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_PER_DOUBLING = 4
+SMALLEST_BUCKET_MS = 0.01
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+SORTS = ('total', 'p95', 'max', 'calls', 'mean')
+
+
+def latency_bucket(ms):
+    """Histogram bucket of a duration in milliseconds"""
+    if ms <= SMALLEST_BUCKET_MS:
+        return 0
+    return int(math.log2(ms / SMALLEST_BUCKET_MS) * BUCKETS_PER_DOUBLING)
+
+
+def bucket_limit(bucket):
+    """Upper bound of a histogram bucket in milliseconds"""
+    return SMALLEST_BUCKET_MS * 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING)
+
+
+def percentile(histogram, fraction, max_ms):
+    """Duration that ``fraction`` of the calls in ``{bucket: calls}`` stayed under"""
+    rank = math.ceil(sum(histogram.values()) * fraction)
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return min(bucket_limit(bucket), max_ms)
+    return max_ms
+
+
+class QueryLogStore:
+    """Per-fingerprint totals and histograms in a SQLite file shared by the host's workers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS statements (fingerprint TEXT PRIMARY KEY, calls INTEGER NOT NULL, '
+                'total_ms REAL NOT NULL, max_ms REAL NOT NULL, slow_calls INTEGER NOT NULL, last_seen REAL NOT NULL, '
+                'sample TEXT, plan TEXT)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS latencies (fingerprint TEXT NOT NULL, bucket INTEGER NOT NULL, '
+                'calls INTEGER NOT NULL, PRIMARY KEY (fingerprint, bucket))'
+            )
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def merge(self, entries):
+        """Add buffered ``{fingerprint: entry}`` totals in one transaction"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for shape, entry in entries.items():
+                conn.execute(
+                    'INSERT INTO statements (fingerprint, calls, total_ms, max_ms, slow_calls, last_seen) '
+                    'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (fingerprint) DO UPDATE SET '
+                    'calls = calls + excluded.calls, total_ms = total_ms + excluded.total_ms, '
+                    'max_ms = max(max_ms, excluded.max_ms), slow_calls = slow_calls + excluded.slow_calls, '
+                    'last_seen = excluded.last_seen',
+                    (shape, entry['calls'], entry['total_ms'], entry['max_ms'], entry['slow_calls'], now)
+                )
+                conn.executemany(
+                    'INSERT INTO latencies (fingerprint, bucket, calls) VALUES (?, ?, ?) '
+                    'ON CONFLICT (fingerprint, bucket) DO UPDATE SET calls = calls + excluded.calls',
+                    [(shape, bucket, calls) for bucket, calls in entry['histogram'].items()]
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def planned(self):
+        """Fingerprints that already have a sample plan"""
+        return {row[0] for row in self._connect().execute('SELECT fingerprint FROM statements WHERE plan IS NOT NULL')}
+
+    def save_plan(self, shape, sample, plan):
+        self._connect().execute(
+            'UPDATE statements SET sample = ?, plan = ? WHERE fingerprint = ?', (sample, json.dumps(plan), shape)
+        )
+
+    def top(self, sort='total', limit=20):
+        """The ``limit`` heaviest fingerprints by ``sort``, with their percentiles and plans"""
+        conn = self._connect()
+        histograms = {}
+        for shape, bucket, calls in conn.execute('SELECT fingerprint, bucket, calls FROM latencies'):
+            histograms.setdefault(shape, {})[bucket] = calls
+
+        rows = []
+        query = 'SELECT fingerprint, calls, total_ms, max_ms, slow_calls, last_seen, sample, plan FROM statements'
+        for shape, calls, total_ms, max_ms, slow_calls, last_seen, sample, plan in conn.execute(query):
+            histogram = histograms.get(shape, {})
+            rows.append({
+                'fingerprint': shape,
+                'calls': calls,
+                'total_ms': total_ms,
+                'mean_ms': total_ms / calls,
+                'p50_ms': percentile(histogram, 0.5, max_ms),
+                'p95_ms': percentile(histogram, 0.95, max_ms),
+                'max_ms': max_ms,
+                'slow_calls': slow_calls,
+                'last_seen': last_seen,
+                'sample': sample,
+                'plan': json.loads(plan) if plan else None
+            })
+        key = {'total': 'total_ms', 'p95': 'p95_ms', 'max': 'max_ms', 'calls': 'calls', 'mean': 'mean_ms'}[sort]
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM statements')
+        conn.execute('DELETE FROM latencies')
+
+
+class SlowQueryLog:
+    """Buffers statement timings and writes them, with sample plans, to the store"""
+
+    def __init__(self, store, threshold_ms, flush_interval):
+        self.store = store
+        self.threshold_ms = threshold_ms
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.samples = {}
+        self.planned = set()
+        self.last_flush = time.monotonic()
+
+    def record(self, engine, statement, parameters, duration):
+        """Add one execution; ``parameters`` is None for executemany, which is never explained"""
+        ms = duration * 1000
+        shape = fingerprint(statement)
+        with self.lock:
+            entry = self.entries.get(shape)
+            if entry is None:
+                entry = self.entries[shape] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow_calls': 0,
+                                               'histogram': Counter()}
+            entry['calls'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['histogram'][latency_bucket(ms)] += 1
+            if ms >= self.threshold_ms:
+                entry['slow_calls'] += 1
+                if (shape not in self.planned and shape not in self.samples and parameters is not None
+                        and statement.lstrip()[:6].upper().startswith(EXPLAINABLE)):
+                    self.samples[shape] = (engine, statement, parameters)
+
+    def flush(self, force=False):
+        """Write buffered timings if the interval has passed or a plan is waiting"""
+        with self.lock:
+            if not force and not self.samples and time.monotonic() - self.last_flush < self.flush_interval:
+                return
+            entries, samples = self.entries, self.samples
+            self.entries, self.samples = {}, {}
+            self.last_flush = time.monotonic()
+
+        if entries:
+            self.store.merge(entries)
+        if samples:
+            self.planned = self.store.planned()
+            for shape, sample in samples.items():
+                if shape not in self.planned:
+                    self._capture_plan(shape, *sample)
+
+    def _capture_plan(self, shape, engine, statement, parameters):
+        try:
+            with engine.connect() as connection:
+                plan, problems = explain_sql(connection.execution_options(query_stats=False), statement, parameters)
+        except (SQLAlchemyError, ValueError) as e:
+            logger.warning('Could not EXPLAIN a slow statement: %s', e)
+            plan, problems = [f'EXPLAIN failed: {e}'], []
+        self.store.save_plan(shape, statement, {'steps': plan, 'problems': problems})
+        self.planned.add(shape)
+
+
+def get_slow_query_log():
+    """The app's slow-query log, or None when SLOW_QUERY_LOG is off"""
+    return current_app.extensions.get('slow_query_log')
+
+
+def _flush_after_request(response):
+    current_app.extensions['slow_query_log'].flush()
+    return response
+
+
+def init_app(app):
+    """Set up the slow-query log when SLOW_QUERY_LOG is on"""
+    if not app.config['SLOW_QUERY_LOG']:
+        return
+    path = app.config['SLOW_QUERY_LOG_PATH'] or os.path.join(tempfile.gettempdir(), 'cyberbooks-queries.db')
+    app.extensions['slow_query_log'] = SlowQueryLog(
+        QueryLogStore(path),
+        app.config['SLOW_QUERY_THRESHOLD_MS'],
+        app.config['SLOW_QUERY_FLUSH_INTERVAL']
+    )
+    app.after_request(_flush_after_request)
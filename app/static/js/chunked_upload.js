@@ -0,0 +1,115 @@
+// Chunked, resumable uploads for the admin book form
+//
+// Large files are sent in checksummed chunks before the form is submitted.
+// The upload id is kept in localStorage so a retry after a network failure
+// resumes from the last chunk the server confirmed.
+
+(function() {
+    const form = document.querySelector('form[data-chunked-upload]');
+    if (!form) {
+        return;
+    }
+
+    const startUrl = form.dataset.chunkedUpload;
+    const csrfInput = form.querySelector('input[name="csrf_token"]');
+    const csrfToken = csrfInput ? csrfInput.value : '';
+
+    function headers(extra) {
+        return Object.assign({'X-CSRFToken': csrfToken}, extra || {});
+    }
+
+    async function sha256Hex(buffer) {
+        const digest = await crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest))
+            .map(b => b.toString(16).padStart(2, '0'))
+            .join('');
+    }
+
+    async function json(response) {
+        const data = await response.json();
+        if (!response.ok && response.status !== 409) {
+            throw new Error(data.error || 'Upload failed');
+        }
+        return data;
+    }
+
+    async function openUpload(file, kind) {
+        const resumeKey = `upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+        const savedId = localStorage.getItem(resumeKey);
+
+        if (savedId) {
+            const response = await fetch(`${startUrl}/${savedId}`, {headers: headers()});
+            if (response.ok) {
+                const upload = await response.json();
+                if (upload.status === 'pending' || upload.status === 'completed') {
+                    return {upload, resumeKey};
+                }
+            }
+            localStorage.removeItem(resumeKey);
+        }
+
+        const upload = await json(await fetch(startUrl, {
+            method: 'POST',
+            headers: headers({'Content-Type': 'application/json'}),
+            body: JSON.stringify({kind: kind, filename: file.name, size: file.size})
+        }));
+        localStorage.setItem(resumeKey, upload.upload_id);
+        return {upload, resumeKey};
+    }
+
+    async function uploadFile(input) {
+        const file = input.files[0];
+        const progress = input.parentElement.querySelector('.upload-progress');
+        const {upload, resumeKey} = await openUpload(file, input.dataset.uploadKind);
+        const chunkSize = upload.chunk_size || 8 * 1024 * 1024;
+        const url = `${startUrl}/${upload.upload_id}`;
+        let offset = upload.offset;
+
+        if (progress) {
+            progress.hidden = false;
+        }
+
+        while (offset < file.size) {
+            const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+            const result = await json(await fetch(`${url}?offset=${offset}`, {
+                method: 'PUT',
+                headers: headers({'X-Chunk-SHA256': await sha256Hex(chunk)}),
+                body: chunk
+            }));
+            // On a 409 the server tells us where to continue from
+            offset = result.offset;
+            if (progress) {
+                progress.value = Math.round(offset / file.size * 100);
+            }
+        }
+
+        await json(await fetch(`${url}/complete`, {method: 'POST', headers: headers()}));
+        localStorage.removeItem(resumeKey);
+
+        document.getElementById(input.dataset.uploadTarget).value = upload.upload_id;
+        // The bytes are already on the server; don't send them again
+        input.value = '';
+    }
+
+    form.addEventListener('submit', async function(event) {
+        const inputs = Array.from(form.querySelectorAll('input[type="file"][data-upload-kind]'))
+            .filter(input => input.files.length > 0);
+        if (inputs.length === 0) {
+            return;
+        }
+
+        event.preventDefault();
+        const submitButton = form.querySelector('button[type="submit"]');
+        submitButton.disabled = true;
+
+        try {
+            for (const input of inputs) {
+                await uploadFile(input);
+            }
+            form.submit();
+        } catch (error) {
+            alert(`${error.message}. Submit the form again to resume the upload.`);
+            submitButton.disabled = false;
+        }
+    });
+})();
@@ -0,0 +1,220 @@
+"""
+Pluggable storage for book files and covers.
+
+Paths are always relative keys such as ``books/<uuid>_name.pdf``. The local
+driver keeps them under the app's static folder, as before. The S3 driver
+stores them in a bucket on any S3-compatible service (AWS, MinIO, ...). It
+hands out presigned URLs, so downloads go straight to the bucket instead of
+through the app.
+
+Backends are built from a plain settings dict (see ``storage_settings``) so
+worker processes can create their own instance.
+"""
+
+import os
+import shutil
+from urllib.parse import quote
+
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed for the S3 backend
+    boto3 = None
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class LocalStorage:
+    """Files on the local disk, served by the static route"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, path):
+        full_path = safe_join(self.root, path)
+        if full_path is None:
+            raise ValueError(f'Invalid storage path: {path}')
+        return full_path
+
+    def open(self, path):
+        return open(self._path(path), 'rb')
+
+    def save(self, path, stream):
+        full_path = self._path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, COPY_BUFFER_SIZE)
+
+    def delete(self, path):
+        try:
+            os.remove(self._path(path))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, path):
+        return os.path.isfile(self._path(path))
+
+    def list(self, prefix):
+        """Yield ``(path, mtime)`` for every file whose path starts with prefix"""
+        base = self._path(os.path.dirname(prefix)) if os.path.dirname(prefix) else self.root
+        for root, dirs, files in os.walk(base):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                if path.startswith(prefix):
+                    yield path, os.path.getmtime(full_path)
+
+    # Chunked uploads write in place at the given offset
+
+    def start_upload(self, path):
+        full_path = self._path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        open(full_path, 'wb').close()
+        return None
+
+    def write_chunk(self, path, token, offset, part_number, data):
+        with open(self._path(path), 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+
+    def complete_upload(self, path, token):
+        pass
+
+    def local_path(self, path):
+        return self._path(path)
+
+    def download_url(self, path, download_name, mimetype):
+        return None
+
+    def public_url(self, path):
+        return url_for('static', filename=path)
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, url_expires=300, public_url=None):
+        if boto3 is None:
+            raise RuntimeError('The S3 storage backend requires boto3 (pip install boto3).')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix else ''
+        self.url_expires = url_expires
+        self.public_base = public_url.rstrip('/') + '/' if public_url else None
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+
+    def _key(self, path):
+        return self.prefix + path
+
+    def open(self, path):
+        # StreamingBody reads from the network as it is consumed
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(path))['Body']
+
+    def save(self, path, stream):
+        self.client.upload_fileobj(stream, self.bucket, self._key(path))
+
+    def delete(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(path))
+
+    def exists(self, path):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(path))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):], obj['LastModified'].timestamp()
+
+    # Chunked uploads map onto S3 multipart uploads, one part per chunk
+
+    def start_upload(self, path):
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(path))
+        return response['UploadId']
+
+    def write_chunk(self, path, token, offset, part_number, data):
+        self.client.upload_part(Bucket=self.bucket, Key=self._key(path), UploadId=token,
+                                PartNumber=part_number, Body=data)
+
+    def complete_upload(self, path, token):
+        parts = []
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=self._key(path), UploadId=token):
+            parts += [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in page.get('Parts', [])]
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self._key(path), UploadId=token,
+                                              MultipartUpload={'Parts': parts})
+
+    def local_path(self, path):
+        return None
+
+    def download_url(self, path, download_name, mimetype):
+        return self.client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self._key(path),
+            'ResponseContentType': mimetype,
+            'ResponseContentDisposition': f"attachment; filename*=UTF-8''{quote(download_name)}"
+        }, ExpiresIn=self.url_expires)
+
+    def public_url(self, path):
+        if self.public_base:
+            return self.public_base + self._key(path)
+        return self.client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self._key(path)
+        }, ExpiresIn=self.url_expires)
+
+
+def storage_settings(app):
+    """Plain, picklable settings describing the configured backend"""
+    config = app.config
+    if config['STORAGE_BACKEND'] == 's3':
+        return {
+            'backend': 's3',
+            'bucket': config['S3_BUCKET'],
+            'prefix': config['S3_PREFIX'],
+            'endpoint_url': config['S3_ENDPOINT_URL'],
+            'region': config['S3_REGION'],
+            'access_key': config['S3_ACCESS_KEY'],
+            'secret_key': config['S3_SECRET_KEY'],
+            'url_expires': config['STORAGE_URL_EXPIRES'],
+            'public_url': config['S3_PUBLIC_URL']
+        }
+    return {
+        'backend': 'local',
+        'root': config['STORAGE_LOCAL_ROOT'] or app.static_folder
+    }
+
+
+def create_storage(settings):
+    """Build a backend from ``storage_settings`` output"""
+    settings = dict(settings)
+    backend = settings.pop('backend')
+    if backend == 's3':
+        return S3Storage(**settings)
+    if backend == 'local':
+        return LocalStorage(**settings)
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+
+def get_storage():
+    """The storage backend of the current app"""
+    return current_app.extensions['storage']
+
+
+def init_app(app):
+    app.extensions['storage'] = create_storage(storage_settings(app))
+    app.jinja_env.globals['media_url'] = lambda path: get_storage().public_url(path)
@@ -0,0 +1,150 @@
+"""
+Token-bucket throttling for login attempts.
+
+Every login POST takes a token from a bucket for the client IP and one from a
+bucket for the submitted username. These checks run before the user lookup
+and any bcrypt work, so a credential-stuffing flood is turned away cheaply.
+Buckets live either in process memory or in a SQLite file on local disk. The
+file lets every worker process on the host share the same counts. Both
+stores drop buckets that have refilled, so usernames made up by an attacker
+don't pile up.
+
+Buckets are keyed on ``request.remote_addr``. Behind a load balancer or
+reverse proxy, set PROXY_HOPS so that is the client's address rather than
+the proxy's; otherwise every client shares one IP bucket.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+def _take(tokens, updated, now, capacity, rate):
+    """Refill a bucket and try to take one token
+
+    Returns ``(tokens, retry_after)``, where ``retry_after`` is 0 when the
+    token was granted.
+    """
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBuckets:
+    """Buckets in a dict; only shared by threads of one process"""
+
+    def __init__(self, max_keys=100000):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.max_keys = max_keys
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) >= self.max_keys:
+                self._prune()
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens, retry_after = _take(tokens, updated, now, capacity, rate)
+            self.buckets[key] = (tokens, now)
+        return retry_after
+
+    def _prune(self):
+        # Drop the least recently used half; those buckets have had longest to refill
+        stale = sorted(self.buckets, key=lambda key: self.buckets[key][1])
+        self.buckets = {key: self.buckets[key] for key in stale[len(stale) // 2:]}
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by all worker processes on the host"""
+
+    def __init__(self, path, max_keys=100000, prune_interval=60):
+        self.path = path
+        self.local = threading.local()
+        self.max_keys = max_keys
+        self.prune_interval = prune_interval
+        self.refill_time = 0  # Longest time any bucket seen here takes to fill up
+        self.last_prune = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_buckets_updated ON buckets (updated)')
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate):
+        # Wall-clock time, since monotonic clocks aren't comparable across processes
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, retry_after = _take(tokens, updated, now, capacity, rate)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            self.refill_time = max(self.refill_time, capacity / rate)
+            if now - self.last_prune >= self.prune_interval:
+                self._prune(conn, now)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return retry_after
+
+    def _prune(self, conn, now):
+        # A bucket untouched for a full refill is full again, the same as no row at all
+        self.last_prune = now
+        conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.refill_time,))
+        excess = conn.execute('SELECT COUNT(*) FROM buckets').fetchone()[0] - self.max_keys
+        if excess > 0:
+            # Still too many: drop the least recently used, as MemoryBuckets does
+            conn.execute('DELETE FROM buckets WHERE key IN (SELECT key FROM buckets ORDER BY updated LIMIT ?)', (excess,))
+
+
+class LoginThrottle:
+    """Per-IP and per-account limits on login attempts"""
+
+    def __init__(self, buckets, ip_limit, account_limit):
+        self.buckets = buckets
+        self.ip_limit = ip_limit
+        self.account_limit = account_limit
+
+    def _take(self, key, limit):
+        attempts, period = limit
+        return self.buckets.take(key, attempts, attempts / period)
+
+    def check(self, ip, account):
+        """Take a token from both buckets; returns seconds to wait, or 0 if allowed"""
+        retry_after = self._take(f'ip:{ip}', self.ip_limit)
+        # A blocked IP must not drain the account's bucket too, or it could lock the user out
+        if retry_after or not account:
+            return retry_after
+        return self._take(f'account:{account.strip().lower()}', self.account_limit)
+
+
+def create_buckets(app):
+    backend = app.config['LOGIN_THROTTLE_BACKEND']
+    if backend == 'memory':
+        return MemoryBuckets()
+    if backend == 'sqlite':
+        path = app.config['LOGIN_THROTTLE_PATH'] or os.path.join(tempfile.gettempdir(), 'cyberbooks-throttle.db')
+        return SQLiteBuckets(path)
+    raise ValueError(f'Unknown login throttle backend {backend!r}')
+
+
+def init_app(app):
+    """Set up the login throttle for the app"""
+    app.extensions['login_throttle'] = LoginThrottle(
+        create_buckets(app),
+        app.config['LOGIN_IP_LIMIT'],
+        app.config['LOGIN_ACCOUNT_LIMIT']
+    )
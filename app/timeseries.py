@@ -0,0 +1,196 @@
+"""
+Time series for the dashboard API, built from the daily rollups.
+
+Day, week and month buckets are summed from the rollup tables: one query per
+series, then a single pass that drops each row into its bucket. Hourly
+buckets need finer data than the rollups hold, so they are read from the
+source tables, with the range capped at METRICS_MAX_HOURLY_DAYS. Any range
+with more than METRICS_MAX_BUCKETS buckets is refused. Empty buckets are
+filled with zero. When a range has more buckets than
+``max_points``, adjacent buckets are summed together so totals are kept.
+Results are cached per (series, range, granularity, options) for
+METRICS_CACHE_TTL seconds.
+"""
+
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import literal, select
+from app import db
+from app.models import DailyBookSales, DailyRegistrations, DailySales, Order, OrderItem, User
+from app.utils import ParameterError
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# series -> (rollup model, value column, source query for hourly data)
+SERIES = {
+    'revenue': (DailySales, DailySales.revenue,
+                lambda: select(Order.created_at, Order.total_amount).where(Order.status == 'completed')),
+    'orders': (DailySales, DailySales.orders,
+               lambda: select(Order.created_at, literal(1))),
+    'book-sales': (DailyBookSales, DailyBookSales.items_sold,
+                   lambda: select(Order.created_at, literal(1)).join(OrderItem, OrderItem.order_id == Order.id)),
+    'registrations': (DailyRegistrations, DailyRegistrations.users,
+                      lambda: select(User.created_at, literal(1)))
+}
+
+
+class MetricsError(ParameterError):
+    """Invalid series, range or granularity"""
+
+
+def bucket_start(moment, granularity):
+    """Start of the bucket containing ``moment`` (a date, or datetime for hours)"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return moment
+    if granularity == 'week':
+        return moment - timedelta(days=moment.weekday())
+    return moment.replace(day=1)
+
+
+def next_bucket(start, granularity):
+    if granularity == 'hour':
+        return start + timedelta(hours=1)
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(weeks=1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def bucket_count(start, end, granularity):
+    """Number of buckets ``buckets()`` would return, worked out without building them"""
+    if granularity == 'hour':
+        return ((end - start).days + 1) * 24
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return (end - bucket_start(start, 'week')).days // 7 + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def buckets(start, end, granularity):
+    """Every bucket start from ``start`` to ``end`` inclusive"""
+    if granularity == 'hour':
+        current, last = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.max.time())
+    else:
+        current, last = bucket_start(start, granularity), end
+    result = []
+    while current <= last:
+        result.append(current)
+        current = next_bucket(current, granularity)
+    return result
+
+
+def downsample(points, max_points):
+    """Sum runs of adjacent points so at most ``max_points`` remain"""
+    if len(points) <= max_points:
+        return points, 1
+    factor = math.ceil(len(points) / max_points)
+    merged = [
+        (points[i][0], sum(value for _, value in points[i:i + factor]))
+        for i in range(0, len(points), factor)
+    ]
+    return merged, factor
+
+
+def _rows(series, start, end, granularity, book_id):
+    model, column, source = SERIES[series]
+    if granularity == 'hour':
+        query = source()
+        created_at = query.selected_columns[0]
+        query = query.where(
+            created_at >= datetime.combine(start, datetime.min.time()),
+            created_at < datetime.combine(end + timedelta(days=1), datetime.min.time())
+        )
+        if book_id is not None:
+            query = query.where(OrderItem.book_id == book_id)
+    else:
+        query = select(model.day, column).where(model.day >= start, model.day <= end)
+        if book_id is not None:
+            query = query.where(DailyBookSales.book_id == book_id)
+    return db.session.execute(query)
+
+
+def compute_series(series, start, end, granularity='day', book_id=None, max_points=200):
+    """Bucketed, zero-filled and downsampled ``[(bucket start, value)]``"""
+    totals = {bucket: 0 for bucket in buckets(start, end, granularity)}
+    for moment, value in _rows(series, start, end, granularity, book_id):
+        totals[bucket_start(moment, granularity)] += value
+    return downsample(list(totals.items()), max_points)
+
+
+class SeriesCache:
+    """Small TTL cache of computed series"""
+
+    def __init__(self, ttl, max_size=512):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Computed outside the lock so a slow series doesn't hold up cached ones
+        value = compute()
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                self.entries.clear()
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+
+def get_series(series, start=None, end=None, granularity='day', book_id=None, max_points=200):
+    """Validate a request and return the JSON-ready series, cached"""
+    if series not in SERIES:
+        raise MetricsError(f'Unknown series {series!r}')
+    if granularity not in GRANULARITIES:
+        raise MetricsError(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+    if book_id is not None and series != 'book-sales':
+        raise MetricsError('book_id only applies to book-sales')
+
+    if isinstance(start, datetime):
+        start = start.date()
+    if isinstance(end, datetime):
+        end = end.date()
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise MetricsError('start must not be after end')
+    if granularity == 'hour' and (end - start).days >= current_app.config['METRICS_MAX_HOURLY_DAYS']:
+        raise MetricsError(f"Hourly ranges are limited to {current_app.config['METRICS_MAX_HOURLY_DAYS']} days")
+    # Checked before any bucket is built: a range back to year 1 is 740,000 days
+    count, limit = bucket_count(start, end, granularity), current_app.config['METRICS_MAX_BUCKETS']
+    if count > limit:
+        raise MetricsError(f'The range has {count} {granularity} buckets; at most {limit} are allowed')
+    max_points = max(1, min(max_points, current_app.config['METRICS_MAX_POINTS']))
+
+    def compute():
+        points, factor = compute_series(series, start, end, granularity, book_id, max_points)
+        return {
+            'series': series,
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'book_id': book_id,
+            'downsample_factor': factor,
+            'points': [[bucket.isoformat(), float(value)] for bucket, value in points]
+        }
+
+    key = (series, start, end, granularity, book_id, max_points)
+    return current_app.extensions['metrics_cache'].get_or_compute(key, compute)
+
+
+def init_app(app):
+    app.extensions['metrics_cache'] = SeriesCache(app.config['METRICS_CACHE_TTL'])
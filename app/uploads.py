@@ -0,0 +1,140 @@
+"""
+Chunked, resumable uploads for large book files and cover images.
+
+The client opens an upload, then appends chunks at the offset the server
+reports. Every chunk carries a SHA-256 checksum and is written straight into
+the file's final location in storage (in place on disk, or as one part of an
+S3 multipart upload), so completing an upload never copies the data again.
+An interrupted upload resumes from the last verified offset.
+"""
+
+import hashlib
+import uuid
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import FileUpload
+from app.storage import get_storage
+
+# Upload kind -> (storage folder, config key holding allowed extensions)
+UPLOAD_KINDS = {
+    'book': ('books', 'ALLOWED_EXTENSIONS'),
+    'cover': ('img/books', 'ALLOWED_IMAGE_EXTENSIONS'),
+}
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be honoured"""
+    status_code = 400
+
+
+class UploadConflict(UploadError):
+    """Raised when a chunk does not start at the current offset"""
+    status_code = 409
+
+
+def _read_at_most(stream, limit):
+    """Read up to ``limit`` bytes, tolerating short reads from the socket"""
+    data = bytearray()
+    while len(data) < limit:
+        block = stream.read(limit - len(data))
+        if not block:
+            break
+        data += block
+    return bytes(data)
+
+
+def start_upload(user_id, kind, filename, total_size):
+    """Register a new upload and create its (empty) destination file"""
+    if kind not in UPLOAD_KINDS:
+        raise UploadError('Unknown upload kind.')
+
+    folder, extensions_key = UPLOAD_KINDS[kind]
+    original_filename = secure_filename(filename or '')
+    extension = original_filename.rsplit('.', 1)[-1].lower() if '.' in original_filename else ''
+    if extension not in current_app.config[extensions_key]:
+        raise UploadError('File type is not allowed.')
+
+    max_size = current_app.config['MAX_UPLOAD_SIZE']
+    if not isinstance(total_size, int) or total_size <= 0 or total_size > max_size:
+        raise UploadError(f'File size must be between 1 byte and {max_size} bytes.')
+
+    upload_id = uuid.uuid4().hex
+    relative_path = f"{folder}/{upload_id}_{original_filename}"
+
+    upload = FileUpload(
+        id=upload_id,
+        user_id=user_id,
+        kind=kind,
+        original_filename=original_filename,
+        file_path=relative_path,
+        total_size=total_size,
+        storage_token=get_storage().start_upload(relative_path)
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def append_chunk(upload, offset, stream, checksum):
+    """Write a chunk at ``offset`` and advance the upload if its checksum matches"""
+    if upload.status != 'pending':
+        raise UploadError('Upload is already complete.')
+    if offset != upload.received_size:
+        raise UploadConflict(f'Expected offset {upload.received_size}.')
+    if not checksum:
+        raise UploadError('Missing chunk checksum.')
+
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    if offset % chunk_size:
+        raise UploadError(f'Chunks must start at a multiple of {chunk_size} bytes.')
+
+    # A chunk is bounded by UPLOAD_CHUNK_SIZE, so it is verified in memory
+    # before anything reaches storage
+    data = _read_at_most(stream, chunk_size + 1)
+    written = len(data)
+    if written > chunk_size or written > upload.total_size - offset:
+        raise UploadError('Chunk is larger than allowed.')
+    if written < chunk_size and offset + written != upload.total_size:
+        raise UploadError(f'Only the last chunk may be smaller than {chunk_size} bytes.')
+    if written == 0 or hashlib.sha256(data).hexdigest() != checksum.lower():
+        raise UploadError('Chunk checksum mismatch.')
+
+    get_storage().write_chunk(upload.file_path, upload.storage_token, offset, offset // chunk_size + 1, data)
+
+    # Only advance if nobody else advanced the upload in the meantime
+    updated = FileUpload.query.filter_by(id=upload.id, received_size=offset).update(
+        {'received_size': offset + written},
+        synchronize_session=False
+    )
+    db.session.commit()
+    if not updated:
+        db.session.refresh(upload)
+        raise UploadConflict(f'Expected offset {upload.received_size}.')
+
+    db.session.refresh(upload)
+    return upload
+
+
+def complete_upload(upload):
+    """Mark an upload complete once every byte has been received"""
+    if upload.status != 'pending':
+        return upload
+    if upload.received_size != upload.total_size:
+        raise UploadConflict(f'Upload incomplete: {upload.received_size} of {upload.total_size} bytes received.')
+
+    get_storage().complete_upload(upload.file_path, upload.storage_token)
+    upload.status = 'completed'
+    db.session.commit()
+    return upload
+
+
+def claim_upload(upload_id, kind, user_id):
+    """Return the relative path of a user's completed upload and mark it attached"""
+    upload = db.session.get(FileUpload, upload_id)
+    if not upload or upload.user_id != user_id or upload.kind != kind or upload.status != 'completed':
+        return None
+
+    upload.status = 'attached'
+    return upload.file_path
@@ -0,0 +1,109 @@
+"""
+Admin user directory: users with their order, spend and review aggregates.
+
+Each page is a single SELECT. Users are joined to grouped subqueries over
+orders and reviews, and paged with a keyset cursor, so no OFFSET scan is
+needed. When sorted by join date, the page's users are chosen first and only
+their orders and reviews are aggregated. Sorting by spend or orders needs the
+totals for every user; the covering index ``ix_orders_user_spend`` keeps that
+to an index-only scan of orders.
+"""
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import and_, case, func, or_, select
+from app import db
+from app.models import Order, Review, User
+
+SORTS = ('joined', 'spend', 'orders')
+
+
+class DirectoryError(ValueError):
+    """Invalid sort or cursor"""
+
+
+def prefix_pattern(value):
+    """LIKE pattern matching values that start with ``value``, escaped with a backslash"""
+    return value.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_') + '%'
+
+
+def _search(query, search):
+    if not search:
+        return query
+    condition = or_(User.username.like(prefix_pattern(search), escape='\\'), User.email.like(prefix_pattern(search), escape='\\'))
+    if search.isdigit():
+        condition = or_(condition, User.id == int(search))
+    return query.where(condition)
+
+
+def _aggregates(user_ids=None):
+    orders = select(
+        Order.user_id,
+        func.count(Order.id).label('order_count'),
+        func.sum(case((Order.status == 'completed', Order.total_amount), else_=0)).label('spend'),
+        func.max(Order.created_at).label('last_order_at')
+    ).group_by(Order.user_id)
+    reviews = select(Review.user_id, func.count(Review.id).label('review_count')).group_by(Review.user_id)
+    if user_ids is not None:
+        orders = orders.where(Order.user_id.in_(user_ids))
+        reviews = reviews.where(Review.user_id.in_(user_ids))
+    return orders.subquery('order_totals'), reviews.subquery('review_totals')
+
+
+def parse_cursor(sort, value):
+    """``<sort key>,<user id>`` as produced by ``directory_page``"""
+    if not value:
+        return None
+    try:
+        key, user_id = value.rsplit(',', 1)
+        if sort == 'joined':
+            return datetime.fromisoformat(key), int(user_id)
+        if sort == 'spend':
+            return Decimal(key), int(user_id)
+        return int(key), int(user_id)
+    except (ValueError, InvalidOperation):
+        raise DirectoryError('Invalid page cursor')
+
+
+def directory_page(search=None, sort='joined', after=None, per_page=50):
+    """One page of users with aggregates, and the cursor for the next page"""
+    if sort not in SORTS:
+        raise DirectoryError(f'Unknown sort {sort!r}')
+    cursor = parse_cursor(sort, after)
+
+    if sort == 'joined':
+        page_users = _search(select(User.id), search)
+        if cursor:
+            page_users = page_users.where(or_(
+                User.created_at < cursor[0], and_(User.created_at == cursor[0], User.id < cursor[1])
+            ))
+        page_users = page_users.order_by(User.created_at.desc(), User.id.desc()).limit(per_page + 1)
+        order_totals, review_totals = _aggregates(select(page_users.subquery().c.id))
+    else:
+        order_totals, review_totals = _aggregates()
+
+    order_count = func.coalesce(order_totals.c.order_count, 0)
+    spend = func.coalesce(order_totals.c.spend, 0)
+    query = select(
+        User,
+        order_count.label('order_count'),
+        spend.label('spend'),
+        func.coalesce(review_totals.c.review_count, 0).label('review_count'),
+        order_totals.c.last_order_at
+    ).outerjoin(order_totals, order_totals.c.user_id == User.id) \
+     .outerjoin(review_totals, review_totals.c.user_id == User.id)
+    query = _search(query, search)
+
+    key = {'joined': User.created_at, 'spend': spend, 'orders': order_count}[sort]
+    if cursor:
+        query = query.where(or_(key < cursor[0], and_(key == cursor[0], User.id < cursor[1])))
+    rows = db.session.execute(query.order_by(key.desc(), User.id.desc()).limit(per_page + 1)).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        value = {'joined': last.User.created_at.isoformat(), 'spend': str(last.spend), 'orders': str(last.order_count)}[sort]
+        next_cursor = f'{value},{last.User.id}'
+    return rows, next_cursor
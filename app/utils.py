@@ -0,0 +1,19 @@
+"""
+Parameter parsing shared by the admin views and CLI commands.
+"""
+
+from datetime import datetime
+
+
+class ParameterError(ValueError):
+    """A malformed request or command-line parameter"""
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD filter value"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ParameterError(f'Invalid date {value!r}, expected YYYY-MM-DD')
@@ -15,12 +15,59 @@ class Config:
         'mysql+pymysql://root:@localhost/cyberbooks'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 10),  # Per worker process
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 10),  # Seconds to wait for a free connection
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 280),  # Keep below MySQL's wait_timeout
+        'pool_pre_ping': True  # Replace connections the server closed while idle
+    }
+    
+    # Read replica for views marked with app.replica.use_replica; unset means one database
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+    READ_YOUR_WRITES_WINDOW = int(os.environ.get('READ_YOUR_WRITES_WINDOW') or 5)  # Seconds a client reads the primary after writing; keep above replica lag
+    
+    # Query statistics: a Server-Timing entry and a JSON log line per request (app.query_stats)
+    SERVER_TIMING = True  # Expose each request's query count and database time to the client
+    N_PLUS_ONE_THRESHOLD = 5  # Executions of one statement shape in a request that are logged as N+1
+    SLOW_QUERY_LOG = True  # Per-fingerprint percentiles and sample plans (app.slow_queries)
+    SLOW_QUERY_LOG_PATH = os.environ.get('SLOW_QUERY_LOG_PATH')  # SQLite file; defaults to the temp directory
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS') or 100)  # Slower statements count as slow and get a sample EXPLAIN
+    SLOW_QUERY_FLUSH_INTERVAL = 10  # Seconds a worker buffers timings before writing them to the file
+    
+    # Prometheus metrics at /metrics (app.prometheus)
+    PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')  # Shared by gunicorn workers; empty it on deploy
+    PROMETHEUS_FLUSH_INTERVAL = 5  # Seconds between a worker's snapshots in that directory
+    PROMETHEUS_ALLOWED_NETWORKS = tuple(
+        network for network in (os.environ.get('PROMETHEUS_ALLOWED_NETWORKS') or '').split(',') if network
+    )  # Scrapers that need no token; none by default. Behind a proxy this needs PROXY_HOPS
+    PROMETHEUS_TOKEN = os.environ.get('PROMETHEUS_TOKEN')  # Bearer token accepted from any address
+    
+    # Password hashing
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS') or 12)  # Hashes at another cost are upgraded on login
+    BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS') or 0)  # Hashing threads; 0 means one per CPU
+    BCRYPT_MAX_QUEUE = int(os.environ.get('BCRYPT_MAX_QUEUE') or 32)  # Jobs allowed to wait before logins are refused
+    BCRYPT_TIMEOUT = 10  # Seconds a request waits for its hash
+    
+    # Login throttling: (attempts, seconds) token buckets, checked before any password hashing
+    LOGIN_THROTTLE_BACKEND = os.environ.get('LOGIN_THROTTLE_BACKEND') or 'memory'  # 'memory' or 'sqlite' (shared by local workers)
+    LOGIN_THROTTLE_PATH = os.environ.get('LOGIN_THROTTLE_PATH')  # SQLite file; defaults to the temp directory
+    LOGIN_IP_LIMIT = (30, 300)
+    LOGIN_ACCOUNT_LIMIT = (5, 300)
+    
+    # Proxies in front of the app whose X-Forwarded-For/-Proto are trusted, so
+    # request.remote_addr is the client's; the login throttle and /metrics rely on it
+    PROXY_HOPS = int(os.environ.get('PROXY_HOPS') or 0)
     
     # Session Security
     SESSION_COOKIE_SECURE = True  # Only send cookies over HTTPS
     SESSION_COOKIE_HTTPONLY = True  # Prevent JavaScript access to session cookie
     SESSION_COOKIE_SAMESITE = 'Lax'  # CSRF protection
     PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
+    ACTIVITY_FLUSH_INTERVAL = 5  # Seconds between bulk writes of last_login/last_seen; 0 disables the thread
+    ACTIVITY_BUFFER_SIZE = 10000  # Users buffered between flushes; activity beyond this is dropped
+    USER_CACHE_TTL = 60  # Seconds other workers may serve a user's cached admin flag after it changes
     
     # CSRF Protection
     WTF_CSRF_ENABLED = True
@@ -33,6 +80,45 @@ class Config:
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'epub'}
+    ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+    MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # Largest file accepted through chunked uploads
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB per chunk; must stay >= 5MB for S3 multipart uploads
+    
+    # File storage: 'local' (the static folder) or 's3' (any S3-compatible service)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    STORAGE_LOCAL_ROOT = os.environ.get('STORAGE_LOCAL_ROOT')  # Defaults to app/static
+    STORAGE_URL_EXPIRES = 300  # Lifetime of presigned download URLs in seconds
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX') or ''
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')  # Public base URL for covers, if the bucket is public
+    
+    # Stored file housekeeping
+    ORPHAN_GRACE_PERIOD = timedelta(hours=24)  # Newer files are never treated as orphans
+    QUARANTINE_FOLDER = os.path.join(basedir, 'quarantine')
+    
+    # Deleted books
+    BOOK_PURGE_AFTER = timedelta(days=30)  # Deleted books stay restorable this long before the purge job removes them
+    BOOK_PURGE_WINDOW = (2, 6)  # UTC hours [start, end) in which `flask books purge` runs
+    BOOK_PURGE_BATCH_SIZE = 100  # Books hard-deleted per transaction
+    
+    # Cover images
+    COVER_IMAGE_WIDTHS = (160, 320, 640)
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 2)
+    IMAGE_PROCESSING_INLINE = False  # Run the resize job in the request instead of the process pool
+    
+    # Static assets
+    STATIC_FINGERPRINT = True  # Add ?v=<content hash> to static URLs and cache them as immutable
+    ASSET_MANIFEST_PATH = os.path.join(basedir, 'app', 'static', 'manifest.json')
+    
+    # Dashboard metrics API
+    METRICS_CACHE_TTL = 60  # Seconds a computed series is reused
+    METRICS_MAX_POINTS = 1000  # Longer series are downsampled to at most this many points
+    METRICS_MAX_HOURLY_DAYS = 7  # Hourly series read source tables, so their range is capped
+    METRICS_MAX_BUCKETS = 3700  # Longest range in buckets of any granularity, about ten years of days
     
     # Pagination
     ITEMS_PER_PAGE = 12
@@ -47,18 +133,26 @@ class DevelopmentConfig(Config):
     DEBUG = True
     SESSION_COOKIE_SECURE = False  # Allow HTTP in development
     SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ENGINE_OPTIONS = {**Config.SQLALCHEMY_ENGINE_OPTIONS, 'pool_size': 2, 'max_overflow': 3}
 
 
 class ProductionConfig(Config):
     DEBUG = False
     # Force HTTPS in production
     SESSION_COOKIE_SECURE = True
+    SERVER_TIMING = False  # Query counts stay in the logs
 
 
 class TestingConfig(Config):
     TESTING = True
     DEBUG = True  # Disable Talisman in testing
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # In-memory SQLite uses a single static connection
+    SQLALCHEMY_BINDS = {}
+    IMAGE_PROCESSING_INLINE = True
+    BCRYPT_ROUNDS = 4  # Minimum cost keeps the suite fast
+    ACTIVITY_FLUSH_INTERVAL = 0  # Tests flush explicitly
+    SLOW_QUERY_LOG = False  # Tests that need it point it at a temporary file
     WTF_CSRF_ENABLED = False
     WTF_CSRF_CHECK_DEFAULT = False
     SESSION_COOKIE_SECURE = False
@@ -76,6 +76,7 @@ def db_info():
     
     try:
         from app import create_app, db
+        from sqlalchemy import func
         from app.models import User, Book, Category, Order, Review, CartItem
         
         app = create_app()
@@ -93,9 +94,9 @@ def db_info():
                 print(f"  - {admin.username} ({admin.email})")
             
             print("\n📚 Categories:")
-            categories = Category.query.all()
-            for cat in categories:
-                print(f"  - {cat.name}: {cat.books.count()} books")
+            book_counts = db.session.query(Category.name, func.count(Book.id)).outerjoin(Book).group_by(Category.id).all()
+            for name, count in book_counts:
+                print(f"  - {name}: {count} books")
     
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -0,0 +1,187 @@
+"""tables, columns and indexes added since the initial schema
+
+- file_uploads and file_deletions: resumable uploads and retried file removal
+- daily_sales, daily_book_sales and daily_registrations: dashboard rollups
+- users.last_seen and users.auth_version: write-behind activity and session revocation
+- books.cover_variants, books.cover_placeholder: responsive covers
+- books.deleted_at: soft delete
+- indexes for the admin order, user and review lists
+- ON DELETE CASCADE on the foreign keys that the ORM now leaves to the database
+
+Each step is skipped when the database already has it, so databases that
+picked up some of these through db.create_all() upgrade too. An index counts
+as present when one with the same columns exists under any name, such as
+the ``idx_*`` keys of cyberbooks.sql.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 13:50:12.406118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def _new_columns():
+    return [
+        ('users', sa.Column('last_seen', sa.DateTime(), nullable=True)),
+        ('users', sa.Column('auth_version', sa.Integer(), server_default='1', nullable=False)),
+        ('books', sa.Column('cover_variants', sa.String(length=100), nullable=True)),
+        ('books', sa.Column('cover_placeholder', sa.Text(), nullable=True)),
+        ('books', sa.Column('deleted_at', sa.DateTime(), nullable=True)),
+    ]
+
+
+NEW_INDEXES = [
+    ('users', 'ix_users_created_at', ['created_at']),
+    ('books', 'ix_books_deleted_at_created_at', ['deleted_at', 'created_at']),
+    ('orders', 'ix_orders_created_at', ['created_at']),
+    ('orders', 'ix_orders_status_created_at', ['status', 'created_at']),
+    ('orders', 'ix_orders_user_created_at', ['user_id', 'created_at']),
+    ('orders', 'ix_orders_user_spend', ['user_id', 'status', 'total_amount', 'created_at']),
+    ('order_items', 'ix_order_items_order_id', ['order_id']),
+    ('cart_items', 'ix_cart_items_book_id', ['book_id']),
+    ('reviews', 'ix_reviews_book_id', ['book_id']),
+]
+
+# (table, column, referred table)
+CASCADES = [
+    ('orders', 'user_id', 'users'),
+    ('order_items', 'order_id', 'orders'),
+    ('cart_items', 'user_id', 'users'),
+    ('cart_items', 'book_id', 'books'),
+    ('reviews', 'user_id', 'users'),
+    ('reviews', 'book_id', 'books'),
+]
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _keys(table):
+    inspector = _inspector()
+    return inspector.get_indexes(table) + inspector.get_unique_constraints(table)
+
+
+def _has_index(table, columns):
+    return any(key['column_names'] == columns for key in _keys(table))
+
+
+def _backs_foreign_key(table, name, column):
+    """Whether index ``name`` is the only one MySQL could use for a foreign key on ``column``"""
+    if not any(fk['constrained_columns'] == [column] for fk in _inspector().get_foreign_keys(table)):
+        return False
+    return not any(key['column_names'][:1] == [column] for key in _keys(table) if key['name'] != name)
+
+
+def _create_tables(existing):
+    if 'file_uploads' not in existing:
+        op.create_table('file_uploads',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('original_filename', sa.String(length=255), nullable=False),
+        sa.Column('file_path', sa.String(length=255), nullable=False),
+        sa.Column('total_size', sa.BigInteger(), nullable=False),
+        sa.Column('received_size', sa.BigInteger(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('storage_token', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'file_deletions' not in existing:
+        op.create_table('file_deletions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_path', sa.String(length=255), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'daily_sales' not in existing:
+        op.create_table('daily_sales',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('completed_orders', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day')
+        )
+    if 'daily_book_sales' not in existing:
+        op.create_table('daily_book_sales',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('items_sold', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'book_id')
+        )
+        with op.batch_alter_table('daily_book_sales', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_daily_book_sales_book_id'), ['book_id'], unique=False)
+    if 'daily_registrations' not in existing:
+        op.create_table('daily_registrations',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('users', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day')
+        )
+
+
+def _add_cascades():
+    for table, column, referred in CASCADES:
+        for fk in _inspector().get_foreign_keys(table):
+            if fk['constrained_columns'] != [column] or fk['options'].get('ondelete', '').upper() == 'CASCADE':
+                continue
+            # SQLite doesn't name its foreign keys, so they can't be replaced in place;
+            # a development database there can be rebuilt with init_db.py instead
+            if fk['name'] is None:
+                continue
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_constraint(fk['name'], type_='foreignkey')
+                batch_op.create_foreign_key(fk['name'], referred, [column], ['id'], ondelete='CASCADE')
+
+
+def upgrade():
+    _create_tables(set(_inspector().get_table_names()))
+
+    for table, column in _new_columns():
+        if column.name not in {c['name'] for c in _inspector().get_columns(table)}:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.add_column(column)
+
+    for table, name, columns in NEW_INDEXES:
+        if not _has_index(table, columns):
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.create_index(name, columns, unique=False)
+
+    _add_cascades()
+
+
+def downgrade():
+    # The cascades stay: they match cyberbooks.sql, which 0001 describes. So do
+    # indexes that are the last one behind a foreign key, which MySQL won't drop
+    for table, name, columns in reversed(NEW_INDEXES):
+        existing = {index['name'] for index in _inspector().get_indexes(table)}
+        if name in existing and not _backs_foreign_key(table, name, columns[0]):
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_index(name)
+
+    for table, column in reversed(_new_columns()):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column.name)
+
+    op.drop_table('daily_registrations')
+    with op.batch_alter_table('daily_book_sales', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_daily_book_sales_book_id'))
+
+    op.drop_table('daily_book_sales')
+    op.drop_table('daily_sales')
+    op.drop_table('file_deletions')
+    op.drop_table('file_uploads')
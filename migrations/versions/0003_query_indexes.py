@@ -0,0 +1,80 @@
+"""composite indexes for the storefront, review, purchase and order queries
+
+Adds the indexes ``flask indexes check`` expects and drops the single-column
+ones they supersede. Databases imported from cyberbooks.sql also carry plain
+KEYs that duplicate a unique key (``idx_order_number`` and friends); those
+are dropped when present. New indexes are created before old ones are
+dropped, so MySQL always has an index behind each foreign key.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 13:52:04.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+NEW_INDEXES = [
+    ('books', 'ix_books_deleted_at_price', ['deleted_at', 'price']),
+    ('books', 'ix_books_category_deleted_at_created_at', ['category_id', 'deleted_at', 'created_at']),
+    ('reviews', 'ix_reviews_book_created_at', ['book_id', 'created_at']),
+    ('reviews', 'ix_reviews_user_created_at', ['user_id', 'created_at']),
+    ('order_items', 'ix_order_items_book_order', ['book_id', 'order_id']),
+]
+
+# Superseded by a composite index above, or duplicating a unique key
+REDUNDANT_INDEXES = [
+    ('reviews', 'ix_reviews_book_id', ['book_id']),
+    ('books', 'ix_books_category_id', ['category_id']),  # Left by downgrade()
+    ('order_items', 'ix_order_items_book_id', ['book_id']),  # Left by downgrade()
+    ('reviews', 'idx_book_id', ['book_id']),
+    ('order_items', 'idx_book_id', ['book_id']),
+    ('books', 'idx_category', ['category_id']),
+    ('orders', 'idx_order_number', ['order_number']),
+    ('users', 'idx_username', ['username']),
+    ('users', 'idx_email', ['email']),
+]
+
+
+def _index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _indexed_first(table, column, excluding):
+    """Whether an index or unique key other than ``excluding`` starts with ``column``"""
+    inspector = sa.inspect(op.get_bind())
+    keys = inspector.get_indexes(table) + inspector.get_unique_constraints(table)
+    return any(key['column_names'][:1] == [column] for key in keys if key['name'] != excluding)
+
+
+def upgrade():
+    for table, name, columns in NEW_INDEXES:
+        if name not in _index_names(table):
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.create_index(name, columns, unique=False)
+
+    for table, name, columns in REDUNDANT_INDEXES:
+        if name in _index_names(table):
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_index(name)
+
+
+def downgrade():
+    # The composites may be the only index behind a foreign key (books.category_id,
+    # order_items.book_id, reviews.book_id), which MySQL refuses to drop. Give each
+    # such column a plain index first: ix_reviews_book_id as 0002 had it, and for
+    # cyberbooks.sql databases one in place of the dump's idx_book_id and idx_category keys.
+    for table, name, columns in reversed(NEW_INDEXES):
+        if name not in _index_names(table):
+            continue
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            if not _indexed_first(table, columns[0], excluding=name):
+                batch_op.create_index(f'ix_{table}_{columns[0]}', [columns[0]], unique=False)
+            batch_op.drop_index(name)
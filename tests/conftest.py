@@ -0,0 +1,24 @@
+"""
+Shared fixtures
+"""
+
+from contextlib import contextmanager
+import pytest
+from app.query_stats import capture_queries
+
+
+@pytest.fixture
+def query_budget():
+    """Fail when the block runs more queries than its budget, or repeats one statement shape
+
+    with query_budget(4):
+        client.get('/shop')
+    """
+    @contextmanager
+    def budget(max_queries, max_repeats=4):
+        with capture_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, f'Budget of {max_queries} queries exceeded:\n{stats.summary()}'
+        repeated = stats.repeated(max_repeats + 1)
+        assert not repeated, f'Statement repeated more than {max_repeats} times (N+1):\n{stats.summary()}'
+    return budget
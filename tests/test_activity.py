@@ -0,0 +1,92 @@
+"""
+Tests for the write-behind activity recorder
+"""
+
+from datetime import datetime
+from unittest import mock
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.activity import ActivityRecorder
+from app.models import User
+
+
+@pytest.fixture
+def app():
+    """Create application instance with two users"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        for name in ('reader', 'writer'):
+            user = User(username=name, email=f'{name}@example.com', full_name=name.title())
+            user.set_password('Reader123!')
+            db.session.add(user)
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_login_is_written_behind(app):
+    """Login buffers last_login and a flush writes it"""
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'reader', 'password': 'Reader123!'})
+    client.get('/cart')
+
+    reader = User.query.filter_by(username='reader').first()
+    assert reader.last_login is None
+
+    assert app.extensions['activity'].flush() == 1
+    db.session.refresh(reader)
+    assert reader.last_login is not None
+    assert reader.last_seen >= reader.last_login
+
+
+def test_flush_is_one_bulk_update(app):
+    """Many users and repeated hits become a single UPDATE with CASE"""
+    recorder = ActivityRecorder(app, interval=0, max_entries=100)
+    reader, writer = User.query.order_by(User.id).all()
+    recorder.record(reader.id, 'last_seen', datetime(2024, 1, 1, 10))
+    recorder.record(reader.id, 'last_seen', datetime(2024, 1, 1, 12))
+    recorder.record(reader.id, 'last_seen', datetime(2024, 1, 1, 11))
+    recorder.record(writer.id, 'last_login', datetime(2024, 1, 2))
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert recorder.flush() == 2
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 1
+    assert statements[0].startswith('UPDATE users SET') and 'CASE' in statements[0]
+    assert recorder.stats['coalesced'] == 2
+
+    db.session.expire_all()
+    assert db.session.get(User, reader.id).last_seen == datetime(2024, 1, 1, 12)
+    assert db.session.get(User, writer.id).last_login == datetime(2024, 1, 2)
+    assert db.session.get(User, writer.id).last_seen is None
+
+
+def test_buffer_is_bounded(app):
+    recorder = ActivityRecorder(app, interval=0, max_entries=1)
+    assert recorder.record(1, 'last_seen')
+    assert recorder.record(1, 'last_seen')
+    assert not recorder.record(2, 'last_seen')
+    assert recorder.stats['dropped'] == 1
+
+
+def test_exit_flush_is_registered_once(app):
+    """Restarting the flush thread, as a forked worker does, adds no atexit handlers"""
+    with mock.patch('app.activity.atexit.register') as register, \
+            mock.patch.object(ActivityRecorder, '_run'):
+        recorder = ActivityRecorder(app, interval=60, max_entries=10)
+        recorder.record(1, 'last_seen')
+        recorder._pid = -1  # As seen from a child process
+        recorder.record(2, 'last_seen')
+    register.assert_called_once_with(recorder.shutdown)
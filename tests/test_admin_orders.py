@@ -0,0 +1,96 @@
+"""
+Tests for the admin order list
+"""
+
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem
+
+
+@pytest.fixture
+def app():
+    """Create application instance with two customers and a few orders each"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        alice = User(username='alice', email='alice@example.com', full_name='Alice')
+        bob = User(username='bob', email='bob@shop.test', full_name='Bob')
+        for user in (alice, bob):
+            user.set_password('Secret123!')
+        db.session.add_all([category, admin, alice, bob])
+        db.session.commit()
+
+        book = Book(title='Listed Book', author='Author', price=10, category_id=category.id)
+        db.session.add(book)
+        db.session.commit()
+
+        for n, (user, status, day) in enumerate([
+            (alice, 'completed', 1), (alice, 'pending', 2), (bob, 'completed', 3), (bob, 'cancelled', 4)
+        ], start=1):
+            order = Order(user_id=user.id, order_number=f'ORD-2024050{day}-{n}', total_amount=10, status=status,
+                          created_at=datetime(2024, 5, day, 12))
+            db.session.add(order)
+            db.session.flush()
+            for _ in range(n):
+                db.session.add(OrderItem(order_id=order.id, book_id=book.id, price=10))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client logged in as admin"""
+    with app.test_client() as client:
+        client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+        yield client
+
+
+def listed(client, **params):
+    response = client.get('/admin/orders', query_string=params)
+    assert response.status_code == 200
+    return [number for number in ('ORD-20240501-1', 'ORD-20240502-2', 'ORD-20240503-3', 'ORD-20240504-4')
+            if number.encode() in response.data]
+
+
+def test_filters(client):
+    assert listed(client) == ['ORD-20240501-1', 'ORD-20240502-2', 'ORD-20240503-3', 'ORD-20240504-4']
+    assert listed(client, status='completed') == ['ORD-20240501-1', 'ORD-20240503-3']
+    assert listed(client, start='2024-05-02', end='2024-05-03') == ['ORD-20240502-2', 'ORD-20240503-3']
+    assert listed(client, customer='bob@') == ['ORD-20240503-3', 'ORD-20240504-4']
+    assert listed(client, customer='ali', status='pending') == ['ORD-20240502-2']
+    assert listed(client, number='ORD-20240504') == ['ORD-20240504-4']
+    assert listed(client, number='%') == []
+
+
+def test_item_counts_shown(client):
+    response = client.get('/admin/orders?number=ORD-20240504')
+    assert b'<td>4</td>' in response.data
+
+
+def test_query_count_independent_of_page_size(client, app):
+    """Users and item counts are batch-loaded, not fetched per order"""
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        client.get('/admin/orders?status=completed')
+        filtered = len(statements)
+        statements.clear()
+        client.get('/admin/orders')
+        unfiltered = len(statements)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert filtered == unfiltered
+    assert not any('FROM users' in s and 'WHERE users.id =' in s for s in statements)
@@ -0,0 +1,59 @@
+"""
+Tests for fingerprinted, precompressed static assets
+"""
+
+import gzip
+import pytest
+from app import create_app
+from app.assets import AssetManifest, file_digest
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create application instance serving static files from a temp folder"""
+    app = create_app('testing')
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'site.css').write_text('body { color: red; }\n' * 50)
+    (tmp_path / 'books').mkdir()
+    (tmp_path / 'books' / 'private.css').write_text('not an asset')
+
+    app.static_folder = str(tmp_path)
+    app.extensions['asset_manifest'] = AssetManifest(str(tmp_path), str(tmp_path / 'manifest.json'))
+    return app
+
+
+def test_static_urls_carry_content_hash(app, tmp_path):
+    """url_for('static') appends the file's content hash"""
+    with app.test_request_context():
+        from flask import url_for
+        url = url_for('static', filename='css/site.css')
+    assert url == f"/static/css/site.css?v={file_digest(tmp_path / 'css' / 'site.css')}"
+
+
+def test_fingerprinted_url_is_immutable(app):
+    """Only a URL with the current hash gets the long-lived cache header"""
+    client = app.test_client()
+    with app.test_request_context():
+        from flask import url_for
+        url = url_for('static', filename='css/site.css')
+
+    response = client.get(url)
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+
+    stale = client.get('/static/css/site.css?v=000000000000')
+    assert 'immutable' not in stale.headers.get('Cache-Control', '')
+
+
+def test_build_writes_manifest_and_serves_gzip(app, tmp_path):
+    """The build command precompresses text assets, skipping book files"""
+    result = app.test_cli_runner().invoke(args=['assets', 'build'])
+    assert 'Fingerprinted 1 files' in result.output
+    assert (tmp_path / 'manifest.json').exists()
+    assert not (tmp_path / 'books' / 'private.css.gz').exists()
+
+    response = app.test_client().get('/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).startswith(b'body { color: red; }')
@@ -0,0 +1,112 @@
+"""
+Tests for bulk admin actions on books
+"""
+
+from decimal import Decimal
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem, Review, CartItem
+
+
+@pytest.fixture
+def app():
+    """Create application instance with two categories of books"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        security = Category(name='Cybersecurity')
+        networks = Category(name='Networking')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        db.session.add_all([security, networks, admin])
+        db.session.commit()
+
+        for n in range(1, 6):
+            db.session.add(Book(title=f'Security {n}', author='Alice', price=10 * n, category_id=security.id,
+                                file_path=f'books/security-{n}.pdf', cover_image=f'img/books/security-{n}.jpg'))
+        db.session.add(Book(title='Routing', author='Bob', price=30, category_id=networks.id))
+        db.session.commit()
+
+        ordered = Book.query.filter_by(title='Security 1').first()
+        reviewed = Book.query.filter_by(title='Security 2').first()
+        order = Order(user_id=admin.id, order_number='ORD-1', total_amount=10, status='completed')
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([
+            OrderItem(order_id=order.id, book_id=ordered.id, price=10),
+            Review(user_id=admin.id, book_id=reviewed.id, rating=4),
+            CartItem(user_id=admin.id, book_id=reviewed.id)
+        ])
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client logged in as admin"""
+    with app.test_client() as client:
+        client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+        yield client
+
+
+def prices(category='Cybersecurity'):
+    db.session.expire_all()
+    category = Category.query.filter_by(name=category).first()
+    return [book.price for book in Book.query.filter_by(category_id=category.id).order_by(Book.id)]
+
+
+def test_adjust_price_for_matching_books(client, app):
+    category = Category.query.filter_by(name='Cybersecurity').first()
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/admin/books/bulk', data={
+            'scope': 'matching', 'category': category.id, 'action': 'adjust-price', 'value': '-10'
+        })
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 302
+    assert prices() == [Decimal('9.00'), Decimal('18.00'), Decimal('27.00'), Decimal('36.00'), Decimal('45.00')]
+    assert prices('Networking') == [Decimal('30.00')]
+    assert len([s for s in statements if s.startswith('UPDATE books')]) == 1
+
+
+def test_set_price_and_category_for_selected_books(client, app):
+    networks = Category.query.filter_by(name='Networking').first()
+    ids = [book.id for book in Book.query.filter(Book.title.in_(['Security 4', 'Security 5']))]
+
+    client.post('/admin/books/bulk', data={'book_ids': ids, 'action': 'set-price', 'value': '5'})
+    client.post('/admin/books/bulk', data={'book_ids': ids, 'action': 'set-category', 'target_category': networks.id})
+
+    assert prices('Networking') == [Decimal('5.00'), Decimal('5.00'), Decimal('30.00')]
+
+
+def test_delete_hides_matching_books(client, app):
+    response = client.post('/admin/books/bulk', data={'scope': 'matching', 'q': 'Security', 'action': 'delete'},
+                           follow_redirects=True)
+
+    assert b'5 book(s) deleted.' in response.data
+    assert [book.title for book in Book.available()] == ['Routing']
+    assert Book.query.count() == 6 and Review.query.count() == 1
+    assert CartItem.query.count() == 0
+
+
+def test_invalid_actions_change_nothing(client, app):
+    response = client.post('/admin/books/bulk', data={'action': 'delete'}, follow_redirects=True)
+    assert b'Select books or filter the list first.' in response.data
+
+    ids = [book.id for book in Book.query]
+    response = client.post('/admin/books/bulk', data={'book_ids': ids, 'action': 'adjust-price', 'value': '-100'},
+                           follow_redirects=True)
+    assert b'Percentage must be greater than -100.' in response.data
+    assert Book.query.count() == 6
+    assert prices('Networking') == [Decimal('30.00')]
@@ -0,0 +1,80 @@
+"""
+Tests for database-level cascades on deletes
+"""
+
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem, Review, CartItem
+
+
+@pytest.fixture
+def app():
+    """Create application instance with a book reviewed by many customers"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        db.session.add_all([category, admin])
+        db.session.commit()
+
+        books = [Book(title=f'Book {n}', author='Author', price=10, category_id=category.id) for n in (1, 2)]
+        customers = [User(username=f'user{n}', email=f'user{n}@example.com', password_hash='-') for n in range(20)]
+        db.session.add_all(books + customers)
+        db.session.flush()
+        for user in customers:
+            db.session.add_all([
+                Review(user_id=user.id, book_id=books[0].id, rating=4),
+                CartItem(user_id=user.id, book_id=books[0].id)
+            ])
+        order = Order(user_id=customers[0].id, order_number='ORD-1', total_amount=10, status='completed')
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, book_id=books[1].id, price=10))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def deletes(statements, table):
+    return [s for s in statements if s.startswith(f'DELETE FROM {table}')]
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements executed during the test"""
+    recorded = []
+    record = lambda conn, cursor, statement, *args: recorded.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield recorded
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_deleting_a_book_does_not_load_its_reviews(app, statements):
+    book = Book.query.filter_by(title='Book 1').first()
+    statements.clear()
+
+    db.session.delete(book)
+    db.session.commit()
+
+    assert not any('FROM reviews' in s or 'FROM cart_items' in s for s in statements)
+    assert len(deletes(statements, 'books')) == 1
+    assert Review.query.count() == 0 and CartItem.query.count() == 0
+
+
+def test_deleting_a_user_cascades_to_orders_and_items(app, statements):
+    user = User.query.filter_by(username='user0').first()
+    db.session.delete(user)
+    db.session.commit()
+
+    assert len(deletes(statements, 'users')) == 1
+    assert not deletes(statements, 'reviews') and not deletes(statements, 'order_items')
+    assert Order.query.count() == 0 and OrderItem.query.count() == 0
+    assert Review.query.count() == 19
@@ -0,0 +1,130 @@
+"""
+Tests for the bulk catalog importer
+"""
+
+import csv
+import json
+import pytest
+from app import create_app, db
+from app.catalog_import import CatalogImporter, load_progress
+from app.models import Book, Category
+from app.storage import LocalStorage
+
+FIELDS = ['title', 'author', 'isbn', 'price', 'category', 'file', 'cover']
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Publisher folder with two PDFs (one duplicated content) and a cover"""
+    folder = tmp_path / 'publisher'
+    folder.mkdir()
+    (folder / 'a.pdf').write_bytes(b'%PDF-a')
+    (folder / 'b.pdf').write_bytes(b'%PDF-b')
+    (folder / 'copy-of-a.pdf').write_bytes(b'%PDF-a')
+    (folder / 'a.jpg').write_bytes(b'JPEG')
+    return folder
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create application instance storing files under a temporary root"""
+    app = create_app('testing')
+    app.extensions['storage'] = LocalStorage(str(tmp_path / 'static'))
+
+    with app.app_context():
+        db.create_all()
+
+        db.session.add(Category(name='Cybersecurity'))
+        db.session.add(Book(title='Existing', author='Author', price=10, isbn='9780000000001'))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_import_csv(app, source, tmp_path):
+    """Rows are inserted, categories resolved, ISBNs deduped and files stored by hash"""
+    manifest = write_csv(source / 'catalog.csv', [
+        {'title': 'Book A', 'author': 'Ann', 'isbn': '978-0000000002', 'price': '12.50',
+         'category': 'Cybersecurity', 'file': 'a.pdf', 'cover': 'a.jpg'},
+        {'title': 'Book B', 'author': 'Bob', 'isbn': '9780000000003', 'price': '8',
+         'category': 'Networking', 'file': 'b.pdf'},
+        {'title': 'Book A again', 'author': 'Ann', 'isbn': '9780000000002', 'price': '12.50'},
+        {'title': 'Existing', 'author': 'Author', 'isbn': '9780000000001', 'price': '10'},
+        {'title': 'Copy of A', 'author': 'Ann', 'isbn': '9780000000004', 'price': '5',
+         'file': 'copy-of-a.pdf'},
+        {'title': 'No price', 'author': 'Ann', 'price': ''},
+    ])
+
+    importer = CatalogImporter(str(source), batch_size=2, workers=2)
+    stats = importer.run(manifest)
+
+    assert stats == {'rows': 6, 'imported': 3, 'duplicates': 2, 'errors': 1}
+    assert importer.errors[0][0] == 6
+
+    book_a = Book.query.filter_by(isbn='9780000000002').first()
+    assert book_a.category.name == 'Cybersecurity'
+    assert Book.query.filter_by(title='Book B').first().category.name == 'Networking'
+    assert (tmp_path / 'static' / book_a.file_path).read_bytes() == b'%PDF-a'
+    assert (tmp_path / 'static' / book_a.cover_image).read_bytes() == b'JPEG'
+
+    # Identical file content maps to the same content-addressed prefix
+    copy = Book.query.filter_by(title='Copy of A').first()
+    assert copy.file_path.split('_')[0] == book_a.file_path.split('_')[0]
+    assert load_progress(manifest) == 6
+
+
+def test_bad_prices_and_failed_copies_are_row_errors(app, source):
+    """Non-finite prices fail their row only, and a failed copy doesn't make the ISBN a duplicate"""
+    manifest = write_csv(source / 'catalog.csv', [
+        {'title': 'NaN', 'author': 'Ann', 'price': 'NaN'},
+        {'title': 'sNaN', 'author': 'Ann', 'price': 'sNaN'},
+        {'title': 'Infinity', 'author': 'Ann', 'price': 'Infinity'},
+        {'title': 'Missing file', 'author': 'Ann', 'isbn': '9780000000005', 'price': '5', 'file': 'missing.pdf'},
+        {'title': 'Fixed file', 'author': 'Ann', 'isbn': '9780000000005', 'price': '5.005', 'file': 'a.pdf'},
+    ])
+
+    importer = CatalogImporter(str(source), batch_size=10)
+    stats = importer.run(manifest)
+
+    assert stats == {'rows': 5, 'imported': 1, 'duplicates': 0, 'errors': 4}
+    assert [line for line, error in importer.errors] == [1, 2, 3, 4]
+    assert Book.query.filter_by(isbn='9780000000005').one().title == 'Fixed file'
+
+
+def test_resume_skips_committed_rows(app, source):
+    """A resumed run continues after the last committed row"""
+    manifest = source / 'catalog.jsonl'
+    with open(manifest, 'w') as f:
+        for n in range(1, 6):
+            f.write(json.dumps({'title': f'Book {n}', 'author': 'Ann', 'isbn': f'97810000000{n:02d}',
+                                'price': 5}) + '\n')
+    with open(str(manifest) + '.progress', 'w') as f:
+        json.dump({'rows_done': 3}, f)
+
+    stats = CatalogImporter(str(source), batch_size=2).run(str(manifest), resume=True)
+
+    assert stats['imported'] == 2
+    assert sorted(book.title for book in Book.query.filter(Book.title.like('Book %'))) == ['Book 4', 'Book 5']
+    assert load_progress(str(manifest)) == 5
+
+
+def test_import_command(app, source):
+    """The CLI reports progress and the final count"""
+    manifest = write_csv(source / 'catalog.csv', [
+        {'title': 'Book B', 'author': 'Bob', 'isbn': '9780000000003', 'price': '8', 'file': 'b.pdf'},
+    ])
+
+    result = app.test_cli_runner().invoke(args=['catalog', 'import', manifest])
+    assert '1 rows: 1 imported, 0 duplicates, 0 errors' in result.output
+    assert 'Imported 1 books.' in result.output
@@ -0,0 +1,109 @@
+"""
+Tests for streaming order and user exports
+"""
+
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+import pytest
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem
+
+
+@pytest.fixture
+def app():
+    """Create application instance with three orders on different days"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        buyer = User(username='buyer', email='buyer@example.com', full_name='Buyer')
+        buyer.set_password('Buyer123!')
+        db.session.add_all([category, admin, buyer])
+        db.session.commit()
+
+        book = Book(title='Exported Book', author='Author', price=10, category_id=category.id)
+        db.session.add(book)
+        db.session.commit()
+
+        for n, (day, status) in enumerate([(1, 'completed'), (2, 'cancelled'), (3, 'completed')], start=1):
+            order = Order(user_id=buyer.id, order_number=f'ORD-{n}', total_amount=10, status=status,
+                          created_at=datetime(2024, 5, day, 12))
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, book_id=book.id, price=10))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client logged in as admin"""
+    with app.test_client() as client:
+        client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+        yield client
+
+
+def test_csv_export_filters(client):
+    """Orders stream as CSV, filtered by date range and status"""
+    response = client.get('/admin/export/orders?start=2024-05-01&end=2024-05-03&status=completed')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'].startswith('attachment; filename=orders-')
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['order_number'] for row in rows] == ['ORD-1', 'ORD-3']
+    assert rows[0]['username'] == 'buyer'
+
+
+def test_ndjson_export_resumes_after_cursor(client):
+    """Passing the last row's created_at and id continues the export"""
+    first = client.get('/admin/export/order-items?format=ndjson').get_data(as_text=True).splitlines()
+    assert len(first) == 3
+
+    last = json.loads(first[0])
+    response = client.get(f"/admin/export/order-items?format=ndjson&after={last['created_at']},{last['id']}")
+    rest = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['order_number'] for row in rest] == ['ORD-2', 'ORD-3']
+
+
+def test_csv_cells_cannot_be_formulas(app, client):
+    """User-entered text that a spreadsheet would evaluate is exported as text; NDJSON stays raw"""
+    with app.app_context():
+        db.session.get(Book, 1).title = '=HYPERLINK("http://evil.example","x")'
+        db.session.get(User, 2).full_name = '-2+3'
+        db.session.commit()
+
+    items = list(csv.DictReader(io.StringIO(client.get('/admin/export/order-items').get_data(as_text=True))))
+    assert items[0]['title'] == '\'=HYPERLINK("http://evil.example","x")'
+    users = list(csv.DictReader(io.StringIO(client.get('/admin/export/users').get_data(as_text=True))))
+    assert users[1]['full_name'] == "'-2+3"
+
+    ndjson = client.get('/admin/export/order-items?format=ndjson').get_data(as_text=True).splitlines()
+    assert json.loads(ndjson[0])['title'].startswith('=HYPERLINK')
+
+
+def test_invalid_export_parameters(client):
+    assert client.get('/admin/export/payments').status_code == 400
+    assert client.get('/admin/export/orders?start=yesterday').status_code == 400
+
+
+def test_cli_writes_gzip(app, tmp_path):
+    """The CLI export writes a gzip-compressed file"""
+    output = tmp_path / 'users.csv.gz'
+    result = app.test_cli_runner().invoke(args=['export', 'run', 'users', '--status', 'customer', '-o', str(output)])
+    assert result.exit_code == 0
+
+    with gzip.open(output, 'rt') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['username'] for row in rows] == ['buyer']
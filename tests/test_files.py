@@ -0,0 +1,92 @@
+"""
+Tests for the deferred deletion queue and storage consistency checker
+"""
+
+from datetime import timedelta
+import pytest
+from app import create_app, db
+from app import files
+from app.models import User, Book, Category, FileDeletion
+from app.storage import LocalStorage
+
+
+@pytest.fixture
+def static_root(tmp_path):
+    """Temporary folder used as the local storage root"""
+    root = tmp_path / 'static'
+    (root / 'books').mkdir(parents=True)
+    (root / 'img' / 'books').mkdir(parents=True)
+    return root
+
+
+@pytest.fixture
+def app(static_root, tmp_path):
+    """Create application instance with an admin and one stored book"""
+    app = create_app('testing')
+    app.config['ORPHAN_GRACE_PERIOD'] = timedelta(0)
+    app.config['QUARANTINE_FOLDER'] = str(tmp_path / 'quarantine')
+    app.extensions['storage'] = LocalStorage(str(static_root))
+
+    (static_root / 'books' / 'kept.pdf').write_bytes(b'%PDF')
+    (static_root / 'img' / 'books' / 'kept.jpg').write_bytes(b'JPEG')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        db.session.add_all([category, admin])
+        db.session.commit()
+
+        db.session.add(Book(title='Stored Book', author='Author', price=10, category_id=category.id,
+                            file_path='books/kept.pdf', cover_image='img/books/kept.jpg'))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_delete_book_defers_file_removal(app, static_root):
+    """Deleting a book keeps its files until the purge job queues and removes them"""
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+
+    book = Book.query.first()
+    client.post(f'/admin/books/delete/{book.id}')
+
+    assert (static_root / 'books' / 'kept.pdf').exists()
+    assert FileDeletion.query.count() == 0
+
+    result = app.test_cli_runner().invoke(args=['books', 'purge', '--older-than', '0', '--ignore-window'])
+    assert 'Purged 1 books and 2 files.' in result.output
+    assert not (static_root / 'books' / 'kept.pdf').exists()
+    assert not (static_root / 'img' / 'books' / 'kept.jpg').exists()
+    assert FileDeletion.query.count() == 0
+
+
+def test_queued_file_still_referenced_is_kept(app, static_root):
+    """A queued path that a book points to again is not deleted"""
+    files.schedule_deletion('books/kept.pdf')
+    db.session.commit()
+
+    files.process_deletions()
+    assert (static_root / 'books' / 'kept.pdf').exists()
+    assert FileDeletion.query.count() == 0
+
+
+def test_check_reports_and_quarantines(app, static_root, tmp_path):
+    """The checker finds orphans and missing files, and can move orphans away"""
+    (static_root / 'books' / 'orphan.pdf').write_bytes(b'%PDF')
+    (static_root / 'img' / 'books' / 'kept.jpg').unlink()
+
+    orphans, missing = files.check_storage()
+    assert orphans == ['books/orphan.pdf']
+    assert missing == ['img/books/kept.jpg']
+
+    result = app.test_cli_runner().invoke(args=['files', 'check', '--quarantine'])
+    assert 'Quarantined 1 files.' in result.output
+    assert not (static_root / 'books' / 'orphan.pdf').exists()
+    assert (tmp_path / 'quarantine' / 'books' / 'orphan.pdf').exists()
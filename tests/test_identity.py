@@ -0,0 +1,102 @@
+"""
+Tests for cached user loading
+"""
+
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User
+
+
+@pytest.fixture
+def site():
+    """Create application instance with an admin and a reader
+
+    Named so pytest-flask doesn't push a context around the test, and the
+    context isn't held open here either. Requests sharing one context would
+    also share Flask-Login's cached user, and the loader would never run.
+    """
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        reader = User(username='reader', email='reader@example.com', full_name='Reader Name')
+        reader.set_password('Reader123!')
+        db.session.add_all([admin, reader])
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def update_user(site, username, **changes):
+    with site.app_context():
+        user = User.query.filter_by(username=username).first()
+        if 'password' in changes:
+            user.set_password(changes.pop('password'))
+        for name, value in changes.items():
+            setattr(user, name, value)
+        db.session.commit()
+
+
+def login(site, username, password):
+    client = site.test_client()
+    client.post('/auth/login', data={'username': username, 'password': password})
+    return client
+
+
+@pytest.fixture
+def user_queries(site):
+    """Records SQL statements that read the users table"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement:
+            statements.append(statement)
+
+    with site.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_cached_requests_skip_users_table(site, user_queries):
+    """After the first request the user comes from the cache"""
+    client = login(site, 'reader', 'Reader123!')
+    client.get('/cart')
+    user_queries.clear()
+
+    assert client.get('/cart').status_code == 200
+    assert client.get('/cart').status_code == 200
+    assert user_queries == []
+
+
+def test_full_row_loaded_lazily(site):
+    client = login(site, 'reader', 'Reader123!')
+    assert b'Reader Name' in client.get('/profile').data
+
+
+def test_password_change_ends_sessions(site):
+    client = login(site, 'reader', 'Reader123!')
+    assert client.get('/cart').status_code == 200
+
+    update_user(site, 'reader', password='Changed123!')
+
+    assert client.get('/cart').status_code == 302
+
+
+def test_revoking_admin_ends_admin_sessions(site):
+    client = login(site, 'admin', 'Admin123!')
+    assert client.get('/admin/books').status_code == 200
+
+    update_user(site, 'admin', is_admin=False)
+
+    assert client.get('/admin/books').status_code in (302, 403)
+    assert client.get('/cart').status_code == 302
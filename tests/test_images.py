@@ -0,0 +1,78 @@
+"""
+Tests for the cover image pipeline
+"""
+
+import os
+import pytest
+from PIL import Image
+from app import create_app, db
+from app.images import generate_cover_variants, variant_path
+from app.models import Book, Category
+
+COVER = 'img/books/test_pipeline_cover.jpg'
+
+
+@pytest.fixture
+def app():
+    """Create application instance with one book whose cover exists on disk"""
+    app = create_app('testing')
+    static_root = os.path.join(app.root_path, 'static')
+    Image.new('RGB', (800, 1200), (200, 30, 30)).save(os.path.join(static_root, COVER))
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        db.session.add(category)
+        db.session.commit()
+
+        db.session.add(Book(title='Pipeline Book', author='Author', price=10,
+                            cover_image=COVER, category_id=category.id))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+    os.remove(os.path.join(static_root, COVER))
+    for width in app.config['COVER_IMAGE_WIDTHS']:
+        for ext in ('webp', 'jpg'):
+            path = os.path.join(static_root, variant_path(COVER, width, ext))
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def test_generate_variants_never_upscales(tmp_path):
+    """Widths larger than the original collapse to the original width"""
+    (tmp_path / 'img/books').mkdir(parents=True)
+    Image.new('RGB', (300, 450)).save(tmp_path / 'img/books/small.png')
+
+    settings = {'backend': 'local', 'root': str(tmp_path)}
+    result = generate_cover_variants(settings, 'img/books/small.png', (160, 320, 640))
+
+    assert result['cover_variants'] == '160,300'
+    assert result['cover_placeholder'].startswith('data:image/jpeg;base64,')
+    with Image.open(tmp_path / variant_path('img/books/small.png', 160, 'webp')) as image:
+        assert image.size == (160, 240)
+    assert (tmp_path / variant_path('img/books/small.png', 300, 'jpg')).exists()
+
+
+def test_backfill_command_and_srcset(app):
+    """The CLI backfill stores variants and the shop emits a srcset"""
+    result = app.test_cli_runner().invoke(args=['images', 'backfill', '--workers', '2'])
+    assert 'Processed 1 covers, 0 failed.' in result.output
+
+    book = Book.query.first()
+    assert book.cover_widths == [160, 320, 640]
+
+    response = app.test_client().get('/shop')
+    assert b'srcset=' in response.data
+    assert variant_path(COVER, 320, 'webp').encode() in response.data
+
+
+def test_shop_falls_back_to_original_cover(app):
+    """Covers without variants are served as before"""
+    response = app.test_client().get('/shop')
+    assert b'srcset=' not in response.data
+    assert COVER.encode() in response.data
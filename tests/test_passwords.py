@@ -0,0 +1,104 @@
+"""
+Tests for pooled password hashing
+"""
+
+import threading
+import time
+from unittest import mock
+import pytest
+from app import create_app, db
+from app.models import User
+from app.passwords import PasswordHasher, PasswordHasherBusy, get_hasher, hash_password, hash_rounds
+
+
+@pytest.fixture
+def app():
+    """Create application instance with a user hashed at an old cost"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        user = User(username='reader', email='reader@example.com', full_name='Reader')
+        user.password_hash = hash_password('Reader123!', rounds=5)
+        db.session.add(user)
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_set_password_uses_configured_cost(app):
+    user = User(username='new', email='new@example.com')
+    user.set_password('Secret123!')
+    assert hash_rounds(user.password_hash) == app.config['BCRYPT_ROUNDS']
+    assert user.check_password('Secret123!')
+
+
+def test_login_upgrades_old_hash(app):
+    """A successful login rehashes at the configured cost"""
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'reader', 'password': 'Reader123!'})
+    assert response.status_code == 302
+
+    user = User.query.filter_by(username='reader').first()
+    assert hash_rounds(user.password_hash) == 4
+    assert user.check_password('Reader123!')
+
+
+def test_failed_login_keeps_hash(app):
+    before = User.query.filter_by(username='reader').first().password_hash
+    app.test_client().post('/auth/login', data={'username': 'reader', 'password': 'wrong'})
+    assert User.query.filter_by(username='reader').first().password_hash == before
+
+
+def test_fake_verify_is_seeded_at_startup(app):
+    """The first unknown-user login sleeps for the average instead of hashing"""
+    hasher = get_hasher()
+    assert hasher.verify_time is not None
+    with mock.patch.object(hasher, 'run', side_effect=AssertionError('hashed on the pool')):
+        assert hasher.fake_verify(4) is False
+
+
+def test_full_queue_is_refused():
+    """Jobs beyond workers + queue are rejected instead of waiting"""
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+    blocked = [threading.Thread(target=hasher.run, args=(release.wait,)) for _ in range(2)]
+    for thread in blocked:
+        thread.start()
+
+    # Wait until both slots are taken
+    while hasher.slots._value:
+        time.sleep(0.001)
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(lambda: None)
+
+    release.set()
+    for thread in blocked:
+        thread.join()
+    assert hasher.run(lambda: 'ok') == 'ok'
+
+
+def test_slow_job_times_out_as_busy():
+    """A job still waiting after the timeout is dropped and reported as busy"""
+    hasher = PasswordHasher(workers=1, max_queue=1, timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(release.wait)
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(lambda: 'queued')
+
+    release.set()
+    while hasher.in_flight:
+        time.sleep(0.001)
+    assert hasher.slots._value == 2
+    assert hasher.run(lambda: 'ok') == 'ok'
+
+
+def test_benchmark_command(app):
+    result = app.test_cli_runner().invoke(args=['passwords', 'benchmark', '--logins', '8', '--clients', '4'])
+    assert result.exit_code == 0
+    assert 'per core' in result.output
@@ -0,0 +1,154 @@
+"""
+Tests for the Prometheus /metrics endpoint and the merging of worker snapshots
+"""
+
+import json
+import threading
+import time
+from unittest import mock
+import pytest
+from app import create_app, db
+from app.models import Book, Category
+from app.passwords import PasswordHasher, PasswordHasherBusy
+from app.prometheus import ProcessFiles, Registry, merge, observe_payment
+from config import config
+
+DEAD_PID = 99999999
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Create application instance whose workers share a metrics directory"""
+    monkeypatch.setattr(config['testing'], 'PROMETHEUS_MULTIPROC_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(config['testing'], 'PROMETHEUS_ALLOWED_NETWORKS', ('127.0.0.1/32',))
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        category = Category(name='Cybersecurity')
+        db.session.add(category)
+        db.session.flush()
+        db.session.add(Book(title='Book', author='Author', price=10, category_id=category.id))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def scrape(app, **kwargs):
+    response = app.test_client().get('/metrics', **kwargs)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_request_latency_by_endpoint(app):
+    """Requests land in the histogram under their endpoint, method and status"""
+    client = app.test_client()
+    client.get('/shop')
+    client.get('/no-such-page')
+
+    text = scrape(app)
+    assert 'cyberbooks_http_request_duration_seconds_count{endpoint="main.shop",method="GET",status="200"} 1' in text
+    assert 'cyberbooks_http_request_duration_seconds_bucket{endpoint="main.shop",method="GET",status="200",le="+Inf"} 1' in text
+    assert 'endpoint="unmatched",method="GET",status="404"' in text
+    assert 'cyberbooks_db_pool_checkouts_total{bind="default"}' in text
+    assert 'cyberbooks_db_pool_checkout_wait_seconds_count{bind="default"}' in text
+    assert '# TYPE cyberbooks_bcrypt_queue_depth gauge' in text
+
+
+def test_access_is_restricted(app):
+    """Other networks need the bearer token"""
+    remote = {'environ_base': {'REMOTE_ADDR': '203.0.113.9'}}
+    assert app.test_client().get('/metrics', **remote).status_code == 403
+
+    app.config['PROMETHEUS_TOKEN'] = 'scrape-secret'
+    assert app.test_client().get('/metrics', headers={'Authorization': 'Bearer wrong'}, **remote).status_code == 403
+    scrape(app, headers={'Authorization': 'Bearer scrape-secret'}, **remote)
+    # Non-ASCII tokens are refused like any other wrong token
+    assert app.test_client().get('/metrics', headers={'Authorization': 'Bearer sécret'}, **remote).status_code == 403
+
+
+def test_token_is_required_by_default():
+    """Without configured networks even loopback clients, such as a local proxy, need the token"""
+    app = create_app('testing')
+    assert app.test_client().get('/metrics').status_code == 403
+
+
+def test_allowed_network_behind_proxy(monkeypatch):
+    """With PROXY_HOPS set the forwarded client address is checked, not the proxy's"""
+    monkeypatch.setattr(config['testing'], 'PROXY_HOPS', 1)
+    monkeypatch.setattr(config['testing'], 'PROMETHEUS_ALLOWED_NETWORKS', ('10.0.0.0/8',))
+    app = create_app('testing')
+
+    def via_proxy(client_ip):
+        return app.test_client().get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'},
+                                     headers={'X-Forwarded-For': client_ip})
+
+    assert via_proxy('203.0.113.9').status_code == 403
+    assert via_proxy('10.1.2.3').status_code == 200
+
+
+def test_snapshots_of_all_workers_are_merged(app, tmp_path):
+    """Counters and histograms add up across workers, including exited ones; gauges only count live ones"""
+    dead_worker = {
+        'counter': [['cyberbooks_downloads_total', {'delivery': 'redirect'}, 3]],
+        'gauge': [['cyberbooks_bcrypt_queue_depth', {}, 7]],
+        'histogram': [['cyberbooks_http_request_duration_seconds',
+                       {'endpoint': 'main.shop', 'method': 'GET', 'status': '200'}, [0] * 11 + [20.0, 2]]]
+    }
+    (tmp_path / 'metrics' / f'{DEAD_PID}-1.json').write_text(json.dumps(dead_worker))
+    with app.app_context():
+        app.extensions['prometheus'].inc('cyberbooks_downloads_total', {'delivery': 'redirect'}, 2)
+    app.test_client().get('/shop')
+
+    text = scrape(app)
+    assert 'cyberbooks_downloads_total{delivery="redirect"} 5' in text
+    assert 'cyberbooks_bcrypt_queue_depth 0' in text
+    assert 'cyberbooks_http_request_duration_seconds_count{endpoint="main.shop",method="GET",status="200"} 3' in text
+
+
+def test_replacement_worker_keeps_dead_workers_totals(tmp_path):
+    """A worker forked later with a recycled pid writes its own file, even though the master stamped none"""
+    files = ProcessFiles(str(tmp_path / 'metrics'), flush_interval=0)
+    registry = Registry()
+    for pid in (DEAD_PID, DEAD_PID + 1, DEAD_PID):
+        with mock.patch('os.getpid', return_value=pid):
+            registry.inc('cyberbooks_downloads_total', {'delivery': 'redirect'})
+            files.flush(registry)
+
+    assert len(list((tmp_path / 'metrics').glob(f'{DEAD_PID}-*.json'))) == 2
+    assert merge(files.load())['cyberbooks_downloads_total'][(('delivery', 'redirect'),)] == 3
+
+
+def test_payment_gateway_timer(app):
+    """Stripe calls are timed with their outcome"""
+    with pytest.raises(RuntimeError):
+        with observe_payment('create_payment_intent'):
+            raise RuntimeError('card declined')
+
+    text = scrape(app)
+    assert ('cyberbooks_payment_gateway_duration_seconds_count'
+            '{operation="create_payment_intent",outcome="error"} 1') in text
+
+
+def test_bcrypt_queue_counts():
+    """Queued jobs and refusals are counted on the hasher"""
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+    threads = [threading.Thread(target=hasher.run, args=(release.wait,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while hasher.in_flight < 2:
+        time.sleep(0.01)
+
+    assert hasher.queued == 1
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(release.wait)
+    assert hasher.rejected == 1
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert hasher.in_flight == 0
@@ -0,0 +1,97 @@
+"""
+Tests for soft-deleted books and the purge job
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem, Review
+from app.purge import in_window, purge_deleted_books, soft_delete_books
+
+
+@pytest.fixture
+def app():
+    """Create application instance with a buyer, a bought book and unsold books"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        buyer = User(username='buyer', email='buyer@example.com', full_name='Buyer')
+        buyer.set_password('Secret123!')
+        db.session.add_all([category, buyer])
+        db.session.commit()
+
+        bought = Book(title='Bought', author='Author', price=10, category_id=category.id)
+        unsold = [Book(title=f'Unsold {n}', author='Author', price=10, category_id=category.id) for n in range(5)]
+        db.session.add_all([bought] + unsold)
+        db.session.flush()
+        order = Order(user_id=buyer.id, order_number='ORD-1', total_amount=10, status='completed')
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([
+            OrderItem(order_id=order.id, book_id=bought.id, price=10),
+            Review(user_id=buyer.id, book_id=unsold[0].id, rating=3)
+        ])
+        db.session.commit()
+
+        soft_delete_books(Book.id.isnot(None))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_storefront_hides_deleted_books(app):
+    client = app.test_client()
+    book = Book.query.filter_by(title='Unsold 1').first()
+
+    assert b'Unsold 1' not in client.get('/shop').data
+    assert client.get('/api/books').get_json() == []
+    assert client.get(f'/book/{book.id}').status_code == 404
+
+
+def test_buyers_keep_deleted_books(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'buyer', 'password': 'Secret123!'})
+    book = Book.query.filter_by(title='Bought').first()
+
+    assert client.get(f'/book/{book.id}').status_code == 200
+    assert client.post(f'/cart/add/{book.id}').status_code == 404
+
+
+def test_admin_counts_skip_deleted_books(app):
+    """The dashboard and category list count live books; deleted ones are shown apart"""
+    admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+    admin.set_password('Admin123!')
+    db.session.add_all([admin, Book(title='Live', author='Author', price=10, category_id=1)])
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+
+    dashboard = client.get('/admin/dashboard').get_data(as_text=True)
+    assert 'data: [1]' in dashboard
+    categories = ' '.join(client.get('/admin/categories').get_data(as_text=True).split())
+    assert '1 <small class="text-muted">(+6 deleted)</small>' in categories
+
+
+def test_purge_removes_unordered_books_in_batches(app):
+    # Deleted just now, so nothing is old enough yet
+    assert purge_deleted_books(window=False) == (0, 0)
+
+    books, _ = purge_deleted_books(older_than=timedelta(0), batch_size=2, window=False)
+    assert books == 5
+    assert [book.title for book in Book.query] == ['Bought']
+    assert Review.query.count() == 0
+
+
+def test_purge_stops_outside_its_window(app):
+    hour = datetime.utcnow().hour
+    assert purge_deleted_books(older_than=timedelta(0), window=((hour + 1) % 24, (hour + 2) % 24)) == (0, 0)
+    assert Book.query.count() == 6
+
+    assert in_window((22, 4), datetime(2024, 1, 1, 23)) and in_window((22, 4), datetime(2024, 1, 1, 3))
+    assert not in_window((22, 4), datetime(2024, 1, 1, 12))
@@ -0,0 +1,45 @@
+"""
+Tests for the EXPLAIN check of the hot queries
+"""
+
+import pytest
+from sqlalchemy import select
+from app import create_app, db
+from app.models import Book, Review
+from app.query_audit import audit, explain
+
+
+@pytest.fixture
+def app():
+    """Create application instance"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_hot_queries_are_served_by_indexes(app):
+    """Every hot query uses an index for both its filter and its order"""
+    assert [(name, problems) for name, plan, problems in audit() if problems] == []
+
+
+def test_check_command_passes(app):
+    """flask indexes check exits cleanly on the model schema"""
+    result = app.test_cli_runner().invoke(args=['indexes', 'check', '--verbose'])
+
+    assert result.exit_code == 0
+    assert 'ok    purchase check' in result.output
+
+
+def test_unindexed_queries_are_flagged(app):
+    """A filter on an unindexed column and an order it can't follow are reported"""
+    plan, problems = explain(select(Book.id).where(Book.file_format == 'ePub'))
+    assert problems == ['full scan of books']
+
+    plan, problems = explain(select(Review.id).where(Review.book_id == 1).order_by(Review.rating))
+    assert problems == ['sort']
@@ -0,0 +1,142 @@
+"""
+Query counts per endpoint: pages load their relationships with explicit
+loader options, so the number of queries doesn't grow with the rows shown
+"""
+
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem, Review, CartItem
+
+
+def populate(books_per_category):
+    """Two categories of books, each reviewed by every customer, and orders and a cart for the buyer"""
+    categories = [Category(name=f'Category {n}') for n in range(2)]
+    customers = [User(username=f'customer{n}', email=f'customer{n}@example.com', password_hash='-') for n in range(3)]
+    db.session.add_all(categories + customers)
+    db.session.flush()
+
+    books = [Book(title=f'Book {c.id}-{n}', author='Author', price=10, category_id=c.id)
+             for c in categories for n in range(books_per_category)]
+    db.session.add_all(books)
+    db.session.flush()
+    db.session.add_all(Review(user_id=user.id, book_id=book.id, rating=4) for user in customers for book in books)
+
+    buyer = User.query.filter_by(username='buyer').first()
+    for n in range(books_per_category):
+        order = Order(user_id=buyer.id, order_number=f'ORD-{books_per_category}-{n}', total_amount=20, status='completed')
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all(OrderItem(order_id=order.id, book_id=book.id, price=10) for book in books[n:n + 2])
+        db.session.add(Review(user_id=buyer.id, book_id=books[n].id, rating=5))
+    db.session.add_all(CartItem(user_id=buyer.id, book_id=book.id) for book in books[-3:])
+    db.session.commit()
+
+
+@pytest.fixture(params=[3, 9], ids=['few', 'many'])
+def site(request):
+    """Create application instance with a buyer, an admin and a catalog of the given size
+
+    Not named ``app``, so pytest-flask doesn't share one context (and one
+    session) between the requests being counted.
+    """
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        buyer = User(username='buyer', email='buyer@example.com', full_name='Buyer')
+        admin.set_password('Admin123!')
+        buyer.set_password('Secret123!')
+        db.session.add_all([admin, buyer])
+        db.session.commit()
+        populate(request.param)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def count_queries(site, client, url):
+    """SELECTs run while serving ``url``"""
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    with site.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, url
+    return len([s for s in statements if s.lstrip().upper().startswith('SELECT')])
+
+
+def logged_in(site, username, password):
+    client = site.test_client()
+    client.post('/auth/login', data={'username': username, 'password': password})
+    client.get('/')  # Warm the identity cache
+    return client
+
+
+@pytest.fixture
+def ids(site):
+    with site.app_context():
+        return {'order': Order.query.order_by(Order.id).first().id, 'book': Book.query.first().id}
+
+
+@pytest.mark.parametrize('url, queries', [
+    ('/', 3),
+    ('/shop', 4),
+    ('/shop?sort_by=rating', 4),
+    ('/book/{book}', 6),
+    ('/cart', 1),
+    ('/profile', 6),
+    ('/order/{order}', 2),
+    ('/api/books', 2),
+])
+def test_storefront(site, ids, url, queries):
+    client = logged_in(site, 'buyer', 'Secret123!')
+    assert count_queries(site, client, url.format(**ids)) == queries
+
+
+@pytest.mark.parametrize('url, queries', [
+    ('/admin/books', 3),
+    ('/admin/categories', 2),
+    ('/admin/dashboard', 8),
+    ('/admin/orders', 3),
+])
+def test_admin(site, url, queries):
+    client = logged_in(site, 'admin', 'Admin123!')
+    assert count_queries(site, client, url) == queries
+
+
+def test_listings_skip_wide_columns(site, ids):
+    client = site.test_client()
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    with site.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client.get('/')
+        client.get('/shop')
+        # Pagination's COUNT wraps the full entity, but the database flattens that subquery
+        assert not any('books.description' in s for s in statements if not s.startswith('SELECT count'))
+        assert any('books.cover_placeholder' in s for s in statements)
+
+        statements.clear()
+        client.get(f"/book/{ids['book']}")
+        assert any('books.description' in s for s in statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_to_dict_matches_api(site, ids):
+    """Book.to_dict keeps the shape /api/books returns from plain rows"""
+    listed = {book['id']: book for book in site.test_client().get('/api/books').get_json()}
+    with site.app_context():
+        assert db.session.get(Book, ids['book']).to_dict() == listed[ids['book']]
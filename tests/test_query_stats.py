@@ -0,0 +1,97 @@
+"""
+Tests for per-request query statistics, the N+1 log and query budgets
+"""
+
+import json
+import logging
+import re
+import pytest
+from app import create_app, db
+from app.models import Book, Category
+from app.query_stats import fingerprint
+
+
+@pytest.fixture
+def site():
+    """Create application instance with six categories of one book each
+
+    Not named ``app``, so pytest-flask doesn't share one context between
+    the requests being measured.
+    """
+    app = create_app('testing')
+
+    def categories_one_by_one():
+        # Each book's category is lazy-loaded on its own: a textbook N+1
+        return ', '.join(book.category.name for book in Book.query.all())
+
+    app.add_url_rule('/test/n-plus-one', 'n_plus_one', categories_one_by_one)
+
+    with app.app_context():
+        db.create_all()
+        categories = [Category(name=f'Category {n}') for n in range(6)]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.add_all(Book(title=f'Book {c.id}', author='Author', price=10, category_id=c.id) for c in categories)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def request_logs(caplog):
+    return [json.loads(r.getMessage()) for r in caplog.records if r.name == 'app.query_stats']
+
+
+def test_server_timing_header(site):
+    """Responses carry the request's query count and database time"""
+    response = site.test_client().get('/shop')
+
+    match = re.fullmatch(r'db;dur=[\d.]+;desc="(\d+) queries"', response.headers['Server-Timing'])
+    assert match and int(match.group(1)) > 0
+
+
+def test_request_log(site, caplog):
+    """Each request logs one JSON line with its totals"""
+    caplog.set_level(logging.INFO, logger='app.query_stats')
+    site.test_client().get('/api/books')
+
+    [record] = request_logs(caplog)
+    assert record['endpoint'] == 'main.api_books'
+    assert record['status'] == 200
+    assert record['queries'] > 0
+    assert record['n_plus_one'] == []
+
+
+def test_n_plus_one_logged_as_warning(site, caplog):
+    """A statement shape repeated per row is reported with its count"""
+    caplog.set_level(logging.INFO, logger='app.query_stats')
+    site.test_client().get('/test/n-plus-one')
+
+    [warning] = [r for r in caplog.records if r.name == 'app.query_stats' and r.levelno == logging.WARNING]
+    [repeated] = json.loads(warning.getMessage())['n_plus_one']
+    assert repeated['count'] == 6
+    assert 'FROM categories' in repeated['statement']
+
+
+def test_fingerprint_ignores_parameters_and_layout():
+    """IN lists of any length and reflowed whitespace share one shape"""
+    assert fingerprint('SELECT *\n  FROM books WHERE id IN (?, ?, ?)') == 'SELECT * FROM books WHERE id IN (?)'
+    assert fingerprint('SELECT * FROM books WHERE id IN (%(id_1)s, %(id_2)s)') == 'SELECT * FROM books WHERE id IN (?)'
+
+
+def test_query_budget(site, query_budget):
+    """The fixture passes within budget and fails over it or on an N+1"""
+    client = site.test_client()
+    with query_budget(4):
+        client.get('/shop')
+
+    with pytest.raises(AssertionError, match='Budget of 1 queries exceeded'):
+        with query_budget(1):
+            client.get('/shop')
+
+    with pytest.raises(AssertionError, match='N\\+1'):
+        with query_budget(20):
+            client.get('/test/n-plus-one')
@@ -0,0 +1,82 @@
+"""
+Tests for read-replica routing: read-only views read the replica, writes
+and everything after them within the window read the primary
+"""
+
+import pytest
+from sqlalchemy.orm import Session
+from app import create_app, db
+from app.models import User, Book, Category, CartItem
+from config import config
+
+
+def seed(session, title):
+    """A buyer and one book, whose title tells the two databases apart"""
+    buyer = User(username='buyer', email='buyer@example.com', full_name='Buyer')
+    buyer.set_password('Secret123!')
+    session.add_all([buyer, Category(name='Cybersecurity')])
+    session.flush()
+    session.add(Book(title=title, author='Author', price=10, category_id=1))
+    session.commit()
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    """Create application instance with a primary and a replica that hasn't seen a rename yet
+
+    Not named ``app``, so pytest-flask doesn't share one request context
+    between the requests being routed.
+    """
+    monkeypatch.setattr(config['testing'], 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "primary.db"}')
+    monkeypatch.setattr(config['testing'], 'SQLALCHEMY_BINDS', {'replica': f'sqlite:///{tmp_path / "replica.db"}'})
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        seed(db.session, 'Renamed Title')
+        replica = db.engines['replica']
+        db.metadata.create_all(replica)
+        with Session(replica) as session:
+            seed(session, 'Original Title')
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    # init_app registered the bind's metadata on the shared db; later apps have no such bind
+    db.metadatas.pop('replica', None)
+
+
+def test_read_only_views_use_replica(site):
+    """The catalog pages and the API are served from the replica"""
+    client = site.test_client()
+
+    assert b'Original Title' in client.get('/shop').data
+    assert client.get('/api/books').get_json()[0]['title'] == 'Original Title'
+
+
+def test_other_views_and_commands_use_primary(site):
+    """Views without the decorator and code outside requests read the primary"""
+    with site.app_context():
+        assert db.session.get(Book, 1).title == 'Renamed Title'
+        db.session.add(CartItem(user_id=1, book_id=1))
+        db.session.commit()
+
+    client = site.test_client()
+    client.post('/auth/login', data={'username': 'buyer', 'password': 'Secret123!'})
+    assert b'Renamed Title' in client.get('/cart').data
+
+
+def test_client_reads_its_own_writes(site):
+    """After writing, a client reads the primary until the window passes; others keep the replica"""
+    client = site.test_client()
+    client.post('/auth/login', data={'username': 'buyer', 'password': 'Secret123!'})
+    assert b'Original Title' in client.get('/shop').data
+
+    client.post('/cart/add/1')
+    assert b'Renamed Title' in client.get('/shop').data
+    assert b'Original Title' in site.test_client().get('/shop').data
+
+    site.config['READ_YOUR_WRITES_WINDOW'] = 0
+    assert b'Original Title' in client.get('/shop').data
@@ -0,0 +1,93 @@
+"""
+Tests for the dashboard rollup tables
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem, DailySales, DailyBookSales, DailyRegistrations
+from app.rollups import rebuild_rollups
+
+
+@pytest.fixture
+def app():
+    """Create application instance with an admin, a buyer and two paid orders"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True,
+                     created_at=datetime(2024, 5, 1, 9))
+        admin.set_password('Admin123!')
+        buyer = User(username='buyer', email='buyer@example.com', full_name='Buyer',
+                     created_at=datetime(2024, 5, 1, 10))
+        buyer.set_password('Buyer123!')
+        db.session.add_all([category, admin, buyer])
+        db.session.commit()
+
+        book = Book(title='Rolled Up', author='Author', price=10, category_id=category.id)
+        db.session.add(book)
+        db.session.commit()
+
+        for n, amount in enumerate((10, 25), start=1):
+            order = Order(user_id=buyer.id, order_number=f'ORD-{n}', total_amount=amount, status='completed',
+                          created_at=datetime(2024, 5, 2, 12))
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, book_id=book.id, price=amount))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def snapshot():
+    return (
+        [(r.day, r.orders, r.completed_orders, r.revenue) for r in DailySales.query.order_by(DailySales.day)],
+        [(r.day, r.book_id, r.items_sold, r.revenue) for r in DailyBookSales.query.order_by(DailyBookSales.day)],
+        [(r.day, r.users) for r in DailyRegistrations.query.order_by(DailyRegistrations.day)]
+    )
+
+
+def test_rollups_maintained_on_write(app):
+    sales, book_sales, registrations = snapshot()
+    book = Book.query.first()
+
+    assert sales == [(date(2024, 5, 2), 2, 2, Decimal('35.00'))]
+    assert book_sales == [(date(2024, 5, 2), book.id, 2, Decimal('35.00'))]
+    assert registrations == [(date(2024, 5, 1), 2)]
+
+
+def test_status_change_adjusts_revenue(app):
+    """An order that fails after completing leaves the revenue rollup"""
+    order = Order.query.filter_by(order_number='ORD-2').first()
+    order.status = 'failed'
+    db.session.commit()
+
+    assert snapshot()[0] == [(date(2024, 5, 2), 2, 1, Decimal('10.00'))]
+
+
+def test_rebuild_matches_incremental(app):
+    expected = snapshot()
+    db.session.query(DailySales).delete()
+    db.session.query(DailyBookSales).delete()
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['rollups', 'rebuild'])
+    assert 'Wrote 3 rollup rows.' in result.output
+    assert snapshot() == expected
+
+
+def test_dashboard_reads_rollups(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+
+    response = client.get('/admin/dashboard')
+    assert response.status_code == 200
+    assert b'$35.00' in response.data
+    assert b'Rolled Up' in response.data
@@ -0,0 +1,110 @@
+"""
+Tests for the slow-query log: fingerprint totals, percentiles, sample plans
+and the admin page and CLI that show them
+"""
+
+import pytest
+from app import create_app, db
+from app.models import User, Book, Category
+from app.slow_queries import QueryLogStore, SlowQueryLog, latency_bucket, percentile
+from config import config
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    """Create application instance that logs every statement as slow
+
+    Not named ``app``, so pytest-flask doesn't share one context between
+    the requests being recorded.
+    """
+    monkeypatch.setattr(config['testing'], 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "site.db"}')
+    monkeypatch.setattr(config['testing'], 'SLOW_QUERY_LOG', True)
+    monkeypatch.setattr(config['testing'], 'SLOW_QUERY_LOG_PATH', str(tmp_path / 'queries.db'))
+    monkeypatch.setattr(config['testing'], 'SLOW_QUERY_THRESHOLD_MS', 0)
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        category = Category(name='Cybersecurity')
+        db.session.add_all([admin, category])
+        db.session.flush()
+        db.session.add(Book(title='Book', author='Author', price=10, category_id=category.id))
+        db.session.commit()
+        log = app.extensions['slow_query_log']
+        log.flush(force=True)
+        log.store.reset()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def listing(statements):
+    [row] = [row for row in statements if row['fingerprint'].startswith('SELECT books.id') and 'LIMIT' in row['fingerprint']]
+    return row
+
+
+def test_percentiles_from_histogram():
+    """p50 and p95 land within a bucket of the true values"""
+    histogram = {latency_bucket(1.0): 90, latency_bucket(50.0): 10}
+
+    assert 1.0 <= percentile(histogram, 0.5, max_ms=60) < 1.2
+    assert 50.0 <= percentile(histogram, 0.95, max_ms=60) <= 60
+
+
+def test_workers_merge_into_one_store(tmp_path):
+    """Buffers of separate processes add up in the shared file"""
+    path = str(tmp_path / 'queries.db')
+    workers = [SlowQueryLog(QueryLogStore(path), threshold_ms=100, flush_interval=10) for _ in range(2)]
+    for worker, durations in zip(workers, [(0.001, 0.002), (0.2,)]):
+        for duration in durations:
+            worker.record(None, 'SELECT * FROM books WHERE id IN (?, ?)', None, duration)
+        worker.flush(force=True)
+
+    [row] = QueryLogStore(path).top()
+    assert row['fingerprint'] == 'SELECT * FROM books WHERE id IN (?)'
+    assert row['calls'] == 3
+    assert row['slow_calls'] == 1
+    assert row['max_ms'] == pytest.approx(200)
+
+
+def test_requests_are_recorded_with_a_plan(site):
+    """Statements are grouped by fingerprint and a slow one gets a sample EXPLAIN"""
+    client = site.test_client()
+    client.get('/shop')
+    client.get('/shop')
+
+    log = site.extensions['slow_query_log']
+    log.flush(force=True)
+    row = listing(log.store.top(limit=100))
+    assert row['calls'] == 2
+    assert row['p50_ms'] <= row['p95_ms'] <= row['max_ms']
+    assert any('ix_books_deleted_at_created_at' in step for step in row['plan']['steps'])
+    assert row['plan']['problems'] == []
+
+
+def test_admin_page_and_cli(site):
+    """The admin page and `flask queries top` list the recorded statements"""
+    site.test_client().get('/shop')
+
+    client = site.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+    response = client.get('/admin/queries?sort=p95')
+    assert response.status_code == 200
+    assert b'FROM books' in response.data
+
+    result = site.test_cli_runner().invoke(args=['queries', 'top', '--plans'])
+    assert result.exit_code == 0
+    assert 'FROM books' in result.output and 'SEARCH books' in result.output
+
+    client.post('/admin/queries/reset')
+    assert 'FROM books' not in site.test_cli_runner().invoke(args=['queries', 'top']).output
+
+
+def test_admin_page_requires_admin(site):
+    """Customers can't see the query log"""
+    assert site.test_client().get('/admin/queries').status_code in (302, 403)
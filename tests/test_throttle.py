@@ -0,0 +1,141 @@
+"""
+Tests for login throttling
+"""
+
+from unittest import mock
+import pytest
+from app import create_app, db
+from app.models import User
+from app.throttle import MemoryBuckets, SQLiteBuckets
+from config import config
+
+
+@pytest.fixture
+def app():
+    """Create application instance with one user and tight login limits"""
+    app = create_app('testing')
+    app.config.update(LOGIN_IP_LIMIT=(5, 60), LOGIN_ACCOUNT_LIMIT=(2, 60))
+    from app import throttle
+    throttle.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+
+        user = User(username='reader', email='reader@example.com', full_name='Reader')
+        user.set_password('Reader123!')
+        db.session.add(user)
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def login(client, username, password='wrong', ip='10.0.0.1'):
+    return client.post('/auth/login', data={'username': username, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_account_limit_blocks_before_hashing(app):
+    """Once an account's bucket is empty no password check runs"""
+    client = app.test_client()
+    assert login(client, 'reader').status_code == 200
+    assert login(client, 'Reader', ip='10.0.0.2').status_code == 200
+
+    with mock.patch.object(User, 'check_password') as check:
+        response = login(client, 'reader', 'Reader123!', ip='10.0.0.3')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    check.assert_not_called()
+
+
+def test_ip_limit_covers_many_accounts(app):
+    client = app.test_client()
+    for n in range(5):
+        assert login(client, f'user{n}').status_code == 200
+    assert login(client, 'reader', 'Reader123!').status_code == 429
+    # Other clients are unaffected
+    assert login(client, 'reader', 'Reader123!', ip='10.0.0.9').status_code == 302
+
+
+def test_blocked_ip_does_not_drain_account(app):
+    """Attempts refused by the IP limit leave the targeted account's bucket alone"""
+    client = app.test_client()
+    for n in range(5):
+        login(client, f'user{n}', ip='10.0.0.6')
+    for _ in range(3):
+        assert login(client, 'reader', ip='10.0.0.6').status_code == 429
+
+    assert login(client, 'reader', 'Reader123!', ip='10.0.0.7').status_code == 302
+
+
+def test_unknown_user_skips_hashing(app):
+    """Unknown usernames get the fake check, not a bcrypt verification"""
+    client = app.test_client()
+    with mock.patch('app.auth.fake_verify_password', return_value=False) as fake:
+        response = login(client, 'nobody')
+    assert response.status_code == 200
+    fake.assert_called_once()
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_bucket_refills(backend, tmp_path):
+    buckets = MemoryBuckets() if backend == 'memory' else SQLiteBuckets(str(tmp_path / 'throttle.db'))
+    with mock.patch('time.monotonic', return_value=100.0), mock.patch('time.time', return_value=100.0):
+        assert buckets.take('k', 2, 1) == 0
+        assert buckets.take('k', 2, 1) == 0
+        assert buckets.take('k', 2, 1) == pytest.approx(1)
+    with mock.patch('time.monotonic', return_value=101.0), mock.patch('time.time', return_value=101.0):
+        assert buckets.take('k', 2, 1) == 0
+
+
+def test_sqlite_buckets_drop_refilled_rows(tmp_path):
+    """Buckets untouched for a full refill are deleted, and the table is capped"""
+    buckets = SQLiteBuckets(str(tmp_path / 'throttle.db'), max_keys=3, prune_interval=0)
+
+    def keys():
+        return [row[0] for row in buckets._connect().execute('SELECT key FROM buckets ORDER BY key')]
+
+    with mock.patch('time.time', return_value=100.0):
+        for n in range(3):
+            buckets.take(f'account:user{n}', 5, 0.1)
+    with mock.patch('time.time', return_value=160.0):
+        buckets.take('account:user3', 5, 0.1)
+    assert keys() == ['account:user3']
+
+    for n in range(4, 8):
+        with mock.patch('time.time', return_value=160.0 + n):
+            buckets.take(f'account:user{n}', 5, 0.1)
+    assert keys() == ['account:user5', 'account:user6', 'account:user7']
+
+
+def test_client_address_behind_proxy(monkeypatch):
+    """With PROXY_HOPS set, clients behind the load balancer get their own IP bucket"""
+    monkeypatch.setattr(config['testing'], 'PROXY_HOPS', 1)
+    app = create_app('testing')
+    app.config.update(LOGIN_IP_LIMIT=(5, 60), LOGIN_ACCOUNT_LIMIT=(2, 60))
+    from app import throttle
+    throttle.init_app(app)
+    client = app.test_client()
+
+    def via_proxy(username, client_ip):
+        return client.post('/auth/login', data={'username': username, 'password': 'wrong'},
+                           environ_base={'REMOTE_ADDR': '10.0.0.254'}, headers={'X-Forwarded-For': client_ip})
+
+    with app.app_context():
+        db.create_all()
+        for n in range(5):
+            assert via_proxy(f'user{n}', '203.0.113.1').status_code == 200
+        assert via_proxy('user5', '203.0.113.1').status_code == 429
+        assert via_proxy('user5', '203.0.113.2').status_code == 200
+        db.session.remove()
+        db.drop_all()
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    """Two backends on the same file, as in two workers, see the same counts"""
+    path = str(tmp_path / 'throttle.db')
+    first, second = SQLiteBuckets(path), SQLiteBuckets(path)
+    assert first.take('k', 1, 0.001) == 0
+    assert second.take('k', 1, 0.001) > 0
@@ -0,0 +1,126 @@
+"""
+Tests for the dashboard time-series API
+"""
+
+from datetime import date, datetime
+import pytest
+from app import create_app, db
+from app.models import User, Book, Category, Order, OrderItem
+from app.timeseries import bucket_count, buckets, downsample
+
+
+@pytest.fixture
+def app():
+    """Create application instance with orders spread over May 2024"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True,
+                     created_at=datetime(2024, 5, 1, 9))
+        admin.set_password('Admin123!')
+        db.session.add_all([category, admin])
+        db.session.commit()
+
+        books = [Book(title=f'Book {n}', author='Author', price=10, category_id=category.id) for n in (1, 2)]
+        db.session.add_all(books)
+        db.session.commit()
+
+        for n, (moment, book) in enumerate([
+            (datetime(2024, 5, 1, 10), books[0]),
+            (datetime(2024, 5, 1, 15), books[1]),
+            (datetime(2024, 5, 8, 10), books[0]),
+            (datetime(2024, 5, 31, 23), books[0]),
+        ], start=1):
+            order = Order(user_id=admin.id, order_number=f'ORD-{n}', total_amount=10, status='completed',
+                          created_at=moment)
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, book_id=book.id, price=10))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client logged in as admin"""
+    with app.test_client() as client:
+        client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+        yield client
+
+
+def points(client, series, **params):
+    response = client.get(f'/admin/api/metrics/{series}', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()['points']
+
+
+def test_daily_series_is_zero_filled(client):
+    result = points(client, 'revenue', start='2024-05-01', end='2024-05-03')
+    assert result == [['2024-05-01', 20.0], ['2024-05-02', 0.0], ['2024-05-03', 0.0]]
+
+
+def test_week_and_month_granularity(client):
+    weeks = points(client, 'orders', start='2024-05-01', end='2024-05-14', granularity='week')
+    assert weeks == [['2024-04-29', 2.0], ['2024-05-06', 1.0], ['2024-05-13', 0.0]]
+
+    months = points(client, 'orders', start='2024-04-01', end='2024-06-30', granularity='month')
+    assert months == [['2024-04-01', 0.0], ['2024-05-01', 4.0], ['2024-06-01', 0.0]]
+
+
+def test_hourly_book_sales(client, app):
+    book = Book.query.filter_by(title='Book 2').first()
+    result = points(client, 'book-sales', start='2024-05-01', end='2024-05-01', granularity='hour', book_id=book.id)
+    assert len(result) == 24
+    assert dict(result)['2024-05-01T15:00:00'] == 1.0
+    assert sum(value for _, value in result) == 1.0
+
+
+def test_long_ranges_are_downsampled(client):
+    response = client.get('/admin/api/metrics/orders',
+                          query_string={'start': '2024-01-01', 'end': '2024-12-31', 'max_points': 50})
+    data = response.get_json()
+    assert len(data['points']) <= 50
+    assert data['downsample_factor'] == 8
+    assert sum(value for _, value in data['points']) == 4.0
+
+
+def test_responses_are_cacheable(client):
+    response = client.get('/admin/api/metrics/registrations?start=2024-05-01&end=2024-05-31')
+    assert 'max-age=' in response.headers['Cache-Control']
+    again = client.get('/admin/api/metrics/registrations?start=2024-05-01&end=2024-05-31',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_invalid_requests(client):
+    assert client.get('/admin/api/metrics/profit').status_code == 400
+    assert client.get('/admin/api/metrics/orders?granularity=minute').status_code == 400
+    assert client.get('/admin/api/metrics/orders?granularity=hour&start=2024-01-01&end=2024-03-01').status_code == 400
+
+
+def test_huge_ranges_are_refused_before_bucketing(client):
+    """Every granularity is capped by bucket count, so year 1 can't build 740k buckets"""
+    response = client.get('/admin/api/metrics/orders?start=0001-01-01&end=2024-05-01')
+    assert response.status_code == 400
+    assert 'buckets' in response.get_json()['error']
+    assert client.get('/admin/api/metrics/orders?granularity=month&start=1990-01-01').status_code == 200
+
+
+@pytest.mark.parametrize('granularity', ['hour', 'day', 'week', 'month'])
+def test_bucket_count_matches_buckets(granularity):
+    start, end = date(2023, 12, 27), date(2024, 3, 5)
+    assert bucket_count(start, end, granularity) == len(buckets(start, end, granularity))
+
+
+def test_downsample_keeps_totals():
+    series = [(date(2024, 1, day), day) for day in range(1, 11)]
+    merged, factor = downsample(series, 4)
+    assert factor == 3
+    assert [value for _, value in merged] == [6, 15, 24, 10]
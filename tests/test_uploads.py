@@ -0,0 +1,180 @@
+"""
+Tests for chunked, resumable admin uploads
+"""
+
+import hashlib
+import os
+import pytest
+from app import create_app, db
+from app.models import User, Book, Category, FileUpload
+
+
+@pytest.fixture
+def app():
+    """Create application instance with an admin user"""
+    app = create_app('testing')
+    app.config['UPLOAD_CHUNK_SIZE'] = 4
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity', description='Security books')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True)
+        admin.set_password('Admin123!')
+        db.session.add_all([category, admin])
+        db.session.commit()
+
+        yield app
+
+        # Remove any files the uploads wrote under static/
+        for upload in FileUpload.query.all():
+            path = os.path.join(app.root_path, 'static', upload.file_path)
+            if os.path.exists(path):
+                os.remove(path)
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create a test client logged in as admin"""
+    with app.test_client() as client:
+        client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+        yield client
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def start(client, data=b'%PDF-12345', kind='book', filename='big.pdf'):
+    response = client.post('/admin/uploads', json={'kind': kind, 'filename': filename, 'size': len(data)})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def put_chunk(client, upload_id, offset, chunk, checksum=None):
+    return client.put(
+        f'/admin/uploads/{upload_id}?offset={offset}',
+        data=chunk,
+        headers={'X-Chunk-SHA256': checksum or sha256(chunk)}
+    )
+
+
+def test_chunked_upload_writes_final_file(client, app):
+    """Chunks are appended in place and the upload completes"""
+    data = b'%PDF-12345'
+    upload = start(client, data)
+    assert upload['offset'] == 0
+    assert upload['chunk_size'] == 4
+
+    for offset in range(0, len(data), 4):
+        response = put_chunk(client, upload['upload_id'], offset, data[offset:offset + 4])
+        assert response.status_code == 200
+
+    response = client.post(f"/admin/uploads/{upload['upload_id']}/complete")
+    assert response.get_json()['status'] == 'completed'
+
+    record = db.session.get(FileUpload, upload['upload_id'])
+    with open(os.path.join(app.root_path, 'static', record.file_path), 'rb') as f:
+        assert f.read() == data
+
+
+def test_bad_checksum_is_rejected_and_rolled_back(client, app):
+    """A corrupted chunk is discarded so it can be resent"""
+    upload = start(client)
+    response = put_chunk(client, upload['upload_id'], 0, b'%PDF', checksum=sha256(b'nope'))
+    assert response.status_code == 400
+
+    record = db.session.get(FileUpload, upload['upload_id'])
+    assert record.received_size == 0
+    assert os.path.getsize(os.path.join(app.root_path, 'static', record.file_path)) == 0
+
+
+def test_resume_reports_offset_and_rejects_wrong_offset(client):
+    """The status endpoint and 409 responses tell the client where to resume"""
+    data = b'%PDF-12345'
+    upload = start(client, data)
+    put_chunk(client, upload['upload_id'], 0, data[:4])
+
+    status = client.get(f"/admin/uploads/{upload['upload_id']}").get_json()
+    assert status['offset'] == 4
+
+    response = put_chunk(client, upload['upload_id'], 0, data[:4])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 4
+
+    response = client.post(f"/admin/uploads/{upload['upload_id']}/complete")
+    assert response.status_code == 409
+
+
+def test_short_chunk_before_end_rejected(client):
+    """Only the final chunk may be shorter than the chunk size"""
+    upload = start(client)
+    response = put_chunk(client, upload['upload_id'], 0, b'%P')
+    assert response.status_code == 400
+
+
+def test_disallowed_extension_rejected(client):
+    """Only configured file types can be uploaded"""
+    response = client.post('/admin/uploads', json={'kind': 'book', 'filename': 'evil.exe', 'size': 10})
+    assert response.status_code == 400
+
+
+def complete_uploads(client):
+    """Upload a book file and a cover; returns their ids by kind"""
+    ids = {}
+    for kind, filename, data in [('book', 'big.pdf', b'%PDF-1'), ('cover', 'cover.jpg', b'JPEG')]:
+        upload = start(client, data, kind=kind, filename=filename)
+        for offset in range(0, len(data), 4):
+            put_chunk(client, upload['upload_id'], offset, data[offset:offset + 4])
+        client.post(f"/admin/uploads/{upload['upload_id']}/complete")
+        ids[kind] = upload['upload_id']
+    return ids
+
+
+def add_book(client, ids):
+    return client.post('/admin/books/add', data={
+        'title': 'Uploaded Book',
+        'author': 'Author',
+        'description': 'Uploaded in chunks',
+        'price': '10.00',
+        'file_format': 'PDF',
+        'category_id': Category.query.first().id,
+        'book_file_upload_id': ids['book'],
+        'cover_image_upload_id': ids['cover']
+    })
+
+
+def test_add_book_attaches_completed_uploads(client, app):
+    """The book form accepts completed upload ids instead of multipart files"""
+    ids = complete_uploads(client)
+    response = add_book(client, ids)
+    assert response.status_code == 302
+
+    book = Book.query.filter_by(title='Uploaded Book').first()
+    assert book.file_path == db.session.get(FileUpload, ids['book']).file_path
+    assert book.cover_image == db.session.get(FileUpload, ids['cover']).file_path
+    assert db.session.get(FileUpload, ids['book']).status == 'attached'
+
+
+def test_other_admins_cannot_claim_an_upload(client, app):
+    """Upload ids only attach for the admin who uploaded them"""
+    other = User(username='other', email='other@example.com', full_name='Other', is_admin=True)
+    other.set_password('Other123!')
+    db.session.add(other)
+    db.session.flush()
+    ids = {}
+    for kind, path in [('book', 'books/theirs.pdf'), ('cover', 'img/books/theirs.jpg')]:
+        upload = FileUpload(id=f'{kind}-of-other', user_id=other.id, kind=kind, original_filename=path,
+                            file_path=path, total_size=4, received_size=4, status='completed')
+        db.session.add(upload)
+        ids[kind] = upload.id
+    db.session.commit()
+
+    response = add_book(client, ids)
+
+    assert response.status_code == 200
+    assert Book.query.filter_by(title='Uploaded Book').first() is None
+    assert {db.session.get(FileUpload, id).status for id in ids.values()} == {'completed'}
@@ -0,0 +1,100 @@
+"""
+Tests for the admin user directory
+"""
+
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Book, Category, Order, Review
+from app.user_directory import directory_page
+
+
+@pytest.fixture
+def app():
+    """Create application instance with customers of different value"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+        category = Category(name='Cybersecurity')
+        admin = User(username='admin', email='admin@example.com', full_name='Admin', is_admin=True,
+                     created_at=datetime(2024, 1, 1))
+        admin.set_password('Admin123!')
+        db.session.add_all([category, admin])
+        db.session.commit()
+
+        book = Book(title='Reviewed', author='Author', price=10, category_id=category.id)
+        db.session.add(book)
+
+        # user{n} joins on day n and places n completed orders of $10, plus one cancelled order
+        for n in range(1, 6):
+            user = User(username=f'user{n}', email=f'user{n}@example.com', created_at=datetime(2024, 2, n))
+            user.set_password('Secret123!')
+            db.session.add(user)
+            db.session.flush()
+            for k in range(n):
+                db.session.add(Order(user_id=user.id, order_number=f'ORD-{n}-{k}', total_amount=10,
+                                     status='completed', created_at=datetime(2024, 3, n, k)))
+            db.session.add(Order(user_id=user.id, order_number=f'ORD-{n}-x', total_amount=99, status='cancelled',
+                                 created_at=datetime(2024, 3, 1)))
+        db.session.flush()
+        db.session.add(Review(user_id=User.query.filter_by(username='user2').first().id, book_id=book.id, rating=5))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+def usernames(rows):
+    return [row.User.username for row in rows]
+
+
+def test_aggregates(app):
+    rows, _ = directory_page(search='user2')
+    (row,) = rows
+    assert (row.order_count, float(row.spend), row.review_count) == (3, 20.0, 1)
+    assert row.last_order_at == datetime(2024, 3, 2, 1)
+
+
+def test_keyset_pages_by_spend(app):
+    first, cursor = directory_page(sort='spend', per_page=2)
+    assert usernames(first) == ['user5', 'user4']
+
+    second, cursor = directory_page(sort='spend', per_page=2, after=cursor)
+    assert usernames(second) == ['user3', 'user2']
+
+    third, cursor = directory_page(sort='spend', per_page=2, after=cursor)
+    assert usernames(third) == ['user1', 'admin']
+    assert cursor is None
+
+
+def test_joined_sort_pages(app):
+    first, cursor = directory_page(per_page=3)
+    assert usernames(first) == ['user5', 'user4', 'user3']
+    second, _ = directory_page(per_page=3, after=cursor)
+    assert usernames(second) == ['user2', 'user1', 'admin']
+
+
+def test_page_is_one_query(app):
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        directory_page(sort='orders')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(statements) == 1
+
+
+def test_users_view(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'Admin123!'})
+
+    response = client.get('/admin/users?sort=spend&q=user')
+    assert response.status_code == 200
+    assert b'$50.00' in response.data
+    assert client.get('/admin/users?sort=spend&after=garbage').status_code == 302